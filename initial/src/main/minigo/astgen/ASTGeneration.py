@@ -42,7 +42,7 @@ class ASTGeneration(MiniGoVisitor):
         if op == ':=':
             return Assign(lhs, rhs)
         else:
-            return Assign(lhs, BinaryOp(op[0], lhs, rhs))
+            return CompoundAssign(lhs, op[0], rhs)
         
     def visitLhs(self,ctx:MiniGoParser.LhsContext):
         if ctx.IDENTIFIER():
@@ -95,7 +95,7 @@ class ASTGeneration(MiniGoVisitor):
         if op == ':=':
             return Assign(lhs, rhs)
         else:
-            return Assign(lhs, BinaryOp(op[0], lhs, rhs))
+            return CompoundAssign(lhs, op[0], rhs)
 
     # For Loop with Range
     def visitFor_loop_range(self,ctx:MiniGoParser.For_loop_rangeContext):
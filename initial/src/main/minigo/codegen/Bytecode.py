@@ -0,0 +1,663 @@
+'''
+*   Instruction-level view of a generated Jasmin method body.
+*   The text buffered by Emitter for one method is split into labels, directives
+*   and instructions so that analyses can run over the final code of the method.
+'''
+from CodeGenError import *
+import re
+
+
+class Instruction():
+    def __init__(self, text):
+        #text: String (one source line, or several for tableswitch/lookupswitch)
+        self.text = text
+        words = text.split()
+        self.isLabel = len(words) == 1 and words[0].endswith(":")
+        self.isDirective = bool(words) and (words[0].startswith(".") or words[0].startswith(";"))
+        self.label = words[0][:-1] if self.isLabel else None
+        self.opcode = None if self.isLabel or self.isDirective or not words else words[0]
+        self.operands = words[1:] if self.opcode else []
+
+    def isInstruction(self):
+        return self.opcode is not None
+
+    '''
+    *   return the labels this instruction may jump to.
+    '''
+    def getTargets(self):
+        if self.opcode in MethodCode.SWITCHES:
+            return [w for w in self.operands if w.startswith("Label")]
+        if self.opcode in MethodCode.BRANCHES or self.opcode == "goto":
+            return [self.operands[0]]
+        return []
+
+    '''
+    *   check whether control never falls through to the next instruction.
+    '''
+    def isUnconditional(self):
+        return self.opcode in MethodCode.RETURNS or self.opcode in MethodCode.SWITCHES or self.opcode in ["goto", "athrow"]
+
+    '''
+    *   return a copy of this instruction jumping to new instead of old.
+    '''
+    def retarget(self, old, new):
+        #old: String
+        #new: String
+        return Instruction(re.sub(r"\b" + old + r"\b", new, self.text))
+
+    def __str__(self):
+        return self.text
+
+
+class MethodCode():
+    BRANCHES = ["ifeq", "ifne", "iflt", "ifle", "ifgt", "ifge", "ifnull", "ifnonnull",
+                "if_icmpeq", "if_icmpne", "if_icmplt", "if_icmple", "if_icmpgt", "if_icmpge",
+                "if_acmpeq", "if_acmpne"]
+    SWITCHES = ["tableswitch", "lookupswitch"]
+    RETURNS = ["return", "ireturn", "freturn", "areturn"]
+    # opcodes without side effects that cannot throw; idiv and irem throw on zero
+    PURE = ["aconst_null", "bipush", "sipush", "ldc", "ldc_w", "dup", "getstatic",
+            "iadd", "isub", "imul", "fadd", "fsub", "fmul", "fdiv", "frem", "ineg", "fneg",
+            "ishl", "ishr", "iushr", "iand", "ior", "ixor", "i2f", "f2i", "i2c", "fcmpl", "fcmpg"]
+
+    # (pops, pushes) of every opcode whose effect does not depend on its operands
+    FIXED_EFFECTS = {
+        "nop": (0, 0), "aconst_null": (0, 1),
+        "iconst_m1": (0, 1), "iconst_0": (0, 1), "iconst_1": (0, 1), "iconst_2": (0, 1),
+        "iconst_3": (0, 1), "iconst_4": (0, 1), "iconst_5": (0, 1),
+        "fconst_0": (0, 1), "fconst_1": (0, 1), "fconst_2": (0, 1),
+        "bipush": (0, 1), "sipush": (0, 1), "ldc": (0, 1), "ldc_w": (0, 1),
+        "iload": (0, 1), "fload": (0, 1), "aload": (0, 1),
+        "istore": (1, 0), "fstore": (1, 0), "astore": (1, 0),
+        "iaload": (2, 1), "faload": (2, 1), "baload": (2, 1), "aaload": (2, 1),
+        "iastore": (3, 0), "fastore": (3, 0), "bastore": (3, 0), "aastore": (3, 0),
+        "pop": (1, 0), "pop2": (2, 0), "dup": (1, 2), "dup_x1": (2, 3), "dup_x2": (3, 4),
+        "dup2": (2, 4), "dup2_x1": (3, 5), "dup2_x2": (4, 6), "swap": (2, 2),
+        "iadd": (2, 1), "fadd": (2, 1), "isub": (2, 1), "fsub": (2, 1),
+        "imul": (2, 1), "fmul": (2, 1), "idiv": (2, 1), "fdiv": (2, 1),
+        "irem": (2, 1), "frem": (2, 1), "ineg": (1, 1), "fneg": (1, 1),
+        "ishl": (2, 1), "ishr": (2, 1), "iushr": (2, 1), "iand": (2, 1), "ior": (2, 1), "ixor": (2, 1),
+        "iinc": (0, 0), "i2f": (1, 1), "f2i": (1, 1), "i2c": (1, 1), "fcmpl": (2, 1), "fcmpg": (2, 1),
+        "goto": (0, 0), "return": (0, 0), "ireturn": (1, 0), "freturn": (1, 0), "areturn": (1, 0),
+        "athrow": (1, 0), "tableswitch": (1, 0), "lookupswitch": (1, 0),
+        "new": (0, 1), "newarray": (1, 1), "anewarray": (1, 1), "arraylength": (1, 1),
+        "checkcast": (1, 1), "instanceof": (1, 1),
+    }
+
+    # bytes taken by the operands of an opcode; the others have none. ldc is counted as ldc_w
+    OPERAND_BYTES = {
+        "bipush": 1, "newarray": 1, "sipush": 2, "ldc": 2, "ldc_w": 2, "iinc": 2,
+        "goto": 2, "new": 2, "anewarray": 2, "checkcast": 2, "instanceof": 2,
+        "getstatic": 2, "putstatic": 2, "getfield": 2, "putfield": 2,
+        "invokestatic": 2, "invokevirtual": 2, "invokespecial": 2, "invokeinterface": 4,
+        "multianewarray": 3,
+    }
+
+    def __init__(self, text):
+        #text: String (the buffered body of one method)
+        self.instructions = MethodCode.parse(text)
+
+    '''
+    *   split method text into instructions. The case lines of a switch up to and
+    *   including its default line belong to the switch instruction.
+    '''
+    @staticmethod
+    def parse(text):
+        result = list()
+        pending = None
+        for line in text.split("\n"):
+            if not line.strip():
+                continue
+            if pending is not None:
+                pending.append(line)
+                if line.strip().startswith("default"):
+                    result.append(Instruction("\n".join(pending)))
+                    pending = None
+                continue
+            words = line.split()
+            if words[0] in MethodCode.SWITCHES:
+                pending = [line]
+            else:
+                result.append(Instruction(line))
+        return result
+
+    '''
+    *   return (kind, slot, is store) of an instruction loading or storing a local,
+    *   e.g. ("i", 3, True) for istore_3, otherwise None.
+    '''
+    @staticmethod
+    def localAccess(ins):
+        #ins: Instruction
+        match = re.fullmatch(r"([ifa])(load|store)(?:_([0-3]))?", ins.opcode or "")
+        if match is None:
+            return None
+        slot = int(match.group(3)) if match.group(3) else int(ins.operands[0])
+        return match.group(1), slot, match.group(2) == "store"
+
+    @staticmethod
+    def localInstruction(kind, action, slot):
+        #kind: String ("i", "f" or "a")
+        #action: String ("load" or "store")
+        #slot: Int
+        return Instruction(f"\t{kind}{action}_{slot}" if slot <= 3 else f"\t{kind}{action} {slot}")
+
+    '''
+    *   check whether an instruction only computes its result from its operands,
+    *   without side effects and without being able to throw.
+    '''
+    @staticmethod
+    def isPure(ins):
+        #ins: Instruction
+        access = MethodCode.localAccess(ins)
+        return (access is not None and not access[2]) or ins.opcode.split("_")[0] in ["iconst", "fconst"] or ins.opcode in MethodCode.PURE
+
+    @staticmethod
+    def countSlots(descriptor):
+        #descriptor: String (a sequence of JVM field descriptors, e.g. "I[ILFoo;")
+        slots = 0
+        i = 0
+        while i < len(descriptor):
+            is_array = False
+            while descriptor[i] == "[":
+                is_array = True
+                i = i + 1
+            if descriptor[i] == "L":
+                i = descriptor.index(";", i)
+            slots = slots + (2 if descriptor[i] in "JD" and not is_array else 1)
+            i = i + 1
+        return slots
+
+    '''
+    *   return (pops, pushes) of one instruction on the operand stack.
+    '''
+    @staticmethod
+    def stackEffect(ins):
+        #ins: Instruction
+        op = ins.opcode
+        if op.split("_")[0] in ["iload", "fload", "aload", "istore", "fstore", "astore"]:
+            op = op.split("_")[0]
+
+        if op in MethodCode.BRANCHES:
+            return (2, 0) if op.startswith("if_") else (1, 0)
+        elif op.startswith("invoke"):
+            signature = ins.operands[0]
+            params = signature[signature.index("(") + 1:signature.index(")")]
+            ret = signature[signature.index(")") + 1:]
+            pops = MethodCode.countSlots(params) + (0 if op == "invokestatic" else 1)
+            return (pops, 0 if ret == "V" else MethodCode.countSlots(ret))
+        elif op == "multianewarray":
+            return (int(ins.operands[1]), 1)
+        elif op == "getstatic":
+            return (0, MethodCode.countSlots(ins.operands[1]))
+        elif op == "putstatic":
+            return (MethodCode.countSlots(ins.operands[1]), 0)
+        elif op == "getfield":
+            return (1, MethodCode.countSlots(ins.operands[1]))
+        elif op == "putfield":
+            return (1 + MethodCode.countSlots(ins.operands[1]), 0)
+        elif op in MethodCode.FIXED_EFFECTS:
+            return MethodCode.FIXED_EFFECTS[op]
+        else:
+            raise IllegalOperandException(f"Unknown stack effect of {ins.opcode}")
+
+    '''
+    *   compute the maximum operand stack depth by abstract interpretation of the
+    *   instructions, following every branch target from the method entry.
+    *   @return (max depth, list of inconsistencies found at join points)
+    '''
+    def computeMaxStack(self):
+        instructions = self.instructions
+        label_index = {ins.label: i for i, ins in enumerate(instructions) if ins.isLabel}
+        depth_at = [None] * len(instructions)
+        problems = list()
+        max_depth = 0
+        worklist = [(0, 0)]
+
+        while worklist:
+            i, depth = worklist.pop()
+            while i < len(instructions):
+                if depth_at[i] is not None:
+                    if depth_at[i] != depth:
+                        problems.append(f"stack depth {depth} and {depth_at[i]} meet at '{instructions[i].text.strip()}'")
+                    break
+                depth_at[i] = depth
+                ins = instructions[i]
+                if ins.isInstruction():
+                    pops, pushes = MethodCode.stackEffect(ins)
+                    if depth < pops:
+                        problems.append(f"stack underflow at '{ins.text.strip()}'")
+                    depth = depth - pops + pushes
+                    max_depth = max(max_depth, depth)
+                    for target in ins.getTargets():
+                        worklist.append((label_index[target], depth))
+                    if ins.isUnconditional():
+                        break
+                i = i + 1
+
+        return max_depth, problems
+
+    '''
+    *   return the size in bytes of the code of the method, assuming the longest
+    *   padding before a switch.
+    '''
+    def codeLength(self):
+        length = 0
+        for ins in self.instructions:
+            if not ins.isInstruction():
+                continue
+            access = MethodCode.localAccess(ins)
+            if access is not None and "_" not in ins.opcode:
+                # iload 4 takes one operand byte, wide iload 300 four bytes in all
+                length = length + (2 if access[1] <= 255 else 4)
+            elif ins.opcode == "iinc" and int(ins.operands[0]) > 255:
+                length = length + 6
+            elif ins.opcode in MethodCode.SWITCHES:
+                cases = len(ins.text.split("\n")) - 2
+                length = length + 4 + (12 + 4 * cases if ins.opcode == "tableswitch" else 8 + 8 * cases)
+            elif ins.opcode in MethodCode.BRANCHES:
+                length = length + 3
+            else:
+                length = length + 1 + MethodCode.OPERAND_BYTES.get(ins.opcode, 0)
+        return length
+
+    def __str__(self):
+        return "".join(ins.text + "\n" for ins in self.instructions)
+
+
+class BasicBlock():
+    def __init__(self, items):
+        #items: List[Instruction] (the labels, directives and instructions of the block in order)
+        self.items = items
+        self.next = None # block following this one in the original code
+        self.reachable = False
+
+    def labels(self):
+        return [ins.label for ins in self.items if ins.isLabel]
+
+    def instructions(self):
+        return [ins for ins in self.items if ins.isInstruction()]
+
+    def last(self):
+        instructions = self.instructions()
+        return instructions[-1] if instructions else None
+
+    '''
+    *   check whether control may run off the end of the block into the next one.
+    '''
+    def fallsThrough(self):
+        return self.last() is None or not self.last().isUnconditional()
+
+    '''
+    *   replace the last instruction; None removes it.
+    '''
+    def replaceLast(self, ins):
+        #ins: Instruction
+        position = self.items.index(self.last())
+        self.items[position:position + 1] = [] if ins is None else [ins]
+
+
+class ControlFlowGraph():
+    NEGATED_BRANCHES = {"ifeq": "ifne", "ifne": "ifeq", "iflt": "ifge", "ifge": "iflt", "ifgt": "ifle", "ifle": "ifgt",
+                        "ifnull": "ifnonnull", "ifnonnull": "ifnull",
+                        "if_icmpeq": "if_icmpne", "if_icmpne": "if_icmpeq", "if_icmplt": "if_icmpge", "if_icmpge": "if_icmplt",
+                        "if_icmpgt": "if_icmple", "if_icmple": "if_icmpgt", "if_acmpeq": "if_acmpne", "if_acmpne": "if_acmpeq"}
+    # longest loop test, in instructions, copied to the bottom of its loop
+    ROTATE_LIMIT = 8
+
+    def __init__(self, instructions):
+        #instructions: List[Instruction] (the instructions of one method, header first)
+        self.blocks = ControlFlowGraph.split(instructions)
+        self.labelBlock = {label: block for block in self.blocks for label in block.labels()}
+        self.deadBlocks = list()
+
+    '''
+    *   split instructions into basic blocks. A block starts at a label that follows
+    *   an instruction and ends after a branch, a switch, a return or a goto; labels
+    *   and directives stay with the instructions that follow them.
+    '''
+    @staticmethod
+    def split(instructions):
+        blocks = list()
+        current = list()
+        for ins in instructions:
+            if ins.isLabel and any(item.isInstruction() for item in current):
+                blocks.append(BasicBlock(current))
+                current = list()
+            current.append(ins)
+            if ins.isInstruction() and (ins.getTargets() or ins.isUnconditional()):
+                blocks.append(BasicBlock(current))
+                current = list()
+        if current:
+            blocks.append(BasicBlock(current))
+        for block, following in zip(blocks, blocks[1:]):
+            block.next = following
+        return blocks
+
+    '''
+    *   return a label numbered after every label of the method.
+    '''
+    def newLabel(self):
+        number = 1 + max(int(label[len("Label"):]) for label in self.labelBlock if label[len("Label"):].isdigit())
+        label = Instruction(f"Label{number}:")
+        self.labelBlock[label.label] = None
+        return label
+
+    def successors(self, block):
+        result = [self.labelBlock[target] for target in block.last().getTargets()] if block.last() else []
+        if block.fallsThrough() and block.next is not None:
+            result.append(block.next)
+        return result
+
+    '''
+    *   drop the blocks not reachable from the method entry. They are kept in
+    *   deadBlocks, and the next block of a remaining one becomes the following
+    *   remaining block; a block falling through is never followed by a dead one.
+    '''
+    def removeUnreachable(self):
+        worklist = [self.blocks[0]]
+        while worklist:
+            block = worklist.pop()
+            if not block.reachable:
+                block.reachable = True
+                worklist.extend(self.successors(block))
+        self.deadBlocks = [block for block in self.blocks if not block.reachable]
+        self.blocks = [block for block in self.blocks if block.reachable]
+        for block, following in zip(self.blocks, self.blocks[1:] + [None]):
+            block.next = following
+
+    '''
+    *   return the label a jump to label finally arrives at, skipping blocks that
+    *   only hold a goto and empty blocks that fall through to a labelled one.
+    '''
+    def resolve(self, label):
+        #label: String
+        seen = set()
+        block = self.labelBlock[label]
+        while block not in seen:
+            seen.add(block)
+            instructions = block.instructions()
+            if not instructions and block.next is not None and block.next.labels():
+                label = block.next.labels()[0]
+            elif instructions and instructions[0].opcode == "goto":
+                label = instructions[0].operands[0]
+            else:
+                break
+            block = self.labelBlock[label]
+        return label
+
+    '''
+    *   jump threading: every branch, goto and switch case goes straight to where
+    *   the chain of gotos starting at its target ends.
+    '''
+    def threadJumps(self):
+        for block in self.blocks:
+            last = block.last()
+            if last is None:
+                continue
+            for target in set(last.getTargets()):
+                final = self.resolve(target)
+                if final != target:
+                    last = last.retarget(target, final)
+            block.replaceLast(last)
+
+    def hasFallThroughPredecessor(self, target):
+        return any(block.next is target and block.fallsThrough() for block in self.blocks)
+
+    '''
+    *   check whether block is a lone goto that the conditional branch before it jumps
+    *   over; negating that branch removes the goto altogether.
+    '''
+    def isBranchOver(self, block):
+        if len(block.instructions()) != 1 or block.next is None:
+            return False
+        return any(other.next is block and other.last() is not None and other.last().opcode in ControlFlowGraph.NEGATED_BRANCHES
+                   and other.last().operands[0] in block.next.labels() for other in self.blocks)
+
+    '''
+    *   lay the blocks out so that a goto is followed by its target when
+    *   nothing else falls into that target. A block that falls through is always
+    *   followed by the block it fell into in the original code.
+    '''
+    def layout(self):
+        order = list()
+        placed = set()
+        for start in self.blocks:
+            block = start
+            while block is not None and block not in placed:
+                order.append(block)
+                placed.add(block)
+                last = block.last()
+                if block.fallsThrough():
+                    block = block.next
+                elif last.opcode == "goto":
+                    target = self.labelBlock[last.operands[0]]
+                    block = None if self.hasFallThroughPredecessor(target) or self.isBranchOver(block) else target
+                else:
+                    block = None
+        return order
+
+    '''
+    *   remove gotos to the next block and turn a branch over a goto into the
+    *   negated branch to the goto target.
+    '''
+    def removeFallThroughJumps(self, order):
+        for position, block in enumerate(order[:-1]):
+            following = order[position + 1]
+            last = block.last()
+            if last is not None and last.opcode == "goto" and last.operands[0] in following.labels():
+                block.replaceLast(None)
+            elif last is not None and last.opcode in ControlFlowGraph.NEGATED_BRANCHES and position + 2 < len(order):
+                jump = following.instructions()
+                if len(jump) == 1 and jump[0].opcode == "goto" and last.operands[0] in order[position + 2].labels():
+                    block.replaceLast(Instruction(f"\t{ControlFlowGraph.NEGATED_BRANCHES[last.opcode]} {jump[0].operands[0]}"))
+                    following.replaceLast(None)
+
+    '''
+    *   loop rotation: a goto back to a short loop test that is followed by the loop
+    *   exit is replaced by a copy of the test with its branch negated, so each
+    *   iteration takes one conditional branch instead of a goto and a branch.
+    '''
+    def rotateLoops(self, order):
+        for position, block in enumerate(order[:-1]):
+            last = block.last()
+            if last is None or last.opcode != "goto":
+                continue
+            test = self.labelBlock[last.operands[0]]
+            body = test.instructions()
+            branch = body[-1] if body else None
+            if (branch is None or branch.opcode not in ControlFlowGraph.NEGATED_BRANCHES or len(body) > ControlFlowGraph.ROTATE_LIMIT
+                    or test.next is None or branch.operands[0] not in order[position + 1].labels()):
+                continue
+            if not test.next.labels():
+                test.next.items.insert(0, self.newLabel())
+            copy = [Instruction(ins.text) for ins in body[:-1]]
+            copy.append(Instruction(f"\t{ControlFlowGraph.NEGATED_BRANCHES[branch.opcode]} {test.next.labels()[0]}"))
+            block.replaceLast(None)
+            block.items.extend(copy)
+
+    '''
+    *   keep the .var directives valid once blocks have moved or disappeared: a range
+    *   starting where no code follows is dropped, a reversed range is widened to the
+    *   whole method, and widened ranges keep one entry per slot and name.
+    '''
+    @staticmethod
+    def fixVariableRanges(items):
+        position = dict()
+        count = 0
+        for ins in items:
+            if ins.isLabel:
+                position[ins.label] = count
+            elif ins.isInstruction():
+                count = count + 1
+        first = min(position, key=lambda label: position[label])
+        last = max(position, key=lambda label: position[label])
+
+        result = list()
+        widened = set()
+        for ins in items:
+            words = ins.text.split()
+            if ins.isDirective and words[0] == ".var":
+                start, end = words[-3], words[-1]
+                if position[start] >= count:
+                    continue
+                if position[start] > position[end]:
+                    if (words[1], words[3]) in widened:
+                        continue
+                    widened.add((words[1], words[3]))
+                    ins = Instruction(" ".join(words[:-3] + [first, "to", last]))
+            result.append(ins)
+        return result
+
+    def predecessors(self):
+        result = {block: list() for block in self.blocks}
+        for block in self.blocks:
+            for successor in self.successors(block):
+                result[successor].append(block)
+        return result
+
+    '''
+    *   copy propagation: after x := y compiled to a load of y and a store to x, later
+    *   loads of x read y instead while both keep their values on every path there.
+    *   Copies available at a block entry are the ones available at the end of all
+    *   its predecessors.
+    '''
+    def propagateCopies(self):
+        def transfer(block, available, rewrite):
+            available = set(available)
+            previous = None
+            for position, ins in enumerate(block.items):
+                if not ins.isInstruction():
+                    continue
+                access = MethodCode.localAccess(ins)
+                if access and not access[2] and rewrite:
+                    source = [src for kind, dst, src in available if kind == access[0] and dst == access[1]]
+                    if source:
+                        ins = MethodCode.localInstruction(access[0], "load", source[0])
+                        block.items[position] = ins
+                        access = MethodCode.localAccess(ins)
+                if access and access[2] or ins.opcode == "iinc":
+                    slot = access[1] if access else int(ins.operands[0])
+                    available = {copy for copy in available if slot not in copy[1:]}
+                    loaded = MethodCode.localAccess(previous) if previous else None
+                    if access and loaded and not loaded[2] and loaded[0] == access[0] and loaded[1] != slot:
+                        available.add((access[0], slot, loaded[1]))
+                previous = ins
+            return available
+
+        predecessors = self.predecessors()
+        everything = set()
+        for block in self.blocks:
+            everything |= transfer(block, set(), False)
+        available_out = {block: set(everything) for block in self.blocks}
+        available_in = {block: set() for block in self.blocks}
+        changed = True
+        while changed:
+            changed = False
+            for block in self.blocks:
+                incoming = [available_out[predecessor] for predecessor in predecessors[block]]
+                available_in[block] = set.intersection(*incoming) if incoming and block is not self.blocks[0] else set()
+                out = transfer(block, available_in[block], False)
+                if out != available_out[block]:
+                    available_out[block] = out
+                    changed = True
+        for block in self.blocks:
+            transfer(block, available_in[block], True)
+
+    '''
+    *   return the local slots live at the end of every block.
+    '''
+    def liveness(self):
+        def transfer(block, live):
+            live = set(live)
+            for ins in reversed(block.instructions()):
+                access = MethodCode.localAccess(ins)
+                if access and access[2]:
+                    live.discard(access[1])
+                elif access or ins.opcode == "iinc":
+                    live.add(access[1] if access else int(ins.operands[0]))
+            return live
+
+        live_out = {block: set() for block in self.blocks}
+        changed = True
+        while changed:
+            changed = False
+            for block in reversed(self.blocks):
+                out = set()
+                for successor in self.successors(block):
+                    out |= transfer(successor, live_out[successor])
+                if out != live_out[block]:
+                    live_out[block] = out
+                    changed = True
+        return live_out
+
+    '''
+    *   dead store elimination: a store to a local that is not read again before
+    *   being overwritten becomes a pop, an iinc of such a local is dropped, and a
+    *   pop of a value computed without side effects removes that computation.
+    *   Repeated until nothing changes, since dropped loads can kill more stores.
+    '''
+    def removeDeadStores(self):
+        changed = True
+        while changed:
+            changed = False
+            live_out = self.liveness()
+            for block in self.blocks:
+                live = set(live_out[block])
+                for position in range(len(block.items) - 1, -1, -1):
+                    ins = block.items[position]
+                    if not ins.isInstruction():
+                        continue
+                    access = MethodCode.localAccess(ins)
+                    slot = access[1] if access else int(ins.operands[0]) if ins.opcode == "iinc" else None
+                    if slot is None:
+                        continue
+                    if (access is None or access[2]) and slot not in live:
+                        block.items[position:position + 1] = [] if ins.opcode == "iinc" else [Instruction("\tpop")]
+                        changed = True
+                    elif access and access[2]:
+                        live.discard(slot)
+                    else:
+                        live.add(slot)
+                changed = ControlFlowGraph.removePoppedValues(block) or changed
+
+    '''
+    *   remove a side-effect-free instruction whose result is popped right away,
+    *   popping its operands instead.
+    '''
+    @staticmethod
+    def removePoppedValues(block):
+        changed = False
+        position = 0
+        while position < len(block.items):
+            ins = block.items[position]
+            following = next((item for item in block.items[position + 1:] if item.isInstruction() or item.isLabel), None)
+            if ins.isInstruction() and following is not None and following.opcode == "pop" and MethodCode.isPure(ins):
+                pops, pushes = MethodCode.stackEffect(ins)
+                end = block.items.index(following, position)
+                replacement = [] if ins.opcode == "dup" else [Instruction("\tpop") for _ in range(pops)] if pushes == 1 else None
+                if replacement is not None:
+                    block.items[position:end + 1] = block.items[position + 1:end] + replacement
+                    changed = True
+                    position = max(position - 1, 0)
+                    continue
+            position = position + 1
+        return changed
+
+    '''
+    *   run jump threading, unreachable block removal, copy propagation, dead store
+    *   elimination, block layout and loop rotation.
+    *   @return the instructions of the method in their new order
+    '''
+    def optimize(self):
+        self.threadJumps()
+        self.removeUnreachable()
+        self.propagateCopies()
+        self.removeDeadStores()
+        order = self.layout()
+        self.removeFallThroughJumps(order)
+        self.rotateLoops(order)
+
+        items = [ins for block in order for ins in block.items]
+        # Labels and directives of unreachable blocks are kept for the .var ranges naming them
+        items += [ins for block in self.deadBlocks for ins in block.items if not ins.isInstruction()]
+        return ControlFlowGraph.fixVariableRanges(items)
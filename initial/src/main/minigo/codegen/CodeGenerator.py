@@ -6,6 +6,8 @@ from Frame import Frame
 from abc import ABC, abstractmethod
 from functools import reduce
 import operator
+import struct
+import math
 
 
 ops = {
@@ -38,6 +40,21 @@ ops = {
 }
 
 
+# Relational operator whose result is the logical negation of the key
+negated_relops = {
+    '==': '!=',
+    '!=': '==',
+    '<': '>=',
+    '<=': '>',
+    '>': '<=',
+    '>=': '<',
+}
+
+
+# Most bytes of code the JVM accepts in one method
+MAX_CODE_LENGTH = 65535
+
+
 class MType:
     def __init__(self, partype, rettype):
         self.partype = partype
@@ -52,7 +69,9 @@ class Symbol:
         self.name = name
         self.mtype = mtype
         self.value = value # Location (Index/CName) or None
-        self.const_value = None
+        self.const_value = const_value # Folded value of a constant whose uses are pushed as literals
+        self.builder = None # Index of the StringBuilder holding the value while promoted in a loop
+        self.fields = None # Field name -> (local index, type) of a struct value kept in locals instead of the heap
 
     def __str__(self):
         return "Symbol(" + str(self.name) + "," + str(self.mtype) + ("" if self.value is None else "," + str(self.value)) + ("" if self.const_value is None else "," + str(self.const_value)) + ")"
@@ -80,14 +99,39 @@ class ClassType(Type):
         #value: Id
         self.name = name
 
+    def accept(self, v, param):
+        return None
+
 
 class CodeGenerator(BaseVisitor,Utils):
 
-    def __init__(self):
+    def __init__(self, inlineThreshold=40, inlineDepth=2, packThreshold=16, unrollBudget=96, switchThreshold=3, splitThreshold=4000, classThreshold=8000, lazyThreshold=None):
         self.className = "MiniGoClass"
         self.astTree = None
         self.path = None
         self.emit = None
+        self.reducedIndices = [] # (expression, local index, increment) of strength-reduced loop indices in scope
+        self.hoisted = [] # (expression, local index, type) of loop invariants hoisted by the enclosing loops
+        self.inlineThreshold = inlineThreshold # largest function body, in AST nodes, inlined at its call sites
+        self.inlineDepth = inlineDepth # how many inlined bodies may nest inside each other
+        self.inlining = [] # names of the functions whose bodies are being inlined, innermost last
+        self.inlineExits = [] # (exit label, return type) of the inlined bodies being generated
+        self.packThreshold = packThreshold # shortest constant array literal decoded from packed string constants
+        self.unrollBudget = unrollBudget # most AST nodes, summed over the copies of a loop body, an unrolled loop may generate
+        self.switchThreshold = switchThreshold # fewest cases of an if-else-if chain over int constants compiled to a switch
+        self.splitThreshold = splitThreshold # most AST nodes of a function body or of the global initializers kept in one method
+        self.outlined = [] # synthetic functions holding statements outlined from an oversized body, not generated yet
+        self.classThreshold = classThreshold # most AST nodes of functions and globals placed in one class
+        self.classNames = [self.className] # classes holding the functions and globals of the program, MiniGoClass first
+        self.lazyThreshold = lazyThreshold # fewest array elements a global initializer allocates to be deferred to a holder class, None keeps every global eager
+        self.implementors = {} # interface name -> structs implementing it, from the whole program
+        self.devirtualized = [] # (call, description) of the interface calls bound to their only implementor
+        self.tailCall = None # (declaration, start label, parameter symbols) of the function or method being generated
+        self.scalarStructs = [] # declarations of struct values that never escape their function, kept in locals
+        self.valueNumbers = [] # [first occurrence, later occurrences, local index, type] of loads repeated in the current straight-line run
+        self.reusedLoads = {} # function name -> loads replaced by a read of an earlier value
+        self.globalTouches = {} # id of a function or method declaration -> globals it or anything it calls may read or write
+        self.promotedGlobals = [] # (global symbol, local symbol) of the globals written by the loops keeping them in locals
 
 
     def init(self):
@@ -118,43 +162,141 @@ class CodeGenerator(BaseVisitor,Utils):
 
 
     def cal_const(self, ast, env):
+        """Folds a constant expression into its int, float, bool or str value, or returns None when it is not one.
+        Ints wrap at 32 bits and divide toward zero, floats round to single precision, as on the JVM."""
         if isinstance(ast, BinaryOp):
-            left_val = self.cal_const(ast.left, param)
-            right_val = self.cal_const(ast.right, param)
+            left_val = self.cal_const(ast.left, env)
+            right_val = self.cal_const(ast.right, env)
             op = ast.op
-            if op == '/' and isinstance(ast.left, IntLiteral) and isinstance(ast.right, IntLiteral):
-                return left_val // right_val
-            return ops[op](left_val, right_val)
-        
+            if left_val is None or right_val is None:
+                return None
+            if isinstance(left_val, (bool, str)) or isinstance(right_val, (bool, str)):
+                if type(left_val) is not type(right_val):
+                    return None
+                if isinstance(left_val, bool):
+                    return ops[op](left_val, right_val) if op in ['&&', '||', '==', '!='] else None
+                return ops[op](left_val, right_val) if op in ['+', '==', '!=', '<', '<=', '>', '>='] else None
+            if op in ['&&', '||']:
+                return None
+            if isinstance(left_val, float) or isinstance(right_val, float):
+                if op in ['/', '%'] and right_val == 0:
+                    return None
+                result = math.fmod(left_val, right_val) if op == '%' else ops[op](left_val, right_val)
+                return result if isinstance(result, bool) else self.roundFloat(result)
+            if op in ['/', '%']:
+                if right_val == 0:
+                    return None
+                quotient = abs(left_val) // abs(right_val) * (1 if (left_val < 0) == (right_val < 0) else -1)
+                return self.wrapInt(quotient if op == '/' else left_val - right_val * quotient)
+            result = ops[op](left_val, right_val)
+            return result if isinstance(result, bool) else self.wrapInt(result)
+
         elif isinstance(ast, UnaryOp):
-            operand_val = self.cal_const(ast.body, param)
+            operand_val = self.cal_const(ast.body, env)
             op = ast.op
-            if op == '-':
-                return ops['-u'](operand_val)
-            elif op == '!':
+            if op == '!' and isinstance(operand_val, bool):
                 return ops['!'](operand_val)
-        
-        elif isinstance(ast, (IntLiteral, FloatLiteral, StringLiteral, BooleanLiteral)):
-            return ast.value
-        
-        elif isinstance(ast, NilLiteral):
+            elif op == '-' and isinstance(operand_val, float):
+                return ops['-u'](operand_val)
+            elif op == '-' and isinstance(operand_val, int) and not isinstance(operand_val, bool):
+                return self.wrapInt(ops['-u'](operand_val))
             return None
-        
+
+        elif isinstance(ast, IntLiteral):
+            return self.wrapInt(int(ast.value, 0) if isinstance(ast.value, str) else ast.value)
+        elif isinstance(ast, FloatLiteral):
+            return self.roundFloat(float(ast.value))
+        elif isinstance(ast, BooleanLiteral):
+            return ast.value in [True, "true"]
+        elif isinstance(ast, StringLiteral):
+            return self.stringLiteralValue(ast)
+
         elif isinstance(ast, Id):
             res = self.lookup(ast.name, [j for i in env['env'] for j in i], lambda x: x.name)
-            return res.const_value
-        
-        elif isinstance(ast, (ArrayLiteral, StructLiteral)):
-            return ast
-       
-               
-    def generateStaticInitializer(self, items_to_init, global_symbols_list, emitter):
-        """Generates the <clinit> static initializer method."""
-        frame = Frame("<clinit>", VoidType())  
-        emitter.printout(emitter.emitMETHOD("<clinit>", MType([], VoidType()), True, frame))
+            return res.const_value if res else None
+        return None
+
+
+    def wrapInt(self, value):
+        """Wraps an integer to the 32-bit range, as JVM int arithmetic does."""
+        return (value + 2**31) % 2**32 - 2**31
+
+
+    def roundFloat(self, value):
+        """Rounds a number to single precision, or returns None when it has no finite float value."""
+        if not math.isfinite(value) or abs(value) >= 2**128:
+            return None
+        return struct.unpack('>f', struct.pack('>f', value))[0]
+
+
+    def constantText(self, value):
+        """Returns the Jasmin text of a folded constant."""
+        if isinstance(value, bool):
+            return "1" if value else "0"
+        elif isinstance(value, str):
+            return '"' + self.jasminStringText(value) + '"'
+        elif isinstance(value, float):
+            return self.floatText(value)
+        return str(value)
+
+
+    def floatText(self, value):
+        """Returns the shortest text of a float that Jasmin reads back as the same single-precision value."""
+        for digits in range(1, 18):
+            text = f"{value:.{digits}g}"
+            if self.roundFloat(float(text)) == value:
+                break
+        mantissa, _, exponent = text.partition('e')
+        if '.' not in mantissa:
+            mantissa = mantissa + ".0"
+        return mantissa + ("E" + str(int(exponent)) if exponent else "")
+
+
+    def generateConstant(self, value, const_type, o):
+        """Pushes a folded constant of const_type."""
+        emitter = o['emitter']
+        frame = o['frame']
+        if isinstance(const_type, FloatType):
+            return emitter.emitPUSHFCONST(self.floatText(float(value)), frame)
+        elif isinstance(const_type, StringType):
+            return emitter.emitPUSHSTRING(self.jasminStringText(value), frame)
+        return emitter.emitPUSHICONST(int(value), frame)
+
+
+    def generateStaticInitializer(self, items_to_init, global_symbols_list, emitter, class_name):
+        """Generates the <clinit> of a class, calling synthetic clinit$N methods when its initializers
+        add up to more than splitThreshold nodes."""
+        groups = [[]]
+        size = 0
+        for sym, decl_node in items_to_init:
+            init_expr = decl_node.varInit if isinstance(decl_node, VarDecl) else decl_node.iniExpr
+            init_size = len(list(self.walkAST(init_expr))) + 1
+            if groups[-1] and size + init_size > self.splitThreshold:
+                groups.append([])
+                size = 0
+            groups[-1].append((sym, decl_node))
+            size = size + init_size
+
+        if len(groups) == 1:
+            self.generateInitializerMethod("<clinit>", items_to_init, [], global_symbols_list, emitter, class_name)
+            return
+        parts = [f"clinit${number}" for number in range(1, len(groups) + 1)]
+        for part, group in zip(parts, groups):
+            self.generateInitializerMethod(part, group, [], global_symbols_list, emitter, class_name)
+        self.generateInitializerMethod("<clinit>", [], parts, global_symbols_list, emitter, class_name)
+
+
+    def generateInitializerMethod(self, name, items_to_init, parts, global_symbols_list, emitter, class_name):
+        """Generates a static method that calls the initializer methods named in parts
+        and then initializes the given globals."""
+        frame = Frame(name, VoidType())
+        emitter.printout(emitter.emitMETHOD(name, MType([], VoidType()), True, frame))
         frame.enterScope(True) 
         emitter.printout(emitter.emitLABEL(frame.getStartLabel(), frame))
         init_env = {'env': [global_symbols_list], 'frame': frame, 'emitter': emitter}
+
+        for part in parts:
+            emitter.printout(emitter.emitINVOKESTATIC(f"{class_name}/{part}", MType([], VoidType()), frame))
     
         # Generate code to initialize non-constant global variables and constants
         for sym, decl_node in items_to_init:
@@ -163,9 +305,13 @@ class CodeGenerator(BaseVisitor,Utils):
                 init_expr = decl_node.varInit
             elif isinstance(decl_node, ConstDecl):
                 init_expr = decl_node.iniExpr
-            init_code, _ = self.visit(init_expr, init_env)
-            emitter.printout(init_code)
-            emitter.printout(self.emit.emitPUTSTATIC(f"{self.className}/{sym.name}", sym.mtype, frame))
+            if init_expr is None:
+                # Uninitialized globals whose zero value is not the JVM default
+                emitter.printout(self.generateZeroValue(sym.mtype, init_env))
+            else:
+                init_code, _ = self.visit(init_expr, init_env)
+                emitter.printout(init_code)
+            emitter.printout(self.emit.emitPUTSTATIC(f"{class_name}/{sym.name}", sym.mtype, frame))
 
         emitter.printout(emitter.emitLABEL(frame.getEndLabel(), frame))
         emitter.printout(emitter.emitRETURN(VoidType(), frame))  
@@ -176,44 +322,62 @@ class CodeGenerator(BaseVisitor,Utils):
     def visitProgram(self, ast, o):
         env = o['env'][0]
         sym_build_env = {'env': [env]}
+        self.globalTouches = self.findGlobalTouches(ast.decl)
+        classes = self.partitionProgram(ast.decl)
+        classes.update(self.findLazyGlobals(ast.decl))
+
+        for decl in ast.decl:
+            if isinstance(decl, (StructType, InterfaceType)):
+                # Type declaration -> maps to a separate class/interface file
+                env.append(Symbol(decl.name, decl, CName(decl.name, True)))
 
         for decl in ast.decl:
             if isinstance(decl, FuncDecl):
                 param_types = [self.visit(p.parType, sym_build_env) for p in decl.params]
                 ret_type = self.visit(decl.retType, sym_build_env)
                 mtype = MType(param_types, ret_type)
-                env.append(Symbol(decl.name, mtype, CName(self.className, True)))
-
-            elif isinstance(decl, (StructType, InterfaceType)):
-                # Type declaration -> maps to a separate class/interface file
-                env.append(Symbol(decl.name, decl, CName(decl.name, True)))
+                env.append(Symbol(decl.name, mtype, CName(classes.get(id(decl), self.className), True)))
 
             elif isinstance(decl, VarDecl):
-                # Global variable -> static field in MiniGoClass
+                # Global variable -> static field in MiniGoClass, or in the class it was moved to
                 var_type = self.visit(decl.varType, sym_build_env) if decl.varType else None
                 if var_type is None and decl.varInit:
-                    var_type = self.visit(decl.varInit, o)[1]
-                env.append(Symbol(decl.varName, var_type, CName(self.className, True)))
+                    # Only the type is needed; the code is generated again in <clinit>
+                    var_type = self.probeType(decl.varInit, {**sym_build_env, 'frame': Frame("<clinit>", VoidType()), 'emitter': self.emit})
+                env.append(Symbol(decl.varName, var_type, CName(classes.get(id(decl), self.className), True)))
 
             elif isinstance(decl, ConstDecl):
                 # Global constant -> static final field in MiniGoClass
                 const_value = self.cal_const(decl.iniExpr, sym_build_env)
-                const_type = self.visit(decl.iniExpr, sym_build_env)[1]
-                env.append(Symbol(decl.conName, const_type, CName(self.className, True), const_value))
+                const_type = self.probeType(decl.iniExpr, {**sym_build_env, 'frame': Frame("<clinit>", VoidType()), 'emitter': self.emit})
+                env.append(Symbol(decl.conName, const_type, CName(classes.get(id(decl), self.className), True), const_value))
 
         for decl in ast.decl:
             if isinstance(decl, MethodDecl):
                 sym = self.lookup(decl.recType.name, env, lambda x: x.name)
-                if isinstance(sym.mtype, StructType):
-                    sym.methods.append(decl)
-                elif isinstance(sym.mtype, InterfaceType):
-                    prototype = Prototype(decl.fun.name, [x.parType for x in decl.fun.params], decl.fun.retType)
-                    sym.methods.append(prototype)
+                sym.mtype.methods.append(decl)
+
+        for decl in ast.decl:
+            if isinstance(decl, StructType):
+                # Interfaces are satisfied implicitly by having every method they declare
+                method_names = [method.fun.name for method in decl.methods]
+                decl.implements = [other for other in ast.decl if isinstance(other, InterfaceType)
+                                   and all(prototype.name in method_names for prototype in other.methods)]
+                for interface in decl.implements:
+                    self.implementors.setdefault(interface.name, []).append(decl)
+
+        for decl in ast.decl:
+            if isinstance(decl, (FuncDecl, MethodDecl)):
+                self.scalarStructs.extend(self.findScalarStructs(decl.body if isinstance(decl, FuncDecl) else decl.fun.body))
 
         # --- Code Generation Phase ---
-        self.emit.printout(self.emit.emitPROLOG(self.className, "java.lang.Object", False))
+        emitters = {self.className: self.emit}
+        for class_name in self.classNames[1:]:
+            emitters[class_name] = Emitter(self.path + "/" + class_name + ".j")
+        for class_name, emitter in emitters.items():
+            emitter.printout(emitter.emitPROLOG(class_name, "java.lang.Object", False))
 
-        items_needing_clinit = []
+        items_needing_clinit = {class_name: [] for class_name in self.classNames}
         for decl in ast.decl:
             sym = None
             is_const = False
@@ -224,21 +388,33 @@ class CodeGenerator(BaseVisitor,Utils):
                 is_const = isinstance(decl, ConstDecl)
                 init_expr = decl.varInit if isinstance(decl, VarDecl) else decl.iniExpr
 
-            if sym and isinstance(sym.value, CName) and sym.value.value == self.className:
-                # This global belongs in MiniGoClass.j
+            if sym and self.isProgramMember(sym.value):
+                # This global belongs in MiniGoClass.j or in the class it was moved to
+                emitter = emitters[sym.value.value]
                 is_final = is_const
-                # Emit static fields (.field directives) for global variables and constants in MiniGoClass
-                self.emit.printout(self.emit.emitATTRIBUTE(name, sym.mtype, True, is_final, None))
-                if init_expr:
-                    items_needing_clinit.append((sym, decl))
-
-        # Generate the static initializer <clinit> in MiniGoClass
-        self.generateStaticInitializer(items_needing_clinit, env, self.emit)
+                # Jasmin reads a negative decimal as a double, which a float field cannot hold, so those are set in <clinit>
+                negative_float = isinstance(sym.const_value, float) and math.copysign(1.0, sym.const_value) < 0
+                if is_const and sym.const_value is not None and not negative_float:
+                    # Folded constant: the field gets a ConstantValue and its uses push the value directly
+                    emitter.printout(self.emit.emitATTRIBUTE(name, sym.mtype, True, True, self.constantText(sym.const_value)))
+                    continue
+                # Emit static fields (.field directives) for global variables and constants
+                emitter.printout(self.emit.emitATTRIBUTE(name, sym.mtype, True, is_final, None))
+                if init_expr or isinstance(sym.mtype, (StringType, ArrayType)):
+                    items_needing_clinit[sym.value.value].append((sym, decl))
+
+        # Generate the static initializer <clinit> of MiniGoClass, and of every other class initializing globals
+        for class_name, items in items_needing_clinit.items():
+            if items or class_name == self.className:
+                self.generateStaticInitializer(items, env, emitters[class_name], class_name)
 
         # Generate code for functions, structs, interfaces, and methods
         for decl in ast.decl:
             if isinstance(decl, FuncDecl):
-                self.visit(decl, {**sym_build_env, 'emitter': self.emit})
+                emitter = emitters[classes.get(id(decl), self.className)]
+                self.generateWithinCodeLimit(decl, {**sym_build_env, 'emitter': emitter})
+                while self.outlined:
+                    self.generateWithinCodeLimit(self.outlined.pop(0), {**sym_build_env, 'emitter': emitter})
 
             elif isinstance(decl, StructType):
                 # Separate .j file for the struct
@@ -250,7 +426,193 @@ class CodeGenerator(BaseVisitor,Utils):
 
             # MethodDecl nodes are visited from visitStructType or visitInterfaceType, NOT directly here.
 
-        self.emit.printout(self.emit.emitEPILOG())
+        if self.devirtualized:
+            self.emit.printout(self.emit.emitCOMMENT(f"{len(self.devirtualized)} interface call sites devirtualized:"))
+            for _, description in self.devirtualized:
+                self.emit.printout(self.emit.emitCOMMENT("  " + description))
+        if self.reusedLoads:
+            self.emit.printout(self.emit.emitCOMMENT(f"{sum(self.reusedLoads.values())} loads reused by value numbering:"))
+            for name, count in self.reusedLoads.items():
+                self.emit.printout(self.emit.emitCOMMENT(f"  {name}: {count}"))
+        for emitter in emitters.values():
+            emitter.emitEPILOG()
+
+
+    def generateWithinCodeLimit(self, decl, o):
+        """Generates a function or method again, with smaller outlined runs and at last without
+        inlining or unrolling, while its code is longer than MAX_CODE_LENGTH bytes."""
+        emitter = o['emitter']
+        global_symbols = o['env'][-1]
+        settings = (self.splitThreshold, self.inlineThreshold, self.unrollBudget)
+        body = decl.body if isinstance(decl, FuncDecl) else decl.fun.body
+        while True:
+            mark, symbols, outlined = emitter.getBufferMark(), len(global_symbols), len(self.outlined)
+            reused_loads, devirtualized = dict(self.reusedLoads), len(self.devirtualized)
+            self.visit(decl, o)
+            # Runs of as many nodes as produced half the limit at the rate this code did
+            nodes = min(self.splitThreshold, len(list(self.walkAST(body.member))))
+            threshold = nodes * MAX_CODE_LENGTH // (2 * max(emitter.codeLength, 1))
+            if emitter.codeLength <= MAX_CODE_LENGTH or (threshold == 0 and self.inlineThreshold < 0):
+                break
+            emitter.takeCodeSince(mark)
+            del global_symbols[symbols:]
+            del self.outlined[outlined:]
+            del self.devirtualized[devirtualized:]
+            self.reusedLoads = reused_loads
+            if threshold > 0:
+                self.splitThreshold = threshold
+            else:
+                self.splitThreshold, self.inlineThreshold, self.unrollBudget = settings[0], -1, 0
+        self.splitThreshold, self.inlineThreshold, self.unrollBudget = settings
+
+
+    def isProgramMember(self, location):
+        """Checks whether a symbol location is a static member of one of the classes
+        generated for the functions and globals of the program."""
+        return isinstance(location, CName) and location.value in self.classNames
+
+
+    def partitionProgram(self, decls):
+        """Packs the functions and self-contained globals that main does not use first into classes of at most
+        classThreshold nodes, in call graph order. Returns the class of each moved declaration, keyed by its id."""
+        members = [decl for decl in decls if isinstance(decl, (FuncDecl, VarDecl, ConstDecl))]
+        sizes = {id(decl): len(list(self.walkAST(decl))) for decl in members}
+        if sum(sizes.values()) <= self.classThreshold:
+            return {}
+
+        functions = [decl for decl in members if isinstance(decl, FuncDecl)]
+        order = []
+        worklist = [decl for decl in functions if decl.name == "main"]
+        while worklist:
+            decl = worklist.pop()
+            if any(decl is other for other in order):
+                continue
+            order.append(decl)
+            worklist.extend(reversed([callee for callee in self.callees(decl.body, decls) if isinstance(callee, FuncDecl)]))
+        order.extend(decl for decl in functions if not any(decl is other for other in order))
+
+        def selfContained(decl):
+            # Moved initializers run when their class is loaded, so one that may trap stays at startup
+            decl_type, init_expr = (decl.varType, decl.varInit) if isinstance(decl, VarDecl) else (decl.conType, decl.iniExpr)
+            return not any(isinstance(node, (Id, FuncCall, MethCall)) for node in self.walkAST(init_expr)) \
+                and not self.mayTrap([decl_type, init_expr], None, decls)
+        movable = [decl for decl in members if isinstance(decl, (VarDecl, ConstDecl)) and selfContained(decl)]
+
+        items = []
+        for function in order:
+            used = {node.name for node in self.walkAST(function.body) if isinstance(node, Id)}
+            for decl in movable:
+                name = decl.varName if isinstance(decl, VarDecl) else decl.conName
+                if name in used and not any(decl is item for item in items):
+                    items.append(decl)
+            items.append(function)
+        items.extend(decl for decl in movable if not any(decl is item for item in items))
+
+        # main and the globals it uses first stay with the eager ones
+        stay = [decl for decl in members if not any(decl is item for item in items)]
+        first_moved = next((position for position, item in enumerate(items)
+                            if isinstance(item, FuncDecl) and item.name != "main"), len(items))
+        stay.extend(items[:first_moved])
+        items = items[first_moved:]
+
+        classes = {}
+        class_name = self.className
+        size = sum(sizes[id(decl)] for decl in stay)
+        for item in items:
+            if size + sizes[id(item)] > self.classThreshold and size > 0:
+                class_name = f"{self.className}${len(self.classNames)}"
+                self.classNames.append(class_name)
+                size = 0
+            size = size + sizes[id(item)]
+            if class_name != self.className:
+                classes[id(item)] = class_name
+        return classes
+
+
+    def findLazyGlobals(self, decls):
+        """Gives each expensive global whose initializer cannot tell when it runs a holder class of its own.
+        Returns the holder class of each deferred global, keyed by the id of its declaration."""
+        if self.lazyThreshold is None:
+            return {}
+        global_names = {decl.varName for decl in decls if isinstance(decl, VarDecl)}
+        function_names = {decl.name for decl in decls if isinstance(decl, FuncDecl)}
+
+        def elements(dimens):
+            # A dimension that is not known is assumed to be large
+            count = 1
+            for dimen in dimens:
+                value = self.arrayDimension(dimen, decls)
+                count = count * (self.lazyThreshold if value is None else value)
+            return count
+
+        def body(callee):
+            return callee.body if isinstance(callee, FuncDecl) else callee.fun.body
+
+        def reachable(node):
+            reached = []
+            worklist = self.callees(node, decls)
+            while worklist:
+                callee = worklist.pop()
+                if any(callee is other for other in reached):
+                    continue
+                reached.append(callee)
+                worklist.extend(self.callees(body(callee), decls))
+            return reached
+
+        def pure(decl):
+            # Every call must reach declared functions only, none of which touches a global, calls a built-in or recurses
+            reached = reachable(decl.varInit)
+            bodies = [decl.varInit] + [body(callee) for callee in reached]
+            return (all(call.funName in function_names for node in bodies for call in self.walkAST(node) if isinstance(call, FuncCall))
+                    and not any(self.globalTouches[id(callee)] for callee in reached)
+                    and not any(any(callee is other for other in reachable(body(callee))) for callee in reached)
+                    and not self.mayTrap([decl.varType, decl.varInit], None, decls)
+                    and not any(self.mayTrap(body(callee), callee.receiver if isinstance(callee, MethodDecl) else None, decls) for callee in reached))
+
+        holders = {}
+        for decl in decls:
+            if not isinstance(decl, VarDecl):
+                continue
+            nodes = list(self.walkAST([decl.varType, decl.varInit]))
+            expensive = any(isinstance(node, (FuncCall, MethCall)) for node in nodes) \
+                or any(elements(node.dimens) >= self.lazyThreshold for node in nodes if isinstance(node, (ArrayType, ArrayLiteral)))
+            reads_global = any(isinstance(node, Id) and node.name in global_names for node in self.walkAST(decl.varInit))
+            if expensive and not reads_global and pure(decl):
+                class_name = f"{self.className}${decl.varName}"
+                self.classNames.append(class_name)
+                holders[id(decl)] = class_name
+        return holders
+
+
+    def mayTrap(self, node, receiver, decls):
+        """Whether evaluating node may throw or loop: on a division, an index, a nil receiver or a negative
+        array size. receiver names a method receiver, which is never nil unless reassigned."""
+        if receiver and any(isinstance(inner, VarDecl) and inner.varName == receiver
+                            or isinstance(inner, Assign) and isinstance(inner.lhs, Id) and inner.lhs.name == receiver
+                            for inner in self.walkAST(node)):
+            receiver = None
+        for inner in self.walkAST(node):
+            if isinstance(inner, (ForBasic, ForStep, ForEach, ArrayCell)):
+                return True
+            elif isinstance(inner, BinaryOp) and inner.op in ['/', '%']:
+                # Operand types are not known here, so float division is refused too
+                return True
+            elif isinstance(inner, (FieldAccess, MethCall)) and not isinstance(inner.receiver, StructLiteral) \
+                    and not (isinstance(inner.receiver, Id) and inner.receiver.name == receiver):
+                return True
+            elif isinstance(inner, (ArrayType, ArrayLiteral)) \
+                    and any(self.arrayDimension(dimen, decls) is None or self.arrayDimension(dimen, decls) < 0 for dimen in inner.dimens):
+                return True
+        return False
+
+
+    def arrayDimension(self, dimen, decls):
+        """Value of an array dimension, None unless it is a literal or a self-contained constant."""
+        constants = {decl.conName: decl.iniExpr for decl in decls if isinstance(decl, ConstDecl)}
+        if isinstance(dimen, Id) and dimen.name in constants:
+            dimen = constants[dimen.name]
+        value = self.cal_const(dimen, {"env": []})
+        return value if isinstance(value, int) and not isinstance(value, bool) else None
 
 
     def visitVarDecl(self, ast, o):
@@ -260,31 +622,55 @@ class CodeGenerator(BaseVisitor,Utils):
         location = sym.value
         var_type = sym.mtype
 
-        if isinstance(location, Index):
+        if sym.fields is not None:
+            emitter.printout(self.generateScalarStructInit(sym, ast.varInit, o))
+        elif isinstance(location, Index):
             index = location.value
             if ast.varInit:
                 init_code, _ = self.visit(ast.varInit, o)
                 emitter.printout(init_code)
 
             else:
-                zero_value_code = ""
-                if isinstance(var_type, (IntType, BoolType)):
-                    zero_value_code = emitter.emitPUSHICONST(0, frame)
-                elif isinstance(var_type, FloatType):
-                    zero_value_code = emitter.emitPUSHFCONST("0.0", frame)
-                elif isinstance(var_type, StringType):
-                    zero_value_code = emitter.emitPUSHCONST("", StringType(), frame)
-                elif isinstance(var_type, (ArrayType, StructType, InterfaceType)):
-                    zero_value_code = emitter.emitPUSHNULL(frame)
-                emitter.printout(zero_value_code)
+                emitter.printout(self.generateZeroValue(var_type, o))
 
             emitter.printout(self.emit.emitWRITEVAR(ast.varName, var_type, index, frame))
     
 
+    def generateZeroValue(self, var_type, o):
+        """Pushes the value of a variable of var_type that has no initializer."""
+        emitter = o['emitter']
+        frame = o['frame']
+        if isinstance(var_type, (IntType, BoolType)):
+            return emitter.emitPUSHICONST(0, frame)
+        elif isinstance(var_type, FloatType):
+            return emitter.emitPUSHFCONST("0.0", frame)
+        elif isinstance(var_type, StringType):
+            return emitter.emitPUSHCONST("", StringType(), frame)
+        elif isinstance(var_type, ArrayType):
+            return self.generateNewArray(var_type, o)
+        elif isinstance(var_type, (StructType, InterfaceType)):
+            return emitter.emitPUSHNULL(frame)
+        return ""
+
+
+    def generateNewArray(self, arr_type, o):
+        """Allocates an array of arr_type with every element at its zero value."""
+        emitter = o['emitter']
+        frame = o['frame']
+        result_code = [self.visit(dimen, o)[0] for dimen in arr_type.dimens]
+        if len(arr_type.dimens) == 1:
+            result_code.append(emitter.emitNEWARRAY(self.elementType(arr_type, o), frame))
+        else:
+            result_code.append(emitter.emitMULTIANEWARRAY(arr_type, frame))
+        return ''.join(result_code)
+
+
     def visitConstDecl(self, ast, o):
         emitter = o['emitter']
         frame = o['frame']
         sym = self.lookup(ast.conName, [j for i in o['env'] for j in i], lambda x: x.name)
+        if sym.const_value is not None:
+            return
         location = sym.value
         const_type = sym.mtype
 
@@ -302,7 +688,7 @@ class CodeGenerator(BaseVisitor,Utils):
         if isMain:
             mtype = MType([ArrayType([None],StringType())], VoidType())
         else:
-            mtype = MType(list(map(lambda x: x.parType, ast.params)), ast.retType)
+            mtype = MType([self.visit(x.parType, o) for x in ast.params], self.visit(ast.retType, o))
         
         emitter.printout(emitter.emitMETHOD(ast.name, mtype, True, frame))
         frame.enterScope(True)
@@ -320,28 +706,40 @@ class CodeGenerator(BaseVisitor,Utils):
             emitter.printout(emitter.emitVAR(param_index, param_name, param_type, frame.getStartLabel(), frame.getEndLabel(), frame))
         else:
             # Other functions' parameters
-            for param_decl in ast.params:
+            for param_decl, param_type in zip(ast.params, mtype.partype):
                 param_name = param_decl.parName
-                param_type = param_decl.parType
                 param_index = frame.getNewIndex()
                 local_symbols.append(Symbol(param_name, param_type, Index(param_index)))
                 # Emit .var directive for the parameter
                 emitter.printout(emitter.emitVAR(param_index, param_name, param_type, frame.getStartLabel(), frame.getEndLabel(), frame))
 
+        self.tailCall = (ast, frame.getStartLabel(), list(local_symbols))
         self.visit(ast.body,env_for_body)
+        self.tailCall = None
         emitter.printout(emitter.emitLABEL(frame.getEndLabel(), frame))
-        emitter.printout(emitter.emitRETURN(ast.retType, frame))
+        emitter.printout(self.generateFallbackReturn(mtype.rettype, env_for_body))
         emitter.printout(emitter.emitENDMETHOD(frame))
         frame.exitScope()
 
 
+    def generateFallbackReturn(self, ret_type, o):
+        """Generates the return of a zero value after the end label, which a branch over a final else may target."""
+        emitter = o['emitter']
+        frame = o['frame']
+        if isinstance(ret_type, VoidType):
+            return emitter.emitRETURN(ret_type, frame)
+        zero_code = emitter.emitPUSHNULL(frame) if isinstance(ret_type, ArrayType) else self.generateZeroValue(ret_type, o)
+        return zero_code + emitter.emitRETURN(ret_type, frame)
+
+
     def visitMethodDecl(self, ast, o):
         emitter = o['emitter']
         method_name = ast.fun.name
-        ret_type = ast.fun.retType
+        ret_type = self.visit(ast.fun.retType, o)
 
-        param_types = [p.parType for p in ast.fun.params]
+        param_types = [self.visit(p.parType, o) for p in ast.fun.params]
         method_mtype = MType(param_types, ret_type)
+        receiver_type = self.visit(ast.recType, o)
 
         frame = Frame(method_name, ret_type)
         emitter.printout(emitter.emitMETHOD(method_name, method_mtype, False, frame))
@@ -354,28 +752,29 @@ class CodeGenerator(BaseVisitor,Utils):
         
         # Add 'this' parameter (index 0)
         this_index = frame.getNewIndex()
-        local_symbols.append(Symbol(ast.receiver, ast.recType, Index(this_index)))
-        emitter.printout(emitter.emitVAR(this_index, ast.receiver, ast.recType, frame.getStartLabel(), frame.getEndLabel(), frame))
+        local_symbols.append(Symbol(ast.receiver, receiver_type, Index(this_index)))
+        emitter.printout(emitter.emitVAR(this_index, ast.receiver, receiver_type, frame.getStartLabel(), frame.getEndLabel(), frame))
 
         # Add method parameters (starting from index 1)
-        for param_decl in ast.fun.params:
+        for param_decl, param_type in zip(ast.fun.params, param_types):
             param_name = param_decl.parName
-            param_type = param_decl.parType
             param_index = frame.getNewIndex()
             local_symbols.append(Symbol(param_name, param_type, Index(param_index)))
             emitter.printout(emitter.emitVAR(param_index, param_name, param_type, frame.getStartLabel(), frame.getEndLabel(), frame))
 
+        self.tailCall = (ast, frame.getStartLabel(), list(local_symbols))
         self.visit(ast.fun.body, env_for_body)
+        self.tailCall = None
 
         emitter.printout(emitter.emitLABEL(frame.getEndLabel(), frame))
-        emitter.printout(emitter.emitRETURN(ret_type, frame))
+        emitter.printout(self.generateFallbackReturn(ret_type, env_for_body))
         emitter.printout(emitter.emitENDMETHOD(frame))
         frame.exitScope()
 
 
     def visitPrototype(self, ast, o):
         emitter = o['emitter']
-        method_mtype = MType(ast.params, ast.retType)
+        method_mtype = MType([self.visit(x, o) for x in ast.params], self.visit(ast.retType, o))
         jvm_descriptor = emitter.getJVMType(method_mtype)
         # Manually construct the Jasmin directive string
         abstract_method_code = f".method public abstract {ast.name}{jvm_descriptor}\n"
@@ -405,7 +804,15 @@ class CodeGenerator(BaseVisitor,Utils):
     
 
     def visitArrayType(self, ast, o):
-        return ast
+        return ArrayType(ast.dimens, self.elementType(ast, o))
+
+
+    def elementType(self, arr_type, o):
+        """Resolved element type of an array type. Struct and interface element types are
+        already resolved, and visiting their declaration again would regenerate the class."""
+        if isinstance(arr_type.eleType, (StructType, InterfaceType)):
+            return arr_type.eleType
+        return self.visit(arr_type.eleType, o)
     
 
     def visitInterfaceType(self, ast, o):
@@ -424,7 +831,7 @@ class CodeGenerator(BaseVisitor,Utils):
         struct_name = ast.name
         global_env = o['env']
         struct_emitter = Emitter(self.path + "/" + struct_name + ".j")
-        struct_emitter.printout(struct_emitter.emitPROLOG(struct_name, "java.lang.Object", False))
+        struct_emitter.printout(struct_emitter.emitPROLOG(struct_name, "java.lang.Object", False, [x.name for x in ast.implements]))
     
         for field_name, field_type_node in ast.elements:
             field_type = self.visit(field_type_node, o)
@@ -449,12 +856,46 @@ class CodeGenerator(BaseVisitor,Utils):
         struct_emitter.printout(struct_emitter.emitENDMETHOD(init_frame))
         init_frame.exitScope()
 
+        if ast.elements:
+            self.generateFieldsConstructor(ast, struct_emitter, o)
+
         env_for_methods = {'env': global_env, 'emitter': struct_emitter, 'is_interface_method': False}
         for method_decl in ast.methods:
-            self.visit(method_decl, env_for_methods)
+            self.generateWithinCodeLimit(method_decl, env_for_methods)
+            while self.outlined:
+                self.generateWithinCodeLimit(self.outlined.pop(0), env_for_methods)
         struct_emitter.emitEPILOG()
 
 
+    def generateFieldsConstructor(self, ast, emitter, o):
+        """Generates the <init> of a struct class that takes every field, in declaration order."""
+        field_types = [self.visit(field_type, o) for _, field_type in ast.elements]
+        frame = Frame("<init>", VoidType())
+        emitter.printout(emitter.emitMETHOD("<init>", MType(field_types, VoidType()), False, frame))
+        frame.enterScope(True)
+        start_label = frame.getStartLabel()
+        end_label = frame.getEndLabel()
+
+        this_index = frame.getNewIndex()
+        emitter.printout(emitter.emitVAR(this_index, "this", ast, start_label, end_label, frame))
+        field_indices = []
+        for (field_name, _), field_type in zip(ast.elements, field_types):
+            field_indices.append(frame.getNewIndex())
+            emitter.printout(emitter.emitVAR(field_indices[-1], field_name, field_type, start_label, end_label, frame))
+        emitter.printout(emitter.emitLABEL(start_label, frame))
+        emitter.printout(emitter.emitREADVAR("this", ast, this_index, frame))
+        emitter.printout(emitter.emitINVOKESPECIAL(frame, "java/lang/Object/<init>", MType([], VoidType())))
+        for (field_name, _), field_type, index in zip(ast.elements, field_types, field_indices):
+            emitter.printout(emitter.emitREADVAR("this", ast, this_index, frame))
+            emitter.printout(emitter.emitREADVAR(field_name, field_type, index, frame))
+            emitter.printout(emitter.emitPUTFIELD(f"{ast.name}/{field_name}", field_type, frame))
+
+        emitter.printout(emitter.emitLABEL(end_label, frame))
+        emitter.printout(emitter.emitRETURN(VoidType(), frame))
+        emitter.printout(emitter.emitENDMETHOD(frame))
+        frame.exitScope()
+
+
     def visitBlock(self, ast, o):
         emitter = o['emitter']
         frame = o['frame']
@@ -465,34 +906,461 @@ class CodeGenerator(BaseVisitor,Utils):
 
         for member in ast.member:
             if isinstance(member, VarDecl):
-                var_type = self.visit(member.varType, env_for_block) if member.varType else self.visit(member.varInit, env_for_block)[1]
+                var_type = self.visit(member.varType, env_for_block) if member.varType else self.probeType(member.varInit, env_for_block)
+                if any(member is decl for decl in self.scalarStructs):
+                    local_symbols.append(self.declareScalarStruct(member.varName, var_type, env_for_block))
+                    continue
                 index = frame.getNewIndex()
                 local_symbols.append(Symbol(member.varName, var_type, Index(index)))
                 emitter.printout(emitter.emitVAR(index, member.varName, var_type, frame.getStartLabel(), frame.getEndLabel(), frame))
 
             if isinstance(member, ConstDecl):
                 const_value = self.cal_const(member.iniExpr, env_for_block)
-                const_type = self.visit(member.iniExpr, env_for_block)[1]
+                const_type = self.probeType(member.iniExpr, env_for_block)
+                if const_value is not None:
+                    # Folded constant: needs no slot since its uses push the value directly
+                    local_symbols.append(Symbol(member.conName, const_type, None, const_value))
+                    continue
                 index = frame.getNewIndex()
                 local_symbols.append(Symbol(member.conName, const_type, Index(index), const_value))
                 emitter.printout(emitter.emitVAR(index, member.conName, const_type, frame.getStartLabel(), frame.getEndLabel(), frame))
 
             elif isinstance(member, Assign) and isinstance(member.lhs, Id):
                 lhs_name = member.lhs.name
-                sym = self.lookup(lhs_name, [j for i in o['env'] for j in i], lambda x: x.name)
+                sym = self.lookup(lhs_name, [j for i in env_for_block['env'] for j in i], lambda x: x.name)
                 if not sym:
-                    lhs_type = self.visit(member.rhs, env_for_block)[1]
+                    lhs_type = self.probeType(member.rhs, env_for_block)
+                    if any(member is decl for decl in self.scalarStructs):
+                        local_symbols.append(self.declareScalarStruct(lhs_name, lhs_type, env_for_block))
+                        continue
                     index = frame.getNewIndex()
                     local_symbols.append(Symbol(lhs_name, lhs_type, Index(index)))
-                emitter.printout(emitter.emitVAR(index, lhs_name, lhs_type, frame.getStartLabel(), frame.getEndLabel(), frame))
-
-        for stmt in ast.member:
-            self.visit(stmt, env_for_block)
+                    emitter.printout(emitter.emitVAR(index, lhs_name, lhs_type, frame.getStartLabel(), frame.getEndLabel(), frame))
+
+        members = ast.member
+        decl = self.tailCall[0] if self.tailCall else None
+        body = decl.body if isinstance(decl, FuncDecl) else decl.fun.body if isinstance(decl, MethodDecl) else None
+        if ast is body and len(list(self.walkAST(ast.member))) > self.splitThreshold:
+            members = self.outlineStatements(members, self.tailCall[2] + local_symbols, env_for_block)
+
+        outer_numbers = self.valueNumbers
+        self.valueNumbers = []
+        run_left = 0
+        for position, stmt in enumerate(members):
+            if run_left == 0:
+                self.releaseValueNumbers(env_for_block)
+                self.valueNumbers, run_left = self.numberValues(members[position:], env_for_block)
+            run_left = run_left - 1
+            if isinstance(stmt, (FuncCall, MethCall)):
+                # Call statement: emit the call and discard any returned value
+                call_code, call_type = self.visit(stmt, env_for_block)
+                emitter.printout(call_code)
+                if not isinstance(call_type, VoidType):
+                    emitter.printout(emitter.emitPOP(frame))
+            elif isinstance(stmt, (ForBasic, ForStep, ForEach)):
+                self.generatePromotedLoop(stmt, env_for_block)
+            else:
+                self.visit(stmt, env_for_block)
+        self.releaseValueNumbers(env_for_block)
+        self.valueNumbers = outer_numbers
 
         emitter.printout(emitter.emitLABEL(frame.getEndLabel(), frame))
         frame.exitScope()
 
 
+    def findGlobalTouches(self, decls):
+        """Returns the names of the global variables each function and method may read or write, directly or
+        through its callees, keyed by the id of its declaration."""
+        global_names = {decl.varName for decl in decls if isinstance(decl, VarDecl)}
+        bodies = {id(decl): decl.body if isinstance(decl, FuncDecl) else decl.fun.body
+                  for decl in decls if isinstance(decl, (FuncDecl, MethodDecl))}
+        touches = {key: {node.name for node in self.walkAST(body) if isinstance(node, Id) and node.name in global_names}
+                   for key, body in bodies.items()}
+        callees = {key: self.callees(body, decls) for key, body in bodies.items()}
+
+        changed = True
+        while changed:
+            changed = False
+            for key in bodies:
+                reached = set().union(touches[key], *[touches[id(callee)] for callee in callees[key]])
+                if reached != touches[key]:
+                    touches[key] = reached
+                    changed = True
+        return touches
+
+
+    def callees(self, ast, decls):
+        """Returns the declarations of the functions and methods called anywhere in ast.
+        A method call may reach every method of that name."""
+        result = []
+        for node in self.walkAST(ast):
+            if isinstance(node, FuncCall):
+                result.extend(decl for decl in decls if isinstance(decl, FuncDecl) and decl.name == node.funName)
+            elif isinstance(node, MethCall):
+                result.extend(decl for decl in decls if isinstance(decl, MethodDecl) and decl.fun.name == node.metName)
+        return result
+
+
+    def generatePromotedLoop(self, ast, o):
+        """Generates a loop with the global variables it uses, and that nothing it calls may touch, kept in
+        hidden locals that are written back after the loop and before every return in it."""
+        emitter = o['emitter']
+        frame = o['frame']
+        all_symbols = [j for i in o['env'] for j in i]
+
+        touched = set().union(*[self.globalTouches[id(decl)] for decl in self.callees(ast, self.astTree.decl)])
+        excluded = set(touched)
+        written = set()
+        for node in self.walkAST(ast):
+            if isinstance(node, VarDecl):
+                excluded.add(node.varName)
+            elif isinstance(node, ConstDecl):
+                excluded.add(node.conName)
+            elif isinstance(node, ForEach):
+                excluded.update([node.idx.name, node.value.name])
+            elif isinstance(node, (Assign, CompoundAssign)) and isinstance(node.lhs, Id):
+                written.add(node.lhs.name)
+
+        promoted = []
+        for node in self.walkAST(ast):
+            if not isinstance(node, Id) or node.name in excluded or node.name in [sym.name for sym in promoted]:
+                continue
+            sym = self.lookup(node.name, all_symbols, lambda x: x.name)
+            if sym and self.isProgramMember(sym.value) and not isinstance(sym.mtype, MType) and sym.const_value is None:
+                index = frame.getTempIndex()
+                emitter.printout(emitter.emitGETSTATIC(f"{sym.value.value}/{sym.name}", sym.mtype, frame))
+                emitter.printout(emitter.emitWRITEVAR(sym.name, sym.mtype, index, frame))
+                promoted.append(Symbol(sym.name, sym.mtype, Index(index)))
+                if sym.name in written:
+                    self.promotedGlobals.append((sym, promoted[-1]))
+        if not promoted:
+            self.visit(ast, o)
+            return
+
+        self.visit(ast, {**o, 'env': [promoted] + o['env']})
+        for sym, local in [entry for entry in self.promotedGlobals if entry[1] in promoted]:
+            emitter.printout(self.generateGlobalWriteBack(sym, local, o))
+            self.promotedGlobals.remove((sym, local))
+        for local in promoted:
+            frame.releaseIndex(local.value.value)
+
+
+    def generateGlobalWriteBack(self, sym, local, o):
+        """Stores the local holding a promoted global back into its static field."""
+        emitter = o['emitter']
+        frame = o['frame']
+        return emitter.emitREADVAR(local.name, local.mtype, local.value.value, frame) \
+            + emitter.emitPUTSTATIC(f"{sym.value.value}/{sym.name}", sym.mtype, frame)
+
+
+    def outlineStatements(self, members, local_symbols, o):
+        """Moves runs of top-level statements of a body over splitThreshold nodes into synthetic functions.
+        Returns the members with each outlined run replaced by its call."""
+        sizes = [len(list(self.walkAST(member))) for member in members]
+        used = [{node.name for node in self.walkAST(member) if isinstance(node, Id)} for member in members]
+        used_after = [set() for _ in range(len(members) + 1)]
+        for position in range(len(members) - 1, -1, -1):
+            used_after[position] = used_after[position + 1] | used[position]
+
+        written = []
+        for member in members:
+            names = set()
+            for node in self.walkAST(member):
+                if isinstance(node, (Assign, CompoundAssign)) and isinstance(node.lhs, Id):
+                    names.add(node.lhs.name)
+                elif isinstance(node, VarDecl):
+                    names.add(node.varName)
+                elif isinstance(node, ConstDecl):
+                    names.add(node.conName)
+                elif isinstance(node, ForEach):
+                    names.update([node.idx.name, node.value.name])
+            written.append(names)
+
+        # Position of the statement declaring each local of the body, as visitBlock declares them
+        body_names = [sym.name for sym in local_symbols[len(self.tailCall[2]):]]
+        declared_at = {}
+        for position, member in enumerate(members):
+            name = member.varName if isinstance(member, VarDecl) else member.conName if isinstance(member, ConstDecl) \
+                else member.lhs.name if isinstance(member, Assign) and isinstance(member.lhs, Id) else None
+            if name in body_names and name not in declared_at:
+                declared_at[name] = position
+
+        returns = [any(isinstance(node, Return) for node in self.walkAST(member)) for member in members]
+
+        def runInterface(start, end, names, stored):
+            # (parameters, result) of a function running members[start:end], which use names and write
+            # stored, or None when the run cannot be outlined
+            symbols = [sym for sym in local_symbols if sym.name in names | stored]
+            if any(sym.fields is not None or sym.builder or declared_at.get(sym.name, -1) >= end for sym in symbols):
+                return None
+            results = [sym for sym in symbols if sym.name in stored and sym.name in used_after[end]]
+            if len(results) > 1:
+                return None
+            params = [sym for sym in symbols if sym.name in names and not start <= declared_at.get(sym.name, -1) < end]
+            return params, results[0] if results else None
+
+        def outline(start, end, params, result):
+            all_symbols = [j for i in o['env'] for j in i]
+            decl = self.tailCall[0]
+            # Runs of a method go to static functions of its struct, taking the receiver as a parameter
+            prefix = (decl.recType.name + "$" + decl.fun.name if isinstance(decl, MethodDecl) else decl.name) + "$part"
+            name = prefix + str(1 + sum(1 for sym in all_symbols if sym.name.startswith(prefix)))
+            ret_type = result.mtype if result else VoidType()
+            body = Block(members[start:end] + ([Return(Id(result.name))] if result else []))
+            self.outlined.append(FuncDecl(name, [ParamDecl(sym.name, self.typeSyntax(sym.mtype)) for sym in params],
+                                          self.typeSyntax(ret_type), body))
+            owner = decl.recType.name if isinstance(decl, MethodDecl) else self.lookup(decl.name, o['env'][-1], lambda x: x.name).value.value
+            o['env'][-1].append(Symbol(name, MType([sym.mtype for sym in params], ret_type), CName(owner, True)))
+            call = FuncCall(name, [Id(sym.name) for sym in params])
+            return Assign(Id(result.name), call) if result else call
+
+        # An outlined body must not need outlining itself, including the return of its result
+        limit = self.splitThreshold - len(list(self.walkAST(Return(Id("result")))))
+        outlined_members = []
+        total = sum(sizes)
+        start = 0
+        while start < len(members) and total > self.splitThreshold:
+            best = None
+            size = 0
+            names = set()
+            stored = set()
+            for end in range(start + 1, len(members) + 1):
+                size = size + sizes[end - 1]
+                if size > limit or returns[end - 1]:
+                    break
+                names |= used[end - 1]
+                stored |= written[end - 1]
+                interface = runInterface(start, end, names, stored)
+                if interface is not None:
+                    best = (end, size, interface)
+            if best is None:
+                outlined_members.append(members[start])
+                start = start + 1
+                continue
+            end, size, (params, result) = best
+            outlined_members.append(outline(start, end, params, result))
+            total = total - size + len(list(self.walkAST(outlined_members[-1])))
+            start = end
+        return outlined_members + members[start:]
+
+
+    def typeSyntax(self, var_type):
+        """Returns a resolved type as a declaration would write it, naming struct and
+        interface types instead of holding their declarations."""
+        if isinstance(var_type, (StructType, InterfaceType)):
+            return Id(var_type.name)
+        elif isinstance(var_type, ArrayType):
+            return ArrayType(var_type.dimens, self.typeSyntax(var_type.eleType))
+        return var_type
+
+
+    def numberValues(self, members, o):
+        """Local value numbering of field and array element loads over the straight-line statements at the start of members.
+        Returns the value numbers of the repeated loads and the number of statements in the run."""
+        known = [expr for expr, _, _ in self.hoisted]
+        available = []
+        numbered = []
+
+        def kill(test):
+            for entry in list(available):
+                if any(test(node) for node in self.walkAST(entry[0])):
+                    available.remove(entry)
+
+        def scan(expr, conditional):
+            if expr is None or expr in known:
+                return
+            if isinstance(expr, (StructLiteral, ArrayLiteral)):
+                # Elements may be generated out of source order, so their loads are not numbered,
+                # but a call among them still clobbers every load available before the literal
+                if any(isinstance(node, (FuncCall, MethCall)) for node in self.walkAST(expr)):
+                    kill(lambda node: True)
+                return
+            if isinstance(expr, ArrayCell) or (isinstance(expr, FieldAccess) and not self.scalarField(expr, o)):
+                entry = next((entry for entry in available if entry[0] == expr), None)
+                if entry:
+                    entry[1].append(expr)
+                    return
+                if not conditional:
+                    entry = [expr, []]
+                    available.append(entry)
+                    numbered.append(entry)
+
+            if isinstance(expr, BinaryOp):
+                scan(expr.left, conditional)
+                scan(expr.right, conditional or expr.op in ['&&', '||'])
+            elif isinstance(expr, UnaryOp):
+                scan(expr.body, conditional)
+            elif isinstance(expr, FieldAccess):
+                scan(expr.receiver, conditional)
+            elif isinstance(expr, ArrayCell):
+                scanCell(expr, conditional)
+            elif isinstance(expr, (FuncCall, MethCall)):
+                if isinstance(expr, MethCall):
+                    scan(expr.receiver, conditional)
+                for arg in expr.args:
+                    scan(arg, conditional)
+                # The callee may write any field, array element or global
+                kill(lambda node: True)
+
+        def scanCell(cell, conditional):
+            # Mirrors generateCellAddress: a hoisted row and strength-reduced indices are not evaluated
+            start = 0
+            for depth in range(len(cell.idx) - 1, 0, -1):
+                if ArrayCell(cell.arr, cell.idx[:depth]) in known:
+                    start = depth
+                    break
+            else:
+                scan(cell.arr, conditional)
+            for idx in cell.idx[start:]:
+                if not any(expr == idx for expr, _, _ in self.reducedIndices):
+                    scan(idx, conditional)
+
+        def killStore(lhs):
+            if isinstance(lhs, Id):
+                kill(lambda node: isinstance(node, Id) and node.name == lhs.name)
+            elif isinstance(lhs, FieldAccess):
+                kill(lambda node: isinstance(node, FieldAccess) and node.field == lhs.field)
+            else:
+                kill(lambda node: isinstance(node, ArrayCell))
+
+        count = 0
+        for stmt in members:
+            count = count + 1
+            if isinstance(stmt, (Assign, CompoundAssign)):
+                if isinstance(stmt.lhs, FieldAccess) and not self.scalarField(stmt.lhs, o):
+                    scan(stmt.lhs.receiver, False)
+                elif isinstance(stmt.lhs, ArrayCell):
+                    scanCell(stmt.lhs, False)
+                scan(stmt.rhs, False)
+                killStore(stmt.lhs)
+            elif isinstance(stmt, VarDecl):
+                scan(stmt.varInit, False)
+                killStore(Id(stmt.varName))
+            elif isinstance(stmt, ConstDecl):
+                scan(stmt.iniExpr, False)
+                killStore(Id(stmt.conName))
+            elif isinstance(stmt, (FuncCall, MethCall)):
+                scan(stmt, False)
+            elif isinstance(stmt, If):
+                scan(stmt.expr, False)
+                break
+            elif isinstance(stmt, Return):
+                scan(stmt.expr, False)
+                break
+            else:
+                # Loops and nested blocks start runs of their own
+                count = max(count - 1, 1)
+                break
+
+        frame = o['frame']
+        result = []
+        for expr, later in numbered:
+            if later:
+                result.append([expr, later, frame.getTempIndex(), self.probeType(expr, o)])
+        return result, count
+
+
+    def readValueNumber(self, ast, o):
+        """Returns the code of a load numbered in the current run: the first occurrence saves
+        its value in a local and the later ones read it back. Returns None for other loads."""
+        emitter = o['emitter']
+        frame = o['frame']
+        for entry in self.valueNumbers:
+            first, later, index, value_type = entry
+            if first is ast:
+                entry[0] = None
+                value_code, _ = self.visit(ast, o)
+                value_code += emitter.emitDUP(frame)
+                value_code += emitter.emitWRITEVAR("value", value_type, index, frame)
+                return value_code, value_type
+            if any(ast is expr for expr in later):
+                self.reusedLoads[frame.name] = self.reusedLoads.get(frame.name, 0) + 1
+                return emitter.emitREADVAR("value", value_type, index, frame), value_type
+        return None
+
+
+    def releaseValueNumbers(self, o):
+        for _, _, index, _ in self.valueNumbers:
+            o['frame'].releaseIndex(index)
+
+
+    def probeType(self, ast, o):
+        """Returns the type of an expression; the code generated to find it is discarded."""
+        value_numbers = self.valueNumbers
+        self.valueNumbers = []
+        expr_type = self.visit(ast, o)[1]
+        self.valueNumbers = value_numbers
+        o['frame'].pop()
+        return expr_type
+
+
+    def findScalarStructs(self, body):
+        """Returns the declarations in a function body of struct values that never escape it, so their fields
+        can live in locals."""
+        definitions = {}
+        for node in self.walkAST(body):
+            if isinstance(node, VarDecl):
+                definitions.setdefault(node.varName, []).append(node)
+            elif isinstance(node, ConstDecl):
+                definitions.setdefault(node.conName, []).append(node)
+            elif isinstance(node, Assign) and isinstance(node.lhs, Id):
+                definitions.setdefault(node.lhs.name, []).append(node)
+
+        # Every other occurrence of a name lets its value escape
+        allowed = [node.receiver for node in self.walkAST(body) if isinstance(node, FieldAccess) and isinstance(node.receiver, Id)]
+        allowed += [node.lhs for node in self.walkAST(body) if isinstance(node, Assign) and isinstance(node.lhs, Id)]
+        escaping = {node.name for node in self.walkAST(body) if isinstance(node, Id) and not any(node is use for use in allowed)}
+
+        result = []
+        for name, decls in definitions.items():
+            if len(decls) != 1 or name in escaping:
+                continue
+            decl = decls[0]
+            literal = decl.varInit if isinstance(decl, VarDecl) else getattr(decl, 'rhs', None)
+            if isinstance(literal, StructLiteral) and not any(isinstance(node, Id) and node.name == name for node in self.walkAST(literal)):
+                result.append(decl)
+        return result
+
+
+    def declareScalarStruct(self, name, struct_type, o):
+        """Returns the symbol of a non-escaping struct variable, with a local allocated for each field."""
+        emitter = o['emitter']
+        frame = o['frame']
+        sym = Symbol(name, struct_type, None)
+        sym.fields = {}
+        for field_name, field_type in struct_type.elements:
+            field_type = self.visit(field_type, o)
+            index = frame.getNewIndex()
+            sym.fields[field_name] = (index, field_type)
+            emitter.printout(emitter.emitVAR(index, f"{name}${field_name}", field_type, frame.getStartLabel(), frame.getEndLabel(), frame))
+        return sym
+
+
+    def generateScalarStructInit(self, sym, literal, o):
+        """Stores the values of a struct literal into the field locals of a non-escaping struct variable."""
+        emitter = o['emitter']
+        frame = o['frame']
+        result_code = []
+        for field_name, field_value in literal.elements:
+            index, field_type = sym.fields[field_name]
+            result_code.append(self.generateFieldValue(field_value, field_type, o))
+            result_code.append(emitter.emitWRITEVAR(field_name, field_type, index, frame))
+        given = [field_name for field_name, _ in literal.elements]
+        for field_name, (index, field_type) in sym.fields.items():
+            if field_name not in given:
+                result_code.append(self.generateZeroValue(field_type, o))
+                result_code.append(emitter.emitWRITEVAR(field_name, field_type, index, frame))
+        return ''.join(result_code)
+
+
+    def scalarField(self, ast, o):
+        """Returns (local index, type) of a field access on a non-escaping struct variable, otherwise None."""
+        if not isinstance(ast.receiver, Id):
+            return None
+        sym = self.lookup(ast.receiver.name, [j for i in o['env'] for j in i], lambda x: x.name)
+        return sym.fields[ast.field] if sym and sym.fields else None
+
+
     def visitAssign(self, ast, o):
         emitter = o['emitter']
         frame = o['frame']
@@ -504,6 +1372,16 @@ class CodeGenerator(BaseVisitor,Utils):
             target_sym = self.lookup(lhs_name, [j for i in o['env'] for j in i], lambda x: x.name)
             target_location = target_sym.value
             target_type = target_sym.mtype
+            if target_sym.builder:
+                emitter.printout(self.generateBuilderAssign(ast, target_sym, o))
+                return
+            if target_sym.fields is not None:
+                emitter.printout(self.generateScalarStructInit(target_sym, ast.rhs, o))
+                return
+            step = self.constantStep(ast)
+            if self.canStepLocal(target_sym, step):
+                emitter.printout(emitter.emitIINC(target_location.value, step, frame))
+                return
 
             rhs_code, _ = self.visit(ast.rhs, o)
             emitter.printout(rhs_code)
@@ -513,17 +1391,16 @@ class CodeGenerator(BaseVisitor,Utils):
                 store_code = emitter.emitPUTSTATIC(f"{target_location.value}/{lhs_name}", target_type, frame)
 
         elif isinstance(ast.lhs, ArrayCell):
-            arr_code, arr_type = self.visit(ast.lhs.arr, o)
-            lhs_code += arr_code
-            for idx_expr in ast.lhs.idx:
-                idx_code, _ = self.visit(idx_expr, o)
-                lhs_code += idx_code
-            ele_type = self.visit(arr_type.eleType, o)
-            store_code = emitter.emitASTORE(ele_type, frame)
-
+            lhs_code, ele_type = self.generateCellAddress(ast.lhs, o)
             emitter.printout(lhs_code)
             rhs_code, _ = self.visit(ast.rhs, o)
             emitter.printout(rhs_code)
+            store_code = emitter.emitASTORE(ele_type, frame)
+
+        elif isinstance(ast.lhs, FieldAccess) and self.scalarField(ast.lhs, o):
+            index, field_type = self.scalarField(ast.lhs, o)
+            emitter.printout(self.generateFieldValue(ast.rhs, field_type, o))
+            store_code = emitter.emitWRITEVAR(ast.lhs.field, field_type, index, frame)
 
         elif isinstance(ast.lhs, FieldAccess):
             receiver_code, receiver_type = self.visit(ast.lhs.receiver, o)
@@ -532,26 +1409,126 @@ class CodeGenerator(BaseVisitor,Utils):
             field_info = self.lookup(field_name, receiver_type.elements, lambda x: x[0])
             field_type = self.visit(field_info[1], o)
             struct_class_name = emitter.getFullType(receiver_type)
-            store_code = emitter.emitPUTFIELD(f"{struct_class_name}/{field_name}", field_type, frame)
 
             emitter.printout(lhs_code)
             rhs_code, _ = self.visit(ast.rhs, o)
             emitter.printout(rhs_code)
+            store_code = emitter.emitPUTFIELD(f"{struct_class_name}/{field_name}", field_type, frame)
 
         emitter.printout(store_code)
             
 
+    def visitCompoundAssign(self, ast, o):
+        """lhs op= rhs evaluates the parts of lhs once, duplicating the array and index or the receiver.
+        Int locals stepped by a small constant use iinc."""
+        emitter = o['emitter']
+        frame = o['frame']
+
+        if isinstance(ast.lhs, Id):
+            target_sym = self.lookup(ast.lhs.name, [j for i in o['env'] for j in i], lambda x: x.name)
+            target_location = target_sym.value
+            if target_sym.builder:
+                emitter.printout(self.generateBuilderAssign(ast, target_sym, o))
+                return
+            step = self.constantStep(ast)
+            if self.canStepLocal(target_sym, step):
+                emitter.printout(emitter.emitIINC(target_location.value, step, frame))
+                return
+
+            value_code, _ = self.visit(BinaryOp(ast.op, ast.lhs, ast.rhs), o)
+            emitter.printout(value_code)
+            if isinstance(target_location, Index):
+                emitter.printout(emitter.emitWRITEVAR(ast.lhs.name, target_sym.mtype, target_location.value, frame))
+            elif isinstance(target_location, CName):
+                emitter.printout(emitter.emitPUTSTATIC(f"{target_location.value}/{ast.lhs.name}", target_sym.mtype, frame))
+
+        elif isinstance(ast.lhs, ArrayCell):
+            address_code, ele_type = self.generateCellAddress(ast.lhs, o)
+            emitter.printout(address_code)
+            emitter.printout(emitter.emitDUP2(frame))
+            emitter.printout(emitter.emitALOAD(ele_type, frame))
+            emitter.printout(self.generateCompoundOp(ast.op, ele_type, ast.rhs, o))
+            emitter.printout(emitter.emitASTORE(ele_type, frame))
+
+        elif isinstance(ast.lhs, FieldAccess) and self.scalarField(ast.lhs, o):
+            index, field_type = self.scalarField(ast.lhs, o)
+            emitter.printout(emitter.emitREADVAR(ast.lhs.field, field_type, index, frame))
+            emitter.printout(self.generateCompoundOp(ast.op, field_type, ast.rhs, o))
+            emitter.printout(emitter.emitWRITEVAR(ast.lhs.field, field_type, index, frame))
+
+        elif isinstance(ast.lhs, FieldAccess):
+            receiver_code, receiver_type = self.visit(ast.lhs.receiver, o)
+            field_name = ast.lhs.field
+            field_info = self.lookup(field_name, receiver_type.elements, lambda x: x[0])
+            field_type = self.visit(field_info[1], o)
+            qualified_field_name = f"{emitter.getFullType(receiver_type)}/{field_name}"
+            emitter.printout(receiver_code)
+            emitter.printout(emitter.emitDUP(frame))
+            emitter.printout(emitter.emitGETFIELD(qualified_field_name, field_type, frame))
+            emitter.printout(self.generateCompoundOp(ast.op, field_type, ast.rhs, o))
+            emitter.printout(emitter.emitPUTFIELD(qualified_field_name, field_type, frame))
+
+
+    def constantStep(self, ast):
+        """Returns the signed amount by which an assignment steps its target by an int literal, otherwise None."""
+        if isinstance(ast, CompoundAssign):
+            op, amount = ast.op, ast.rhs
+        elif isinstance(ast.rhs, BinaryOp) and ast.rhs.op in ['+', '-'] and ast.rhs.left == ast.lhs:
+            op, amount = ast.rhs.op, ast.rhs.right
+        elif isinstance(ast.rhs, BinaryOp) and ast.rhs.op == '+' and ast.rhs.right == ast.lhs:
+            op, amount = '+', ast.rhs.left
+        else:
+            return None
+        if op not in ['+', '-']:
+            return None
+        sign = 1
+        if isinstance(amount, UnaryOp) and amount.op == '-':
+            amount = amount.body
+            sign = -1
+        if not isinstance(amount, IntLiteral):
+            return None
+        step = sign * int(amount.value)
+        return step if op == '+' else -step
+
+
+    def canStepLocal(self, sym, step):
+        """Checks whether a constant step of a variable can be done with iinc."""
+        return step is not None and isinstance(sym.mtype, IntType) and isinstance(sym.value, Index) \
+            and -128 <= step <= 127 and sym.value.value <= 255
+
+
+    def generateCompoundOp(self, op, target_type, rhs, o):
+        """Combines the current value of a target, already on the stack, with rhs."""
+        emitter = o['emitter']
+        frame = o['frame']
+        result_code = []
+        rhs_code, rhs_type = self.visit(rhs, o)
+        result_code.append(rhs_code)
+        if isinstance(target_type, FloatType) and isinstance(rhs_type, IntType):
+            result_code.append(emitter.emitI2F(frame))
+
+        if op in ['+', '-']:
+            result_code.append(emitter.emitADDOP(op, target_type, frame))
+        elif op in ['*', '/']:
+            result_code.append(emitter.emitMULOP(op, target_type, frame))
+        elif op == '%':
+            result_code.append(emitter.emitMOD(frame))
+        return ''.join(result_code)
+
+
     def visitIf(self, ast, o):
         emitter = o['emitter']
         frame = o['frame']
 
-        cond_code, _ = self.visit(ast.expr, o)
-        emitter.printout(cond_code)
+        subject, cases, default = self.switchCases(ast, o)
+        if len(cases) >= self.switchThreshold:
+            self.generateSwitch(subject, cases, default, o)
+            return
 
         label_end = frame.getNewLabel() # Label after the entire if/else structure
         # Label to jump to else condition is false. If no else, jump directly to end.
         label_false_target = frame.getNewLabel() if ast.elseStmt else label_end
-        emitter.printout(emitter.emitIFFALSE(label_false_target, frame))
+        emitter.printout(self.generateCondJump(ast.expr, o, label_false_target, False))
 
         self.visit(ast.thenStmt, o)
 
@@ -563,26 +1540,81 @@ class CodeGenerator(BaseVisitor,Utils):
         emitter.printout(emitter.emitLABEL(label_end, frame))
 
     
-    def visitForBasic(self, ast, o):
+    def switchCases(self, ast, o):
+        """Collects the leading links of an if-else-if chain comparing one int local with distinct constants.
+        Returns the local, the (value, statement) cases and the rest of the chain."""
+        all_symbols = [j for i in o['env'] for j in i]
+        subject = None
+        cases = []
+        while isinstance(ast, If) and isinstance(ast.expr, BinaryOp) and ast.expr.op == '==':
+            left, right = ast.expr.left, ast.expr.right
+            if isinstance(right, Id) and (subject == right or subject is None and self.cal_const(left, o) is not None):
+                left, right = right, left
+            value = self.cal_const(right, o)
+            if not isinstance(left, Id) or (subject is not None and left != subject) or not isinstance(value, int) \
+                    or isinstance(value, bool) or value in [case for case, _ in cases]:
+                break
+            sym = self.lookup(left.name, all_symbols, lambda x: x.name)
+            if not sym or not isinstance(sym.mtype, IntType) or not isinstance(sym.value, Index) or sym.const_value is not None:
+                break
+            subject = left
+            cases.append((value, ast.thenStmt))
+            ast = ast.elseStmt
+        return subject, cases, ast
+
+
+    def generateSwitch(self, subject, cases, default, o):
+        """Generates an if-else-if chain over int constants as a tableswitch or lookupswitch, chosen as javac does."""
         emitter = o['emitter']
         frame = o['frame']
+        cases = sorted(cases, key=lambda case: case[0])
+        keys = [value for value, _ in cases]
+        labels = [frame.getNewLabel() for _ in cases]
+        label_default = frame.getNewLabel()
+        label_end = frame.getNewLabel() if default else label_default
+
+        emitter.printout(self.visit(subject, o)[0])
+        table_cost = 4 + (keys[-1] - keys[0] + 1) + 3 * 3
+        lookup_cost = 3 + 2 * len(keys) + 3 * len(keys)
+        if table_cost <= lookup_cost:
+            table = [label_default] * (keys[-1] - keys[0] + 1)
+            for key, label in zip(keys, labels):
+                table[key - keys[0]] = label
+            emitter.printout(emitter.emitTABLESWITCH(keys[0], table, label_default, frame))
+        else:
+            emitter.printout(emitter.emitLOOKUPSWITCH(keys, labels, label_default, frame))
 
-        # Label for the start of the condition check (top of the loop)
-        label_condition = frame.getNewLabel()
-        # Label for the instruction immediately after the loop exits
-        label_exit = frame.getNewLabel()
+        for (_, stmt), label in zip(cases, labels):
+            emitter.printout(emitter.emitLABEL(label, frame))
+            self.visit(stmt, o)
+            emitter.printout(emitter.emitGOTO(label_end, frame))
+        emitter.printout(emitter.emitLABEL(label_default, frame))
+        if default:
+            self.visit(default, o)
+            emitter.printout(emitter.emitLABEL(label_end, frame))
 
-        frame.enterLoop(label_condition, label_exit)
-        emitter.printout(emitter.emitLABEL(label_condition, frame))
 
-        cond_code, _ = self.visit(ast.cond, o)
-        emitter.printout(cond_code)
+    def visitForBasic(self, ast, o):
+        emitter = o['emitter']
+        frame = o['frame']
 
-        emitter.printout(emitter.emitIFFALSE(label_exit, frame))
+        # Continue label is the start of the condition check (top of the loop),
+        # break label is the instruction immediately after the loop exits
+        frame.enterLoop()
+        label_condition = frame.getContinueLabel()
+        label_exit = frame.getBreakLabel()
+        accumulators = self.promoteStringAccumulators([ast.cond, ast.loop], o)
+        hoisted = self.hoistLoopInvariants(ast.cond, ast.loop, [], [], o,
+                                           lambda: self.generateCondJump(ast.cond, o, label_exit, False))
+        emitter.printout(emitter.emitLABEL(label_condition, frame))
+
+        emitter.printout(self.generateCondJump(ast.cond, o, label_exit, False))
         self.visit(ast.loop, o)
 
         emitter.printout(emitter.emitGOTO(label_condition, frame))
         emitter.printout(emitter.emitLABEL(label_exit, frame))
+        self.materializeStringAccumulators(accumulators, o)
+        self.releaseHoisted(hoisted, o)
         frame.exitLoop()
 
     
@@ -592,31 +1624,239 @@ class CodeGenerator(BaseVisitor,Utils):
 
         # Condition check label
         label_condition = frame.getNewLabel()
-        # Update label
-        label_update = frame.getNewLabel()
-        # Exit label
-        label_exit = frame.getNewLabel()
 
         local_symbols_for_loop = []
         env_for_loop = {'env': [local_symbols_for_loop] + o['env'],
                         'frame': frame,
                         'emitter': emitter}
 
+        # A variable introduced by the init clause is scoped to the loop
+        frame.enterScope(False)
+        emitter.printout(emitter.emitLABEL(frame.getStartLabel(), frame))
+        init_name = ast.init.varName if isinstance(ast.init, VarDecl) else ast.init.lhs.name
+        if isinstance(ast.init, VarDecl) or not self.lookup(init_name, [j for i in o['env'] for j in i], lambda x: x.name):
+            if isinstance(ast.init, VarDecl):
+                init_type = self.visit(ast.init.varType, env_for_loop) if ast.init.varType else self.probeType(ast.init.varInit, env_for_loop)
+            else:
+                init_type = self.probeType(ast.init.rhs, env_for_loop)
+            index = frame.getNewIndex()
+            local_symbols_for_loop.append(Symbol(init_name, init_type, Index(index)))
+            emitter.printout(emitter.emitVAR(index, init_name, init_type, frame.getStartLabel(), frame.getEndLabel(), frame))
+
         self.visit(ast.init, env_for_loop)
-        frame.enterLoop(label_update, label_exit)
+        values, factor = self.unrollPlan(ast, env_for_loop)
+        if factor and factor == len(values):
+            self.generateUnrolledLoop(ast, values, local_symbols_for_loop, env_for_loop)
+            emitter.printout(emitter.emitLABEL(frame.getEndLabel(), frame))
+            frame.exitScope()
+            return
+
+        # Continue jumps to the update, break to the loop exit
+        frame.enterLoop()
+        label_update = frame.getContinueLabel()
+        label_exit = frame.getBreakLabel()
+        accumulators = self.promoteStringAccumulators([ast.cond, ast.loop, ast.upda], env_for_loop)
+        inductions = self.reduceInductionExpressions(ast, env_for_loop)
+        hoisted = self.hoistLoopInvariants(ast.cond, ast.loop, [ast.upda], [], env_for_loop,
+                                           lambda: self.generateCondJump(ast.cond, env_for_loop, label_exit, False))
         emitter.printout(emitter.emitLABEL(label_condition, frame))
 
-        cond_code, _ = self.visit(ast.cond, env_for_loop)
-        emitter.printout(cond_code)
-        emitter.printout(emitter.emitIFFALSE(label_exit, frame))
-        self.visit(ast.loop, env_for_loop)
+        def update():
+            self.visit(ast.upda, env_for_loop)
+            for _, index, increment in inductions:
+                emitter.printout(self.generateLocalStep(index, increment, env_for_loop))
+
+        # A partially unrolled loop runs factor copies of the body per test while
+        # whole groups remain, then the leftover iterations after the exit
+        cond = ast.cond
+        if factor:
+            grouped = len(values) - len(values) % factor
+            cond = BinaryOp('<' if values[1] > values[0] else '>', ast.upda.lhs, IntLiteral(values[0] + grouped * (values[1] - values[0])))
+        emitter.printout(self.generateCondJump(cond, env_for_loop, label_exit, False))
+        for copy in range(factor or 1):
+            if copy:
+                update()
+            self.visit(ast.loop, env_for_loop)
 
         emitter.printout(emitter.emitLABEL(label_update, frame))
-        self.visit(ast.upda, env_for_loop)
+        update()
         emitter.printout(emitter.emitGOTO(label_condition, frame))
         emitter.printout(emitter.emitLABEL(label_exit, frame))
+        for _ in values[grouped:] if factor else []:
+            self.visit(ast.loop, env_for_loop)
+            update()
+        self.materializeStringAccumulators(accumulators, env_for_loop)
+        self.releaseHoisted(hoisted, env_for_loop)
         frame.exitLoop()
 
+        for induction in inductions:
+            self.reducedIndices.remove(induction)
+            frame.releaseIndex(induction[1])
+        emitter.printout(emitter.emitLABEL(frame.getEndLabel(), frame))
+        frame.exitScope()
+
+
+    def unrollPlan(self, ast, o):
+        """Returns the values the counter of a for loop takes and the number of body copies per test,
+        0 when the loop is not unrolled."""
+        all_symbols = [j for i in o['env'] for j in i]
+        cond = ast.cond
+        name = ast.upda.lhs.name if isinstance(ast.upda.lhs, Id) else None
+        sym = self.lookup(name, all_symbols, lambda x: x.name) if name else None
+        if not sym or not isinstance(sym.mtype, IntType) or not isinstance(sym.value, Index) or sym.builder:
+            return [], 0
+        if not isinstance(cond, BinaryOp) or cond.op not in ['<', '<=', '>', '>=', '!='] or cond.left != ast.upda.lhs:
+            return [], 0
+        if (ast.init.varName if isinstance(ast.init, VarDecl) else ast.init.lhs) != (name if isinstance(ast.init, VarDecl) else ast.upda.lhs):
+            return [], 0
+        start = self.cal_const(ast.init.varInit if isinstance(ast.init, VarDecl) else ast.init.rhs, o)
+        bound = self.cal_const(cond.right, o)
+        step = self.constantStep(ast.upda)
+        if not all(isinstance(value, int) and not isinstance(value, bool) for value in [start, bound, step]) or step == 0:
+            return [], 0
+
+        if cond.op in ['<', '<='] and step > 0:
+            count = max(0, -((start - bound) // step) if cond.op == '<' else (bound - start) // step + 1)
+        elif cond.op in ['>', '>='] and step < 0:
+            count = max(0, -((bound - start) // -step) if cond.op == '>' else (start - bound) // -step + 1)
+        elif cond.op == '!=' and (bound - start) % step == 0 and (bound - start) // step >= 0:
+            count = (bound - start) // step
+        else:
+            return [], 0
+        # The counter must not wrap on its way to the last value
+        if self.wrapInt(start + count * step) != start + count * step:
+            return [], 0
+
+        def exits(node):
+            if isinstance(node, (Break, Continue)):
+                return True
+            elif isinstance(node, (ForBasic, ForStep, ForEach)):
+                return False
+            elif isinstance(node, (list, tuple)):
+                return any(exits(item) for item in node)
+            return isinstance(node, AST) and any(exits(child) for child in vars(node).values())
+
+        written = False
+        for node in self.walkAST(ast.loop):
+            if isinstance(node, (Assign, CompoundAssign)) and node.lhs == ast.upda.lhs:
+                written = True
+            elif isinstance(node, VarDecl) and node.varName == name or isinstance(node, ConstDecl) and node.conName == name:
+                written = True
+            elif isinstance(node, ForEach) and name in [node.idx.name, node.value.name]:
+                written = True
+        if written or exits(ast.loop.member):
+            return [], 0
+
+        values = [start + copy * step for copy in range(count)]
+        size = len(list(self.walkAST(ast.loop)))
+        if count * size <= self.unrollBudget:
+            return values, count
+        for factor in [8, 4, 2]:
+            if factor * size <= self.unrollBudget and count >= 2 * factor:
+                return values, factor
+        return [], 0
+
+
+    def generateUnrolledLoop(self, ast, values, local_symbols, o):
+        """Generates a fully unrolled for loop, one copy of the body per value of the counter."""
+        emitter = o['emitter']
+        frame = o['frame']
+        sym = self.lookup(ast.upda.lhs.name, [j for i in o['env'] for j in i], lambda x: x.name)
+        for value in values:
+            sym.const_value = value
+            self.visit(ast.loop, o)
+        sym.const_value = None
+        if sym not in local_symbols and values:
+            step = self.constantStep(ast.upda)
+            emitter.printout(emitter.emitPUSHICONST(values[-1] + step, frame))
+            emitter.printout(emitter.emitWRITEVAR(sym.name, sym.mtype, sym.value.value, frame))
+
+
+    def reduceInductionExpressions(self, ast, o):
+        """Strength reduction of the index expressions of a for loop that are affine in the loop variable.
+        Returns the list of (expression, local index, increment)."""
+        emitter = o['emitter']
+        frame = o['frame']
+        all_symbols = [j for i in o['env'] for j in i]
+
+        if not isinstance(ast.upda.lhs, Id):
+            return []
+        step = self.constantStep(ast.upda)
+        induction_name = ast.upda.lhs.name
+        induction_sym = self.lookup(induction_name, all_symbols, lambda x: x.name)
+        if step is None or not isinstance(induction_sym.mtype, IntType) or not isinstance(induction_sym.value, Index):
+            return []
+
+        # Names written or redeclared anywhere in the loop are not invariant
+        written = set()
+        for node in self.walkAST([ast.cond, ast.loop]):
+            if isinstance(node, (Assign, CompoundAssign)) and isinstance(node.lhs, Id):
+                written.add(node.lhs.name)
+            elif isinstance(node, VarDecl):
+                written.add(node.varName)
+            elif isinstance(node, ConstDecl):
+                written.add(node.conName)
+            elif isinstance(node, ForEach):
+                written.update([node.idx.name, node.value.name])
+        if induction_name in written:
+            return []
+
+        def coefficient(expr):
+            # Coefficient of the loop variable in expr, None when expr is not affine in it
+            if isinstance(expr, IntLiteral):
+                return 0
+            elif isinstance(expr, Id) and expr.name == induction_name:
+                return 1
+            elif isinstance(expr, Id):
+                sym = self.lookup(expr.name, all_symbols, lambda x: x.name)
+                invariant = expr.name not in written and sym and isinstance(sym.value, Index) and isinstance(sym.mtype, IntType)
+                return 0 if invariant else None
+            elif isinstance(expr, UnaryOp) and expr.op == '-':
+                body = coefficient(expr.body)
+                return None if body is None else -body
+            elif isinstance(expr, BinaryOp) and expr.op in ['+', '-']:
+                left, right = coefficient(expr.left), coefficient(expr.right)
+                if left is None or right is None:
+                    return None
+                return left + right if expr.op == '+' else left - right
+            elif isinstance(expr, BinaryOp) and expr.op == '*':
+                left, right = coefficient(expr.left), coefficient(expr.right)
+                if left == 0 and right == 0:
+                    return 0
+                elif isinstance(expr.left, IntLiteral) and right is not None:
+                    return int(expr.left.value) * right
+                elif isinstance(expr.right, IntLiteral) and left is not None:
+                    return left * int(expr.right.value)
+            return None
+
+        inductions = []
+        for node in self.walkAST([ast.cond, ast.loop]):
+            if not isinstance(node, ArrayCell):
+                continue
+            for idx_expr in node.idx:
+                has_multiply = any(isinstance(n, BinaryOp) and n.op == '*' for n in self.walkAST(idx_expr))
+                if not has_multiply or idx_expr in [expr for expr, _, _ in inductions] or coefficient(idx_expr) in [None, 0]:
+                    continue
+                index = frame.getTempIndex()
+                emitter.printout(self.visit(idx_expr, o)[0])
+                emitter.printout(emitter.emitWRITEVAR("induction", IntType(), index, frame))
+                inductions.append((idx_expr, index, coefficient(idx_expr) * step))
+
+        self.reducedIndices.extend(inductions)
+        return inductions
+
+
+    def generateLocalStep(self, index, amount, o):
+        """Adds a constant to an int local, with iinc when the amount fits in a byte."""
+        emitter = o['emitter']
+        frame = o['frame']
+        if -128 <= amount <= 127 and index <= 255:
+            return emitter.emitIINC(index, amount, frame)
+        return ''.join([emitter.emitREADVAR("step", IntType(), index, frame),
+                        emitter.emitPUSHICONST(amount, frame),
+                        emitter.emitADDOP('+', IntType(), frame),
+                        emitter.emitWRITEVAR("step", IntType(), index, frame)])
+
 
     def visitForEach(self, ast, o):
         emitter = o['emitter']
@@ -624,38 +1864,44 @@ class CodeGenerator(BaseVisitor,Utils):
 
         idx_sym = None
         idx_name = ast.idx.name
-        if idx_name is not '_':
+        if idx_name != '_':
             idx_sym = self.lookup(idx_name, [j for i in o['env'] for j in i], lambda x: x.name)
         value_sym = self.lookup(ast.value.name, [j for i in o['env'] for j in i], lambda x: x.name)
 
         arr_code, arr_type = self.visit(ast.arr, o)
         emitter.printout(arr_code)
-        element_type = arr_type.eleType
+        element_type = self.indexedType(arr_type, 1, o)
 
         # Store array reference and get length
         emitter.printout(emitter.emitDUP(frame))
-        temp_array_ref_idx = frame.getNewIndex()
+        temp_array_ref_idx = frame.getTempIndex()
         emitter.printout(emitter.emitWRITEVAR("temp_arr_foreach", arr_type, temp_array_ref_idx, frame))
-        emitter.printout(emitter.emitARRAYLENGTH(arr_type, frame))
-        temp_length_idx = frame.getNewIndex()
+        emitter.printout(emitter.emitARRAYLENGTH(frame))
+        temp_length_idx = frame.getTempIndex()
         emitter.printout(emitter.emitWRITEVAR("temp_len_foreach", IntType(), temp_length_idx, frame))
 
         # Initialize hidden index counter to 0
-        temp_counter_idx = frame.getNewIndex()
+        temp_counter_idx = frame.getTempIndex()
         emitter.printout(emitter.emitPUSHICONST(0, frame))
         emitter.printout(emitter.emitWRITEVAR("temp_idx_foreach", IntType(), temp_counter_idx, frame))
 
         # Labels
         label_condition = frame.getNewLabel()
-        label_continue = frame.getNewLabel()
-        label_exit = frame.getNewLabel()
+        frame.enterLoop()
+        label_continue = frame.getContinueLabel()
+        label_exit = frame.getBreakLabel()
+        # The range clause stores idx and value directly, so they cannot be promoted
+        accumulators = self.promoteStringAccumulators([ast.loop], o, [idx_name, ast.value.name])
+        hoisted = self.hoistLoopInvariants(None, ast.loop, [], [idx_name, ast.value.name], o,
+                                           lambda: ''.join([emitter.emitREADVAR("temp_idx_foreach", IntType(), temp_counter_idx, frame),
+                                                            emitter.emitREADVAR("temp_len_foreach", IntType(), temp_length_idx, frame),
+                                                            emitter.emitIFICMPGE(label_exit, frame)]))
 
-        frame.enterLoop(label_continue, label_exit)
         emitter.printout(emitter.emitLABEL(label_condition, frame))
         # Check if index < length
         emitter.printout(emitter.emitREADVAR("temp_idx_foreach", IntType(), temp_counter_idx, frame))
         emitter.printout(emitter.emitREADVAR("temp_len_foreach", IntType(), temp_length_idx, frame))
-        emitter.printout(emitter.emitIF_ICMPGE(label_exit, frame))
+        emitter.printout(emitter.emitIFICMPGE(label_exit, frame))
 
         # Assign current counter value to 'idx' variable (IF NOT BLANK)
         if idx_sym:
@@ -666,13 +1912,16 @@ class CodeGenerator(BaseVisitor,Utils):
                 emitter.printout(emitter.emitPUTSTATIC(f"{idx_sym.value.value}/{idx_name}", IntType(), frame))
 
         # Assign current element value to the pre-declared 'value' variable
-        emitter.printout(emitter.emitREADVAR("temp_arr_foreach", arr_type, temp_array_ref_idx, frame))
-        emitter.printout(emitter.emitREADVAR("temp_idx_foreach", IntType(), temp_counter_idx, frame))
-        emitter.printout(emitter.emitALOAD(element_type, frame))
-        if isinstance(value_sym.value, Index):
-            emitter.printout(emitter.emitWRITEVAR(value_sym.name, element_type, value_sym.value.value, frame))
-        elif isinstance(value_sym.value, CName):
-            emitter.printout(emitter.emitPUTSTATIC(f"{value_sym.value.value}/{value_sym.name}", element_type, frame))
+        # Stores to unread locals are removed from the final code, but the element load is only known
+        # to stay in bounds here, so it is skipped here when the function never reads the variable
+        if not (isinstance(value_sym.value, Index) and self.neverRead(ast.value.name, ast)):
+            emitter.printout(emitter.emitREADVAR("temp_arr_foreach", arr_type, temp_array_ref_idx, frame))
+            emitter.printout(emitter.emitREADVAR("temp_idx_foreach", IntType(), temp_counter_idx, frame))
+            emitter.printout(emitter.emitALOAD(element_type, frame))
+            if isinstance(value_sym.value, Index):
+                emitter.printout(emitter.emitWRITEVAR(value_sym.name, element_type, value_sym.value.value, frame))
+            elif isinstance(value_sym.value, CName):
+                emitter.printout(emitter.emitPUTSTATIC(f"{value_sym.value.value}/{value_sym.name}", element_type, frame))
 
         # Body
         self.visit(ast.loop, o)
@@ -681,13 +1930,343 @@ class CodeGenerator(BaseVisitor,Utils):
         emitter.printout(emitter.emitIINC(temp_counter_idx, 1, frame))
         emitter.printout(emitter.emitGOTO(label_condition, frame))
         emitter.printout(emitter.emitLABEL(label_exit, frame))
+        self.materializeStringAccumulators(accumulators, o)
+        self.releaseHoisted(hoisted, o)
         frame.exitLoop()
+        # The hidden temporaries are dead once the loop exits
+        frame.releaseIndex(temp_array_ref_idx)
+        frame.releaseIndex(temp_length_idx)
+        frame.releaseIndex(temp_counter_idx)
+
+
+    def neverRead(self, name, ast):
+        """Checks whether no variable called name is read anywhere in the function or method being generated."""
+        decl = self.tailCall[0] if self.tailCall else None
+        body = decl.body if isinstance(decl, FuncDecl) else decl.fun.body if decl else None
+        if body is None or not any(node is ast for node in self.walkAST(body)):
+            return False
+        writes = [node.lhs for node in self.walkAST(body) if isinstance(node, Assign)]
+        writes += [target for node in self.walkAST(body) if isinstance(node, ForEach) for target in [node.idx, node.value]]
+        return not any(isinstance(node, Id) and node.name == name and not any(node is target for target in writes)
+                       for node in self.walkAST(body))
+
+
+    def hoistLoopInvariants(self, cond, body, later, loop_written, o, guard):
+        """Loop-invariant code motion into hidden locals, for a loop testing cond before each iteration and running
+        later after it. Returns the hoisted entries for releaseHoisted."""
+        emitter = o['emitter']
+        frame = o['frame']
+        all_symbols = [j for i in o['env'] for j in i]
+        loop_parts = [cond, body, later]
+
+        written = set(loop_written)
+        written_fields = set()
+        stored_cells = []
+        calls = False
+        for node in self.walkAST(loop_parts):
+            if isinstance(node, (Assign, CompoundAssign)):
+                target = node.lhs
+                if isinstance(target, Id):
+                    written.add(target.name)
+                elif isinstance(target, FieldAccess):
+                    written_fields.add(target.field)
+                elif isinstance(target, ArrayCell):
+                    stored_cells.append(target)
+            elif isinstance(node, VarDecl):
+                written.add(node.varName)
+            elif isinstance(node, ConstDecl):
+                written.add(node.conName)
+            elif isinstance(node, ForEach):
+                written.update([node.idx.name, node.value.name])
+            elif isinstance(node, FuncCall):
+                sym = self.lookup(node.funName, all_symbols, lambda x: x.name)
+                calls = calls or not (sym and isinstance(sym.value, CName) and sym.value.value == "io")
+            elif isinstance(node, MethCall):
+                calls = True
+
+        # Element type of every array store, None when the stored array is not known
+        def storeType(cell):
+            if isinstance(cell.arr, Id) and cell.arr.name not in written:
+                sym = self.lookup(cell.arr.name, all_symbols, lambda x: x.name)
+                if sym and isinstance(sym.mtype, ArrayType):
+                    return self.indexedType(sym.mtype, len(cell.idx), o)
+            return None
+        stored_types = [storeType(cell) for cell in stored_cells]
+
+        def invariant(expr):
+            if isinstance(expr, (IntLiteral, FloatLiteral, StringLiteral, BooleanLiteral)):
+                return True
+            elif isinstance(expr, Id):
+                sym = self.lookup(expr.name, all_symbols, lambda x: x.name)
+                if not sym or expr.name in written or sym.builder:
+                    return False
+                if sym.const_value is not None:
+                    return True
+                return isinstance(sym.value, Index) or (self.isProgramMember(sym.value) and not calls)
+            elif isinstance(expr, BinaryOp):
+                return invariant(expr.left) and invariant(expr.right)
+            elif isinstance(expr, UnaryOp):
+                return invariant(expr.body)
+            elif isinstance(expr, FieldAccess):
+                return not calls and expr.field not in written_fields and invariant(expr.receiver)
+            elif isinstance(expr, ArrayCell):
+                if calls or not invariant(expr.arr) or not all(invariant(idx) for idx in expr.idx):
+                    return False
+                loaded_type = self.probeType(expr, o)
+                return not any(mayAlias(stored, loaded_type) for stored in stored_types)
+            return False
+
+        def mayAlias(stored, loaded):
+            # Whether storing an element of type stored can change a loaded element
+            if stored is None or isinstance(stored, (StructType, InterfaceType)) or isinstance(loaded, (StructType, InterfaceType)):
+                return True
+            if isinstance(stored, ArrayType) and isinstance(loaded, ArrayType):
+                return len(stored.dimens) == len(loaded.dimens) and mayAlias(self.elementType(stored, o), self.elementType(loaded, o))
+            return type(stored) is type(loaded)
+
+        def traps(expr):
+            # These are only hoisted where the loop would have evaluated them before any call or exit
+            return any(isinstance(node, (FieldAccess, ArrayCell)) or (isinstance(node, BinaryOp) and node.op in ['/', '%'])
+                       for node in self.walkAST(expr))
+
+        def calls_in(node):
+            return any(isinstance(n, (FuncCall, MethCall)) for n in self.walkAST(node))
+
+        known = [expr for expr, _, _ in self.hoisted] + [expr for expr, _, _ in self.reducedIndices]
+        candidates = []
+        def consider(expr, conditional):
+            # Records expr when it can be hoisted; returns False to look inside it instead
+            if expr in known or expr in [c for c, _ in candidates]:
+                return True
+            if isinstance(expr, (IntLiteral, FloatLiteral, StringLiteral, BooleanLiteral)):
+                return True
+            if isinstance(expr, Id):
+                sym = self.lookup(expr.name, all_symbols, lambda x: x.name)
+                if not (sym and isinstance(sym.value, CName) and sym.const_value is None and invariant(expr)):
+                    return True
+            elif not invariant(expr):
+                return False
+            if traps(expr) and conditional:
+                return False
+            candidates.append((expr, traps(expr)))
+            return True
+
+        def scanExpr(expr, conditional):
+            if expr is None or consider(expr, conditional):
+                return
+            if isinstance(expr, BinaryOp):
+                scanExpr(expr.left, conditional)
+                scanExpr(expr.right, conditional or expr.op in ['&&', '||'])
+            elif isinstance(expr, UnaryOp):
+                scanExpr(expr.body, conditional)
+            elif isinstance(expr, FieldAccess):
+                scanExpr(expr.receiver, conditional)
+            elif isinstance(expr, ArrayCell):
+                scanCell(expr, conditional)
+            elif isinstance(expr, FuncCall):
+                for arg in expr.args:
+                    scanExpr(arg, conditional)
+            elif isinstance(expr, MethCall):
+                scanExpr(expr.receiver, conditional)
+                for arg in expr.args:
+                    scanExpr(arg, conditional)
+
+        def scanCell(cell, conditional):
+            # The longest invariant row of a multi-dimensional cell is hoisted as a unit
+            for depth in range(len(cell.idx) - 1, 0, -1):
+                row = ArrayCell(cell.arr, cell.idx[:depth])
+                if consider(row, conditional) and (row in known or row in [c for c, _ in candidates]):
+                    for idx in cell.idx[depth:]:
+                        scanExpr(idx, conditional)
+                    return
+            scanExpr(cell.arr, conditional)
+            for idx in cell.idx:
+                scanExpr(idx, conditional)
+
+        def scanStmt(stmt, conditional):
+            if isinstance(stmt, Block):
+                for member in stmt.member:
+                    unsafe = conditional or calls_in(member) or not isinstance(member, (Assign, CompoundAssign, VarDecl, ConstDecl))
+                    scanStmt(member, conditional or calls_in(member))
+                    conditional = unsafe
+            elif isinstance(stmt, (Assign, CompoundAssign)):
+                if isinstance(stmt.lhs, ArrayCell):
+                    # The stored cell is not a read, but the row holding it is
+                    cell = stmt.lhs
+                    scanExpr(ArrayCell(cell.arr, cell.idx[:-1]) if len(cell.idx) > 1 else cell.arr, conditional)
+                    scanExpr(cell.idx[-1], conditional)
+                elif isinstance(stmt.lhs, FieldAccess):
+                    scanExpr(stmt.lhs.receiver, conditional)
+                scanExpr(stmt.rhs, conditional)
+            elif isinstance(stmt, VarDecl):
+                scanExpr(stmt.varInit, conditional)
+            elif isinstance(stmt, ConstDecl):
+                scanExpr(stmt.iniExpr, conditional)
+            elif isinstance(stmt, Return):
+                scanExpr(stmt.expr, conditional)
+            elif isinstance(stmt, If):
+                scanExpr(stmt.expr, conditional)
+                scanStmt(stmt.thenStmt, True)
+                scanStmt(stmt.elseStmt, True)
+            elif isinstance(stmt, ForBasic):
+                scanExpr(stmt.cond, conditional)
+                scanStmt(stmt.loop, True)
+            elif isinstance(stmt, ForStep):
+                scanStmt(stmt.init, conditional)
+                scanExpr(stmt.cond, conditional)
+                scanStmt(stmt.upda, True)
+                scanStmt(stmt.loop, True)
+            elif isinstance(stmt, ForEach):
+                scanExpr(stmt.arr, conditional)
+                scanStmt(stmt.loop, True)
+            elif isinstance(stmt, (FuncCall, MethCall)):
+                scanExpr(stmt, conditional)
+
+        # Without calls in the loop test the test can be repeated as the guard
+        test_calls = cond is not None and calls_in(cond)
+        scanExpr(cond, test_calls)
+        test_candidates = len(candidates)
+        scanStmt(body, test_calls)
+        for stmt in later:
+            scanStmt(stmt, True)
+
+        if not candidates:
+            return []
+        if any(may_trap for _, may_trap in candidates[test_candidates:]):
+            emitter.printout(guard())
+        hoisted = []
+        for expr, _ in candidates:
+            expr_code, expr_type = self.visit(expr, o)
+            index = frame.getTempIndex()
+            emitter.printout(expr_code)
+            emitter.printout(emitter.emitWRITEVAR("hoisted", expr_type, index, frame))
+            hoisted.append((expr, index, expr_type))
+            self.hoisted.append((expr, index, expr_type))
+        return hoisted
+
+
+    def releaseHoisted(self, hoisted, o):
+        """Drops the hoisted expressions of a loop once it has been generated."""
+        for entry in hoisted:
+            self.hoisted.remove(entry)
+            o['frame'].releaseIndex(entry[1])
+
+
+    def readHoisted(self, ast, o):
+        """Returns (code, type) reading the local that holds ast when an enclosing loop
+        hoisted an equal expression, otherwise None."""
+        for expr, index, expr_type in reversed(self.hoisted):
+            if expr == ast:
+                return o['emitter'].emitREADVAR("hoisted", expr_type, index, o['frame']), expr_type
+        return None
+
+
+    def walkAST(self, node):
+        """Yields node and every AST node below it in source order."""
+        if isinstance(node, (list, tuple)):
+            for item in node:
+                yield from self.walkAST(item)
+        elif isinstance(node, AST):
+            yield node
+            for child in vars(node).values():
+                yield from self.walkAST(child)
+
+
+    def isSelfAppend(self, ast):
+        """Checks whether an assignment has the form s += ... or s := s + ... on a plain variable."""
+        if not isinstance(ast.lhs, Id):
+            return False
+        if isinstance(ast, CompoundAssign):
+            return ast.op == '+'
+        if not isinstance(ast.rhs, BinaryOp) or ast.rhs.op != '+':
+            return False
+        leftmost = ast.rhs
+        while isinstance(leftmost, BinaryOp) and leftmost.op == '+':
+            leftmost = leftmost.left
+        return isinstance(leftmost, Id) and leftmost.name == ast.lhs.name
+
+
+    def promoteStringAccumulators(self, loop_parts, o, excluded_names=[]):
+        """Moves the string locals that a loop appends to into hidden StringBuilder locals for the duration
+        of the loop. Returns the promoted symbols."""
+        emitter = o['emitter']
+        frame = o['frame']
+        builder_type = ClassType("java/lang/StringBuilder")
+
+        appended = []
+        excluded = set(excluded_names)
+        for node in self.walkAST(loop_parts):
+            if isinstance(node, (Assign, CompoundAssign)) and self.isSelfAppend(node):
+                appended.append(node.lhs.name)
+            elif isinstance(node, VarDecl):
+                excluded.add(node.varName)
+            elif isinstance(node, ConstDecl):
+                excluded.add(node.conName)
+            elif isinstance(node, ForEach):
+                excluded.update([node.idx.name, node.value.name])
+
+        accumulators = []
+        for name in dict.fromkeys(appended):
+            sym = self.lookup(name, [j for i in o['env'] for j in i], lambda x: x.name)
+            if name in excluded or not sym or sym.builder or not isinstance(sym.mtype, StringType) or not isinstance(sym.value, Index):
+                continue
+            builder_index = frame.getTempIndex()
+            emitter.printout(emitter.emitNEW(builder_type.name, frame))
+            emitter.printout(emitter.emitDUP(frame))
+            emitter.printout(emitter.emitREADVAR(name, sym.mtype, sym.value.value, frame))
+            emitter.printout(emitter.emitINVOKESPECIAL(frame, f"{builder_type.name}/<init>", MType([StringType()], VoidType())))
+            emitter.printout(emitter.emitWRITEVAR(name, builder_type, builder_index, frame))
+            sym.builder = Index(builder_index)
+            accumulators.append(sym)
+        return accumulators
+
+
+    def materializeStringAccumulators(self, accumulators, o):
+        """Stores the final value of each promoted accumulator back into its variable
+        at the loop exit and releases the builder."""
+        emitter = o['emitter']
+        frame = o['frame']
+        for sym in accumulators:
+            emitter.printout(emitter.emitREADVAR(sym.name, ClassType("java/lang/StringBuilder"), sym.builder.value, frame))
+            emitter.printout(emitter.emitINVOKEVIRTUAL("java/lang/StringBuilder/toString", MType([], StringType()), frame))
+            emitter.printout(emitter.emitWRITEVAR(sym.name, sym.mtype, sym.value.value, frame))
+            frame.releaseIndex(sym.builder.value)
+            sym.builder = None
+
+
+    def generateBuilderAssign(self, ast, sym, o):
+        """Assignment to a promoted accumulator: s := s + ... appends to the builder, any other value replaces it."""
+        emitter = o['emitter']
+        frame = o['frame']
+        builder_type = ClassType("java/lang/StringBuilder")
+        result_code = []
+
+        appended = None
+        if isinstance(ast, CompoundAssign) and self.isSelfAppend(ast):
+            appended = self.concatSegments(ast.rhs)
+        elif self.isSelfAppend(ast):
+            appended = self.concatSegments(ast.rhs)[1:]
+        if appended is not None and any(isinstance(node, Id) and node.name == sym.name for node in self.walkAST(appended)):
+            appended = None
+
+        if appended is not None:
+            result_code.append(emitter.emitREADVAR(sym.name, builder_type, sym.builder.value, frame))
+            result_code.append(self.generateAppends(appended, o))
+            result_code.append(emitter.emitPOP(frame))
+        else:
+            result_code.append(emitter.emitNEW(builder_type.name, frame))
+            result_code.append(emitter.emitDUP(frame))
+            value = BinaryOp(ast.op, ast.lhs, ast.rhs) if isinstance(ast, CompoundAssign) else ast.rhs
+            result_code.append(self.visit(value, o)[0])
+            result_code.append(emitter.emitINVOKESPECIAL(frame, f"{builder_type.name}/<init>", MType([StringType()], VoidType())))
+            result_code.append(emitter.emitWRITEVAR(sym.name, builder_type, sym.builder.value, frame))
+        return ''.join(result_code)
 
 
     def visitBreak(self, ast, o):
         frame = o['frame']
         emitter = o['emitter']
-        emitter.printout(emitter.emitGOTO(frame.getEndLabel(), frame))
+        emitter.printout(emitter.emitGOTO(frame.getBreakLabel(), frame))
 
 
     def visitContinue(self, ast, o):
@@ -699,52 +2278,165 @@ class CodeGenerator(BaseVisitor,Utils):
     def visitReturn(self, ast, o):
         frame = o['frame']
         emitter = o['emitter']
-        if ast.expr:
+        if self.inlineExits:
+            # Return of an inlined body: leave the value on the stack and jump past the body
+            exit_label, ret_type = self.inlineExits[-1]
+            if ast.expr:
+                expr_code, expr_type = self.visit(ast.expr, o)
+                emitter.printout(expr_code)
+                if isinstance(ret_type, FloatType) and isinstance(expr_type, IntType):
+                    emitter.printout(emitter.emitI2F(frame))
+                frame.pop()
+            emitter.printout(''.join(self.generateGlobalWriteBack(sym, local, o) for sym, local in self.promotedGlobals))
+            emitter.printout(emitter.emitGOTO(exit_label, frame))
+        elif self.isSelfTailCall(ast.expr, o):
+            self.generateTailCall(ast.expr, o)
+        elif ast.expr:
             expr_code, expr_type = self.visit(ast.expr, o)
             emitter.printout(expr_code)
+            emitter.printout(''.join(self.generateGlobalWriteBack(sym, local, o) for sym, local in self.promotedGlobals))
             emitter.printout(emitter.emitRETURN(expr_type, frame))
         else:
+            emitter.printout(''.join(self.generateGlobalWriteBack(sym, local, o) for sym, local in self.promotedGlobals))
             emitter.printout(emitter.emitRETURN(VoidType(), frame))
         
 
-    def visitId(self, ast, o):
+    def isSelfTailCall(self, ast, o):
+        """Checks whether a returned expression calls the function or method being generated on a receiver of its own type."""
+        if not self.tailCall:
+            return False
+        decl = self.tailCall[0]
+        if isinstance(decl, FuncDecl):
+            return isinstance(ast, FuncCall) and ast.funName == decl.name
+        if not isinstance(ast, MethCall) or ast.metName != decl.fun.name:
+            return False
+        receiver_type = self.probeType(ast.receiver, o)
+        return isinstance(receiver_type, StructType) and receiver_type.name == decl.recType.name
+
+
+    def generateTailCall(self, ast, o):
+        """Replaces a self-recursive call in tail position by a jump to the start of the method."""
         emitter = o['emitter']
         frame = o['frame']
+        _, start_label, params = self.tailCall
+        values = ([ast.receiver] if isinstance(ast, MethCall) else []) + ast.args
+
+        assignments = []
+        for param, value in zip(params, values):
+            if isinstance(value, Id) and self.lookup(value.name, [j for i in o['env'] for j in i], lambda x: x.name) is param and not param.builder:
+                # Argument passed on unchanged
+                continue
+            value_code, value_type = self.visit(value, o)
+            emitter.printout(value_code)
+            if param is params[0] and isinstance(ast, MethCall):
+                # The call would have failed on a nil receiver
+                emitter.printout(emitter.emitDUP(frame))
+                emitter.printout(emitter.emitINVOKEVIRTUAL("java/lang/Object/getClass", MType([], ClassType("java/lang/Class")), frame))
+                emitter.printout(emitter.emitPOP(frame))
+            if isinstance(param.mtype, FloatType) and isinstance(value_type, IntType):
+                emitter.printout(emitter.emitI2F(frame))
+            temp = frame.getTempIndex()
+            emitter.printout(emitter.emitWRITEVAR(param.name, param.mtype, temp, frame))
+            assignments.append((param, temp))
+
+        for param, temp in assignments:
+            emitter.printout(emitter.emitREADVAR(param.name, param.mtype, temp, frame))
+            emitter.printout(emitter.emitWRITEVAR(param.name, param.mtype, param.value.value, frame))
+            frame.releaseIndex(temp)
+        emitter.printout(emitter.emitGOTO(start_label, frame))
+
 
+    def visitId(self, ast, o):
         sym = self.lookup(ast.name, [j for i in o['env'] for j in i], lambda x: x.name)
         sym_type = sym.mtype
         location = sym.value
+        if isinstance(location, CName) and location.value == ast.name:
+            # Name of a struct or interface used as a type
+            return sym_type
+
+        emitter = o['emitter']
+        frame = o['frame']
 
-        if isinstance(location, Index):
+        if sym.const_value is not None:
+            return self.generateConstant(sym.const_value, sym_type, o), sym_type
+        elif sym.builder:
+            # Promoted string accumulator: materialize the current value from its builder
+            read_code = emitter.emitREADVAR(ast.name, ClassType("java/lang/StringBuilder"), sym.builder.value, frame)
+            read_code += emitter.emitINVOKEVIRTUAL("java/lang/StringBuilder/toString", MType([], StringType()), frame)
+            return read_code, sym_type
+        elif isinstance(location, Index):
             read_code = emitter.emitREADVAR(ast.name, sym_type, location.value, frame)
             return read_code, sym_type
-        elif isinstance(location, CName) and location.value == self.className:
+        elif self.isProgramMember(location):
+            hoisted = self.readHoisted(ast, o)
+            if hoisted:
+                return hoisted
             read_code = emitter.emitGETSTATIC(f"{location.value}/{ast.name}", sym_type, frame)
             return read_code, sym_type
 
     
     def visitArrayCell(self, ast, o):
+        frame = o['frame']
+        emitter = o['emitter']
+        numbered = self.readValueNumber(ast, o)
+        if numbered:
+            return numbered
+        hoisted = self.readHoisted(ast, o)
+        if hoisted:
+            return hoisted
+        address_code, element_type = self.generateCellAddress(ast, o)
+        return address_code + emitter.emitALOAD(element_type, frame), element_type
+
+
+    def generateCellAddress(self, ast, o):
+        """Pushes the innermost array reference and the last index of an array cell.
+        Returns the code and the element type of the cell."""
         frame = o['frame']
         emitter = o['emitter']
         result_code = []
-        arr_code, arr_type = self.visit(ast.arr, o)
-        result_code.append(arr_code)
-
-        current_type = arr_type
-        for i, idx_expr in enumerate(ast.idx):
-            idx_code, _ = self.visit(idx_expr, o)
-            result_code.append(idx_code)
-            element_type_to_load = current_type.eleType
-            result_code.append(emitter.emitALOAD(element_type_to_load, frame))
-            current_type = element_type_to_load
-
-        final_element_type = current_type
-        return ''.join(result_code), final_element_type
+        start = 0
+        # A row hoisted out of the loop replaces the leading subscripts
+        for depth in range(len(ast.idx) - 1, 0, -1):
+            hoisted = self.readHoisted(ArrayCell(ast.arr, ast.idx[:depth]), o)
+            if hoisted:
+                start = depth
+                result_code.append(hoisted[0])
+                arr_type = self.probeType(ast.arr, o)
+                break
+        else:
+            arr_code, arr_type = self.visit(ast.arr, o)
+            result_code.append(arr_code)
+
+        for depth, idx_expr in enumerate(ast.idx[start:], start):
+            if depth > start:
+                result_code.append(emitter.emitALOAD(self.indexedType(arr_type, depth, o), frame))
+            reduced = [index for expr, index, _ in self.reducedIndices if expr == idx_expr]
+            if reduced:
+                result_code.append(emitter.emitREADVAR("induction", IntType(), reduced[-1], frame))
+            else:
+                result_code.append(self.visit(idx_expr, o)[0])
+        return ''.join(result_code), self.indexedType(arr_type, len(ast.idx), o)
+
+
+    def indexedType(self, arr_type, depth, o):
+        """Type of a value of arr_type after depth subscripts."""
+        if depth < len(arr_type.dimens):
+            return ArrayType(arr_type.dimens[depth:], arr_type.eleType)
+        return self.elementType(arr_type, o)
     
 
     def visitFieldAccess(self, ast, o):
         frame = o['frame']
         emitter = o['emitter']
+        numbered = self.readValueNumber(ast, o)
+        if numbered:
+            return numbered
+        hoisted = self.readHoisted(ast, o)
+        if hoisted:
+            return hoisted
+        scalar = self.scalarField(ast, o)
+        if scalar:
+            return emitter.emitREADVAR(ast.field, scalar[1], scalar[0], frame), scalar[1]
         result_code = []
         receiver_code, receiver_type = self.visit(ast.receiver, o)
         result_code.append(receiver_code)
@@ -762,7 +2454,22 @@ class CodeGenerator(BaseVisitor,Utils):
     def visitBinaryOp(self, ast, o):
         emitter = o['emitter']
         frame = o['frame']
+        hoisted = self.readHoisted(ast, o)
+        if hoisted:
+            return hoisted
         op = ast.op
+        if op in ['&&', '||']:
+            # Logical operators short-circuit, so the right operand is not evaluated up front
+            return self.generateBoolValue(ast, o), BoolType()
+
+        if op == '+':
+            # Both operands of + share one type, so the leftmost operand tells a string chain
+            leftmost = ast.left
+            while isinstance(leftmost, BinaryOp) and leftmost.op == '+':
+                leftmost = leftmost.left
+            if isinstance(self.probeType(leftmost, o), StringType):
+                return self.generateStringConcat(ast, o), StringType()
+
         left_code, left_type = self.visit(ast.left, o)
         right_code, right_type = self.visit(ast.right, o)
         result_code = []
@@ -781,12 +2488,8 @@ class CodeGenerator(BaseVisitor,Utils):
                 else:
                     result_code.append(left_code)
                     result_code.append(right_code)
+                result_type = FloatType()
             
-            elif op == '+' and isinstance(left_type, StringType) and isinstance(right_type, StringType):
-                result_code.append(left_code)
-                result_code.append(right_code)
-                result_type = StringType()
-
             elif isinstance(left_type, IntType) and isinstance(right_type, IntType):
                 result_code.append(left_code)
                 result_code.append(right_code)
@@ -804,15 +2507,6 @@ class CodeGenerator(BaseVisitor,Utils):
             result_code.append(left_code)
             result_code.append(right_code)
             result_code.append(emitter.emitREOP(op, left_type, frame))
-
-        elif op in ['&&', '||']:
-            result_type = BoolType()
-            result_code.append(left_code)
-            result_code.append(right_code)
-            if op == '&&':
-                result_code.append(emitter.emitANDOP(frame))
-            elif op == '||':
-                result_code.append(emitter.emitOROP(frame))
         
         return ''.join(result_code), result_type
     
@@ -820,7 +2514,13 @@ class CodeGenerator(BaseVisitor,Utils):
     def visitUnaryOp(self, ast, o):
         emitter = o['emitter']
         frame = o['frame']
+        hoisted = self.readHoisted(ast, o)
+        if hoisted:
+            return hoisted
         op = ast.op
+        if op == '!':
+            return self.generateBoolValue(ast, o), BoolType()
+
         body_code, body_type = self.visit(ast.body, o)
         result_code = []
         result_type = None
@@ -828,16 +2528,134 @@ class CodeGenerator(BaseVisitor,Utils):
         if op == '-':
             result_type = body_type
             result_code.append(body_code)
-            emitter.append(emitter.emitNEGOP(body_type, frame))
-
-        elif op == '!':
-            result_type = BoolType()
-            result_code.append(body_code)
-            emitter.append(emitter.emitNOT(body_type, frame))
+            result_code.append(emitter.emitNEGOP(body_type, frame))
 
         return ''.join(result_code), result_type
 
 
+    def generateStringConcat(self, ast, o):
+        """Lowers a whole chain of string + into one StringBuilder, joining adjacent literals at compile time."""
+        emitter = o['emitter']
+        frame = o['frame']
+        builder_type = ClassType("java/lang/StringBuilder")
+        result_code = []
+
+        segments = self.concatSegments(ast)
+        if len(segments) == 1 and isinstance(segments[0], str):
+            return emitter.emitPUSHSTRING(segments[0], frame)
+
+        result_code.append(emitter.emitNEW(builder_type.name, frame))
+        result_code.append(emitter.emitDUP(frame))
+        result_code.append(emitter.emitINVOKESPECIAL(frame, f"{builder_type.name}/<init>", MType([], VoidType())))
+        result_code.append(self.generateAppends(segments, o))
+        result_code.append(emitter.emitINVOKEVIRTUAL(f"{builder_type.name}/toString", MType([], StringType()), frame))
+        return ''.join(result_code)
+
+
+    def concatSegments(self, ast):
+        """Returns the operands of a string + chain in evaluation order, with the
+        text of adjacent literals joined into one str."""
+        segments = []
+        def flatten(node):
+            if isinstance(node, BinaryOp) and node.op == '+':
+                flatten(node.left)
+                flatten(node.right)
+            elif isinstance(node, StringLiteral) and segments and isinstance(segments[-1], str):
+                segments[-1] += self.stringLiteralText(node)
+            elif isinstance(node, StringLiteral):
+                segments.append(self.stringLiteralText(node))
+            else:
+                segments.append(node)
+        flatten(ast)
+        return segments
+
+
+    def generateAppends(self, segments, o):
+        """Appends each segment to the StringBuilder on top of the stack, leaving it there."""
+        emitter = o['emitter']
+        frame = o['frame']
+        builder_type = ClassType("java/lang/StringBuilder")
+        result_code = []
+        for segment in segments:
+            if isinstance(segment, str):
+                result_code.append(emitter.emitPUSHSTRING(segment, frame))
+            else:
+                result_code.append(self.visit(segment, o)[0])
+            result_code.append(emitter.emitINVOKEVIRTUAL(f"{builder_type.name}/append", MType([StringType()], builder_type), frame))
+        return ''.join(result_code)
+
+
+    def generateCondJump(self, ast, o, label, jumpIfTrue):
+        """Generates code that jumps to label when the boolean expression ast evaluates to jumpIfTrue."""
+        emitter = o['emitter']
+        frame = o['frame']
+        result_code = []
+
+        hoisted = self.readHoisted(ast, o)
+        if hoisted:
+            # Computed before the loop, only the stored value is tested
+            result_code.append(hoisted[0])
+            result_code.append(emitter.emitIFTRUE(label, frame) if jumpIfTrue else emitter.emitIFFALSE(label, frame))
+
+        elif isinstance(ast, UnaryOp) and ast.op == '!':
+            return self.generateCondJump(ast.body, o, label, not jumpIfTrue)
+
+        elif isinstance(ast, BinaryOp) and ast.op in ['&&', '||']:
+            # '&&' is decided by a false operand, '||' by a true one
+            deciding_value = ast.op == '||'
+            if jumpIfTrue == deciding_value:
+                # Either operand alone can take the jump
+                result_code.append(self.generateCondJump(ast.left, o, label, jumpIfTrue))
+                result_code.append(self.generateCondJump(ast.right, o, label, jumpIfTrue))
+            else:
+                # A deciding left operand skips the right one without jumping
+                label_skip = frame.getNewLabel()
+                result_code.append(self.generateCondJump(ast.left, o, label_skip, deciding_value))
+                result_code.append(self.generateCondJump(ast.right, o, label, jumpIfTrue))
+                result_code.append(emitter.emitLABEL(label_skip, frame))
+
+        elif isinstance(ast, BooleanLiteral):
+            if ast.value == jumpIfTrue:
+                result_code.append(emitter.emitGOTO(label, frame))
+
+        elif isinstance(ast, BinaryOp) and ast.op in negated_relops:
+            left_code, left_type = self.visit(ast.left, o)
+            right_code, _ = self.visit(ast.right, o)
+            op = ast.op if jumpIfTrue else negated_relops[ast.op]
+            result_code.append(left_code)
+            result_code.append(right_code)
+            result_code.append(emitter.emitIFRELOP(op, left_type, label, frame))
+
+        else:
+            cond_code, _ = self.visit(ast, o)
+            result_code.append(cond_code)
+            if jumpIfTrue:
+                result_code.append(emitter.emitIFTRUE(label, frame))
+            else:
+                result_code.append(emitter.emitIFFALSE(label, frame))
+
+        return ''.join(result_code)
+
+
+    def generateBoolValue(self, ast, o):
+        """Materializes a boolean expression built from &&, || and ! as 0/1 on the stack."""
+        emitter = o['emitter']
+        frame = o['frame']
+        label_false = frame.getNewLabel()
+        label_end = frame.getNewLabel()
+        result_code = []
+
+        result_code.append(self.generateCondJump(ast, o, label_false, False))
+        result_code.append(emitter.emitPUSHICONST(1, frame))
+        result_code.append(emitter.emitGOTO(label_end, frame))
+        # Only one of the two constants is on the stack at label_end
+        frame.pop()
+        result_code.append(emitter.emitLABEL(label_false, frame))
+        result_code.append(emitter.emitPUSHICONST(0, frame))
+        result_code.append(emitter.emitLABEL(label_end, frame))
+        return ''.join(result_code)
+
+
     def visitFuncCall(self, ast, o):
         emitter = o['emitter']
         frame = o['frame']
@@ -847,9 +2665,15 @@ class CodeGenerator(BaseVisitor,Utils):
         func_mtype = sym.mtype
         location = sym.value
 
-        for arg_expr in ast.args:
-            arg_code, _ = self.visit(arg_expr, o)
+        decl = self.inlineCandidate(ast.funName, location, frame)
+        if decl:
+            return self.generateInlineCall(ast, decl, o)
+
+        for arg_expr, param_type in zip(ast.args, func_mtype.partype):
+            arg_code, arg_type = self.visit(arg_expr, o)
             result_code.append(arg_code)
+            if isinstance(param_type, FloatType) and isinstance(arg_type, IntType):
+                result_code.append(emitter.emitI2F(frame))
 
         class_name = location.value
         invoke_code = emitter.emitINVOKESTATIC(f"{class_name}/{ast.funName}", func_mtype, frame)
@@ -858,6 +2682,59 @@ class CodeGenerator(BaseVisitor,Utils):
         return ''.join(result_code), func_mtype.rettype
     
 
+    def inlineCandidate(self, name, location, frame):
+        """Returns the FuncDecl to inline at a call of name, or None when the call must stay an invokestatic."""
+        if not self.isProgramMember(location):
+            return None
+        if name == frame.name or name in self.inlining or len(self.inlining) >= self.inlineDepth:
+            # Recursive call, or the bodies inlined so far already nest too deep
+            return None
+        decl = next((decl for decl in self.astTree.decl if isinstance(decl, FuncDecl) and decl.name == name), None)
+        if not decl or len(list(self.walkAST(decl.body))) > self.inlineThreshold:
+            return None
+        if any(isinstance(node, FuncCall) and node.funName == name for node in self.walkAST(decl.body)):
+            return None
+        return decl
+
+
+    def generateInlineCall(self, ast, decl, o):
+        """Generates the body of decl in place of a call to it."""
+        emitter = o['emitter']
+        frame = o['frame']
+        mark = emitter.getBufferMark()
+
+        param_symbols = []
+        for param, arg_expr in zip(decl.params, ast.args):
+            param_type = self.visit(param.parType, o)
+            arg_code, arg_type = self.visit(arg_expr, o)
+            emitter.printout(arg_code)
+            if isinstance(param_type, FloatType) and isinstance(arg_type, IntType):
+                emitter.printout(emitter.emitI2F(frame))
+            index = frame.getTempIndex()
+            emitter.printout(emitter.emitWRITEVAR(param.parName, param_type, index, frame))
+            param_symbols.append(Symbol(param.parName, param_type, Index(index)))
+
+        ret_type = self.visit(decl.retType, o)
+        exit_label = frame.getNewLabel()
+        saved = (self.hoisted, self.reducedIndices)
+        self.hoisted, self.reducedIndices = [], []
+        self.inlining.append(decl.name)
+        self.inlineExits.append((exit_label, ret_type))
+
+        # The body sees only its parameters and the globals, as it would in its own method
+        self.visit(decl.body, {'env': [param_symbols, o['env'][-1]], 'frame': frame, 'emitter': emitter})
+
+        self.inlineExits.pop()
+        self.inlining.pop()
+        self.hoisted, self.reducedIndices = saved
+        emitter.printout(emitter.emitLABEL(exit_label, frame))
+        if not isinstance(ret_type, VoidType):
+            frame.push()
+        for param_sym in param_symbols:
+            frame.releaseIndex(param_sym.value.value)
+        return emitter.takeCodeSince(mark), ret_type
+
+
     def visitMethCall(self, ast, o):
         emitter = o['emitter']
         frame = o['frame']
@@ -865,17 +2742,20 @@ class CodeGenerator(BaseVisitor,Utils):
 
         receiver_code, receiver_type = self.visit(ast.receiver, o)
         result_code.append(receiver_code)
-        for arg_expr in ast.args:
-            arg_code, _ = self.visit(arg_expr, o)
+        implementors = self.implementors.get(receiver_type.name, []) if isinstance(receiver_type, InterfaceType) else []
+        if len(implementors) == 1:
+            # Only one struct in the program implements the interface, so the call can be bound to it
+            interface_name, receiver_type = receiver_type.name, implementors[0]
+            result_code.append(emitter.emitCHECKCAST(receiver_type.name, frame))
+            if not any(call is ast for call, _ in self.devirtualized):
+                self.devirtualized.append((ast, f"{frame.name}: {interface_name}.{ast.metName} -> {receiver_type.name}.{ast.metName}"))
+        method_mtype = self.methodType(receiver_type, ast.metName, o)
+        for arg_expr, param_type in zip(ast.args, method_mtype.partype):
+            arg_code, arg_type = self.visit(arg_expr, o)
             result_code.append(arg_code)
+            if isinstance(param_type, FloatType) and isinstance(arg_type, IntType):
+                result_code.append(emitter.emitI2F(frame))
 
-        method_sym = self.lookup(ast.metName, [symbol for scope in o['env'] for symbol in scope], lambda x: x.name)
-        method_location = method_sym.value
-        expected_receiver_name = receiver_type.name
-        if not isinstance(method_location, CName) or method_location.isStatic or method_location.value != expected_receiver_name:
-            raise Exception(f"CodeGen Error: Method '{ast.metName}' not found for receiver type '{expected_receiver_name}' or is static.")
-        
-        method_mtype = method_sym.mtype
         if isinstance(receiver_type, StructType):
             invoke_code = emitter.emitINVOKEVIRTUAL(f"{receiver_type.name}/{ast.metName}", method_mtype, frame)
         elif isinstance(receiver_type, InterfaceType):
@@ -885,6 +2765,19 @@ class CodeGenerator(BaseVisitor,Utils):
         return ''.join(result_code), method_mtype.rettype
 
 
+    def methodType(self, receiver_type, name, o):
+        """Returns the MType of the method name of a struct or interface."""
+        if isinstance(receiver_type, StructType):
+            method = next((x.fun for x in receiver_type.methods if x.fun.name == name), None)
+            params = [x.parType for x in method.params] if method else None
+        else:
+            method = next((x for x in receiver_type.methods if x.name == name), None)
+            params = method.params if method else None
+        if not method:
+            raise IllegalOperandException(f"Method {name} not found in {receiver_type.name}")
+        return MType([self.visit(x, o) for x in params], self.visit(method.retType, o))
+
+
     def visitIntLiteral(self, ast, o):
         return self.emit.emitPUSHICONST(ast.value, o['frame']), IntType()
     
@@ -894,49 +2787,236 @@ class CodeGenerator(BaseVisitor,Utils):
     
 
     def visitStringLiteral(self, ast, o):
-        return self.emit.emitPUSHICONST(ast.value, o['frame']), StringType()    
+        return self.emit.emitPUSHSTRING(self.stringLiteralText(ast), o['frame']), StringType()
+
+
+    def stringLiteralText(self, ast):
+        """Returns the text of a string literal without its surrounding quotes, escapes kept as written."""
+        value = ast.value
+        if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+            return value[1:-1]
+        return value
+
+
+    def stringLiteralValue(self, ast):
+        """Returns the characters of a string literal, with its escapes replaced."""
+        escapes = {'n': '\n', 't': '\t', 'r': '\r', '"': '"', '\\': '\\'}
+        text = self.stringLiteralText(ast)
+        value, i = "", 0
+        while i < len(text):
+            if text[i] == '\\' and i + 1 < len(text):
+                value, i = value + escapes[text[i + 1]], i + 2
+            else:
+                value, i = value + text[i], i + 1
+        return value
+
+
+    def jasminStringText(self, value):
+        """Returns the text of a Jasmin string constant holding value, escaping all but printable ASCII."""
+        return ''.join(c if ' ' <= c <= '~' and c not in '"\\' else f"\\u{ord(c):04x}" for c in self.utf16Text(value))
+
+
+    def utf16Text(self, value):
+        """Returns value with each character above U+FFFF replaced by its UTF-16 surrogate pair,
+        so that len() and indexing count the chars of the JVM string."""
+        return ''.join(c if ord(c) < 0x10000 else chr(0xD800 + ((ord(c) - 0x10000) >> 10)) + chr(0xDC00 + ((ord(c) - 0x10000) & 0x3FF))
+                       for c in value)
 
 
     def visitBooleanLiteral(self, ast, o):
-        return self.emit.emitPUSHICONST(str(ast.value), o['frame']), BoolType()
+        return self.emit.emitPUSHICONST("true" if ast.value else "false", o['frame']), BoolType()
     
 
     def visitArrayLiteral(self, ast, o):
+        arr_type = ArrayType(ast.dimens, self.elementType(ast, o))
+        return self.generateArrayFill(arr_type, ast.value, o), arr_type
+
+
+    def generateArrayFill(self, arr_type, values, o):
+        """Allocates an array of arr_type and stores the literal values in it, leaving the array on the stack."""
+        emitter = o['emitter']
         frame = o['frame']
+        result_code = [self.visit(arr_type.dimens[0], o)[0]]
+
+        if len(arr_type.dimens) == 1:
+            row_type = arr_type.eleType
+            result_code.append(emitter.emitNEWARRAY(row_type, frame))
+            packed_values = self.packedValues(values, row_type, o) if len(values) >= self.packThreshold else None
+            if packed_values:
+                result_code.append(self.generatePackedFill(packed_values, row_type, o))
+                return ''.join(result_code)
+        else:
+            row_type = ArrayType(arr_type.dimens[1:], arr_type.eleType)
+            result_code.append(emitter.emitNEWARRAY(row_type, frame))
+        if not values:
+            return ''.join(result_code)
+
+        array_index = frame.getTempIndex()
+        result_code.append(emitter.emitWRITEVAR("literal_arr", arr_type, array_index, frame))
+        for i, value in enumerate(values):
+            result_code.append(emitter.emitREADVAR("literal_arr", arr_type, array_index, frame))
+            result_code.append(emitter.emitPUSHICONST(i, frame))
+            if isinstance(row_type, ArrayType) and isinstance(value, ArrayLiteral):
+                result_code.append(self.generateArrayFill(row_type, value.value, o))
+            else:
+                value_code, value_type = self.visit(value, o)
+                result_code.append(value_code)
+                if isinstance(row_type, FloatType) and isinstance(value_type, IntType):
+                    result_code.append(emitter.emitI2F(frame))
+            result_code.append(emitter.emitASTORE(row_type, frame))
+
+        length = arr_type.dimens[0]
+        if isinstance(row_type, ArrayType) and self.cal_const(length, o) != len(values):
+            # Rows left out of the literal are still allocated, at their zero value
+            row_index = frame.getTempIndex()
+            label_loop = frame.getNewLabel()
+            label_end = frame.getNewLabel()
+            result_code.append(emitter.emitPUSHICONST(len(values), frame))
+            result_code.append(emitter.emitWRITEVAR("row", IntType(), row_index, frame))
+            result_code.append(emitter.emitLABEL(label_loop, frame))
+            result_code.append(emitter.emitREADVAR("row", IntType(), row_index, frame))
+            result_code.append(emitter.emitREADVAR("literal_arr", arr_type, array_index, frame))
+            result_code.append(emitter.emitARRAYLENGTH(frame))
+            result_code.append(emitter.emitIFRELOP(">=", IntType(), label_end, frame))
+            result_code.append(emitter.emitREADVAR("literal_arr", arr_type, array_index, frame))
+            result_code.append(emitter.emitREADVAR("row", IntType(), row_index, frame))
+            result_code.append(self.generateNewArray(row_type, o))
+            result_code.append(emitter.emitASTORE(row_type, frame))
+            result_code.append(self.generateLocalStep(row_index, 1, o))
+            result_code.append(emitter.emitGOTO(label_loop, frame))
+            result_code.append(emitter.emitLABEL(label_end, frame))
+            frame.releaseIndex(row_index)
+
+        result_code.append(emitter.emitREADVAR("literal_arr", arr_type, array_index, frame))
+        frame.releaseIndex(array_index)
+        return ''.join(result_code)
+
+
+    def packedValues(self, elements, ele_type, o):
+        """Returns the values of the elements of an array literal, or None unless all are constants of ele_type.
+        Strings are returned as UTF-16 code units."""
+        values = []
+        for element in elements:
+            value = self.cal_const(element, o)
+            if isinstance(ele_type, IntType) and isinstance(value, int) and not isinstance(value, bool):
+                pass
+            elif isinstance(ele_type, FloatType) and isinstance(value, (int, float)) and not isinstance(value, bool):
+                value = float(value)
+            elif isinstance(ele_type, BoolType) and isinstance(value, bool):
+                pass
+            elif isinstance(ele_type, StringType) and isinstance(value, str):
+                if len(value.encode('utf-8')) > 0x7FFF:
+                    return None
+                value = self.utf16Text(value)
+            else:
+                return None
+            values.append(value)
+        return values
+
+
+    def generatePackedFill(self, values, ele_type, o):
+        """Fills the array on top of the stack from string constants encoding values, leaving the array on the stack."""
         emitter = o['emitter']
+        frame = o['frame']
         result_code = []
 
-        # Generate code to push all dimension sizes onto the stack
-        dim_count = len(ast.dimens)
-        for dim_expr in ast.dimens:
-            dim_code, _ = self.visit(dim_expr, o)
-            result_code.append(dim_code)
-
-        # Allocate the array
-        if dim_count == 1:
-            result_code.append(emitter.emitNEWARRAY(ast.eleType, frame))
+        if isinstance(ele_type, StringType):
+            encoded = [chr(len(value)) + value for value in values]
         else:
-            result_code.append(emitter.emitMULTIANEWARRAY(ArrayType(ast.dimens, ast.eleType), frame))
-        
-        # Initialize the innermost elements if ast.value is not empty
-        if ast.value:
-            temp_array_type = ArrayType(ast.dimens, ast.eleType)
-            temp_array_index = frame.getNewIndex()
-            result_code.append(emitter.emitWRITEVAR("temp_arr", temp_array_type, temp_array_index, frame))
-            innermost_dim_size = len(ast.value)
-            innermost_ele_type = ast.eleType
-
-            for i in range(innermost_dim_size):
-                result_code.append(emitter.emitREADVAR("temp_arr", temp_array_type, temp_array_index, frame))
-                result_code.append(emitter.emitPUSHICONST(i, frame))
-                element_code, _ = self.visit(ast.value[i], o)
-                result_code.append(element_code)
-                result_code.append(emitter.emitASTORE(innermost_ele_type, frame))
-            
-            result_code.append(emitter.emitREADVAR("temp_arr", temp_array_type, temp_array_index, frame))
+            if isinstance(ele_type, FloatType):
+                values = [struct.unpack('>i', struct.pack('>f', value))[0] for value in values]
+            # Offsets start at 1 when possible, as \u0000 takes two bytes in the class file
+            low = min(int(value) for value in values)
+            if max(int(value) for value in values) - low < 0xFFFF and low > -2**31:
+                low = low - 1
+            if max(int(value) for value in values) - low <= 0xFFFF:
+                encoded = [chr(int(value) - low) for value in values]
+            else:
+                encoded = [''.join(map(chr, divmod(int(value) & 0xFFFFFFFF, 0x10000))) for value in values]
+        width = None if isinstance(ele_type, StringType) else len(encoded[0])
+
+        # Modified UTF-8 takes 1 byte for \u0001-\u007f, 2 bytes for \u0000 and up to \u07ff, 3 above
+        chunks, chunk, chunk_bytes = [], "", 0
+        for text in encoded:
+            size = sum(1 if 0 < ord(c) < 0x80 else 2 if ord(c) < 0x800 else 3 for c in text)
+            if chunk and chunk_bytes + size > 0xFFFF:
+                chunks.append(chunk)
+                chunk, chunk_bytes = "", 0
+            chunk, chunk_bytes = chunk + text, chunk_bytes + size
+        chunks.append(chunk)
+
+        array_type = ArrayType([IntLiteral(len(values))], ele_type)
+        array_index = frame.getTempIndex()
+        string_index = frame.getTempIndex()
+        element_index = frame.getTempIndex()
+        char_index = frame.getTempIndex()
+        result_code.append(emitter.emitWRITEVAR("packed_arr", array_type, array_index, frame))
+        result_code.append(emitter.emitPUSHICONST(0, frame))
+        result_code.append(emitter.emitWRITEVAR("packed_i", IntType(), element_index, frame))
+
+        def readChar(offset):
+            code = [emitter.emitREADVAR("packed_str", StringType(), string_index, frame),
+                    emitter.emitREADVAR("packed_p", IntType(), char_index, frame)]
+            if offset:
+                code.append(emitter.emitPUSHICONST(offset, frame))
+                code.append(emitter.emitADDOP('+', IntType(), frame))
+            code.append(emitter.emitCHARAT(frame))
+            return ''.join(code)
+
+        for chunk in chunks:
+            label_loop = frame.getNewLabel()
+            label_end = frame.getNewLabel()
+            result_code.append(emitter.emitPUSHSTRING(self.jasminStringText(chunk), frame))
+            result_code.append(emitter.emitWRITEVAR("packed_str", StringType(), string_index, frame))
+            result_code.append(emitter.emitPUSHICONST(0, frame))
+            result_code.append(emitter.emitWRITEVAR("packed_p", IntType(), char_index, frame))
+            result_code.append(emitter.emitLABEL(label_loop, frame))
+            result_code.append(emitter.emitREADVAR("packed_p", IntType(), char_index, frame))
+            result_code.append(emitter.emitPUSHICONST(len(chunk), frame))
+            result_code.append(emitter.emitIFRELOP(">=", IntType(), label_end, frame))
+            result_code.append(emitter.emitREADVAR("packed_arr", array_type, array_index, frame))
+            result_code.append(emitter.emitREADVAR("packed_i", IntType(), element_index, frame))
+
+            if width is None:
+                # substring(p + 1, p + 1 + length), which is also where the next element starts
+                result_code.append(emitter.emitREADVAR("packed_str", StringType(), string_index, frame))
+                result_code.append(emitter.emitREADVAR("packed_p", IntType(), char_index, frame))
+                result_code.append(emitter.emitPUSHICONST(1, frame))
+                result_code.append(emitter.emitADDOP('+', IntType(), frame))
+                result_code.append(readChar(0))
+                result_code.append(emitter.emitREADVAR("packed_p", IntType(), char_index, frame))
+                result_code.append(emitter.emitADDOP('+', IntType(), frame))
+                result_code.append(emitter.emitPUSHICONST(1, frame))
+                result_code.append(emitter.emitADDOP('+', IntType(), frame))
+                result_code.append(emitter.emitDUP(frame))
+                result_code.append(emitter.emitWRITEVAR("packed_p", IntType(), char_index, frame))
+                result_code.append(emitter.emitINVOKEVIRTUAL("java/lang/String/substring", MType([IntType(), IntType()], StringType()), frame))
+            elif width == 2:
+                result_code.append(readChar(0))
+                result_code.append(emitter.emitPUSHICONST(0x10000, frame))
+                result_code.append(emitter.emitMULOP('*', IntType(), frame))
+                result_code.append(readChar(1))
+                result_code.append(emitter.emitADDOP('+', IntType(), frame))
+            else:
+                result_code.append(readChar(0))
+                if low:
+                    result_code.append(emitter.emitPUSHICONST(low, frame))
+                    result_code.append(emitter.emitADDOP('+', IntType(), frame))
+            if width:
+                if isinstance(ele_type, FloatType):
+                    result_code.append(emitter.emitINVOKESTATIC("java/lang/Float/intBitsToFloat", MType([IntType()], FloatType()), frame))
+                result_code.append(self.generateLocalStep(char_index, width, o))
+
+            result_code.append(emitter.emitASTORE(ele_type, frame))
+            result_code.append(self.generateLocalStep(element_index, 1, o))
+            result_code.append(emitter.emitGOTO(label_loop, frame))
+            result_code.append(emitter.emitLABEL(label_end, frame))
+
+        result_code.append(emitter.emitREADVAR("packed_arr", array_type, array_index, frame))
+        for index in [array_index, string_index, element_index, char_index]:
+            frame.releaseIndex(index)
+        return ''.join(result_code)
 
-        return ''.join(result_code), ArrayType(ast.dimens, ast.eleType)
-    
 
     def visitStructLiteral(self, ast, o):
         frame = o['frame']
@@ -945,33 +3025,48 @@ class CodeGenerator(BaseVisitor,Utils):
 
         struct_type_symbol = self.lookup(ast.name, [j for i in o['env'] for j in i], lambda x: x.name)
         struct_type_ast = struct_type_symbol.mtype
-        struct_jvm_class_name = emitter.getJVMType(struct_type_ast)
+        struct_jvm_class_name = emitter.getFullType(struct_type_ast)
 
-        # Allocate struct instance
+        # Allocate struct instance and duplicate the objectref for the constructor call
         result_code.append(emitter.emitNEW(struct_jvm_class_name, frame))
-        # Duplicate objectref for the constructor call
         result_code.append(emitter.emitDUP(frame))
-        # Call the default constructor (<init>)
-        constructor_descriptor = emitter.getJVMType(MType([], VoidType())) # ()V
-        result_code.append(emitter.emitINVOKESPECIAL(frame, f"{struct_jvm_class_name}/<init>", MType([], VoidType())))
-
-        # Initialize fields if ast.elements is not empty
-        if ast.elements:
-            temp_obj_index = frame.getNewIndex()
-            result_code.append(emitter.emitWRITEVAR("temp_obj", struct_type_ast, temp_obj_index, frame))
+        if not struct_type_ast.elements:
+            result_code.append(emitter.emitINVOKESPECIAL(frame, f"{struct_jvm_class_name}/<init>", MType([], VoidType())))
+            return ''.join(result_code), struct_type_ast
+
+        # The all-fields constructor takes the fields in declaration order, omitted ones at their zero value
+        field_names = [name for name, _ in struct_type_ast.elements]
+        field_types = [self.visit(field_type, o) for _, field_type in struct_type_ast.elements]
+        given = dict(ast.elements)
+        given_order = [field_names.index(name) for name, _ in ast.elements]
+        temps = {}
+        if given_order != sorted(given_order) and any(isinstance(node, (FuncCall, MethCall)) for node in self.walkAST(list(given.values()))):
+            # Values written out of declaration order are evaluated first, keeping calls in source order
             for field_name, field_value in ast.elements:
-                result_code.append(emitter.emitREADVAR("temp_obj", struct_type_ast, temp_obj_index, frame))
-                field_value_code, _ = self.visit(field_value, o)
-                result_code.append(field_value_code)
-                
-                field_definition = self.lookup(field_name, struct_type_ast.elements, lambda x: x[0])
-                field_type_ast = field_definition[1]
-                qualified_field_name = f"{struct_jvm_class_name}/{field_name}"
-                result_code.append(emitter.emitPUTFIELD(qualified_field_name, field_type_ast, frame))
-            result_code.append(emitter.emitREADVAR("temp_obj", struct_type_ast, temp_obj_index, frame))
-        
+                field_type = field_types[field_names.index(field_name)]
+                result_code.append(self.generateFieldValue(field_value, field_type, o))
+                temps[field_name] = frame.getTempIndex()
+                result_code.append(emitter.emitWRITEVAR(field_name, field_type, temps[field_name], frame))
+
+        for field_name, field_type in zip(field_names, field_types):
+            if field_name in temps:
+                result_code.append(emitter.emitREADVAR(field_name, field_type, temps[field_name], frame))
+                frame.releaseIndex(temps[field_name])
+            elif field_name in given:
+                result_code.append(self.generateFieldValue(given[field_name], field_type, o))
+            else:
+                result_code.append(self.generateZeroValue(field_type, o))
+        result_code.append(emitter.emitINVOKESPECIAL(frame, f"{struct_jvm_class_name}/<init>", MType(field_types, VoidType())))
         return ''.join(result_code), struct_type_ast
-    
+
+
+    def generateFieldValue(self, value, field_type, o):
+        """Pushes the value given to a field of field_type, converting an int for a float field."""
+        value_code, value_type = self.visit(value, o)
+        if isinstance(field_type, FloatType) and isinstance(value_type, IntType):
+            value_code += o['emitter'].emitI2F(o['frame'])
+        return value_code
+
 
     def visitNilLiteral(self, ast, o):
         return self.emit.emitPUSHNULL(o['frame']), None
\ No newline at end of file
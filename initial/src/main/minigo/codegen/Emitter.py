@@ -5,6 +5,8 @@ from StaticError import *
 import CodeGenerator as cgen
 from MachineCode import JasminCode
 from CodeGenError import *
+from Bytecode import MethodCode, ControlFlowGraph
+import warnings
 
 
 class Emitter():
@@ -12,6 +14,8 @@ class Emitter():
         self.filename = filename
         self.buff = list()
         self.jvm = JasminCode()
+        self.methodStart = 0
+        self.codeLength = 0 # bytes of code of the last method ended
 
 
     def getJVMType(self, inType):
@@ -29,7 +33,7 @@ class Emitter():
             return "[" * len(inType.dimens) + self.getJVMType(inType.eleType)
         elif isinstance(inType, cgen.MType):
             return "(" + "".join(list(map(lambda x: self.getJVMType(x), inType.partype))) + ")" + self.getJVMType(inType.rettype)
-        elif isinstance(inType, (StructType, InterfaceType)):
+        elif isinstance(inType, (StructType, InterfaceType, cgen.ClassType)):
             return "L" + inType.name + ";"
         else:
             return str(inType)
@@ -114,6 +118,13 @@ class Emitter():
         else:
             raise IllegalOperandException(in_)
         
+    def emitPUSHSTRING(self, in_, frame):
+        #in_: String (literal text with its escape sequences, without the quotes)
+        #frame: Frame
+
+        frame.push()
+        return self.jvm.emitLDC(f'"{in_}"')
+
     def emitPUSHNULL(self, frame):
         # frame: Frame
         # Stack: ..., -> ..., null
@@ -131,8 +142,10 @@ class Emitter():
         frame.pop()
         # push result
         frame.push()
-        if isinstance(in_, (IntType, BoolType)):
+        if isinstance(in_, IntType):
             return self.jvm.emitIALOAD()
+        elif isinstance(in_, BoolType):
+            return self.jvm.emitBALOAD()
         elif isinstance(in_, FloatType):
             return self.jvm.emitFALOAD()
         elif isinstance(in_, (ArrayType, StringType, StructType, InterfaceType)):
@@ -149,8 +162,10 @@ class Emitter():
         frame.pop()
         frame.pop()
         frame.pop()
-        if isinstance(in_, (IntType, BoolType)):
+        if isinstance(in_, IntType):
             return self.jvm.emitIASTORE()
+        elif isinstance(in_, BoolType):
+            return self.jvm.emitBASTORE()
         elif isinstance(in_, FloatType):
             return self.jvm.emitFASTORE()
         elif isinstance(in_, (ArrayType, StringType, StructType, InterfaceType)):
@@ -191,7 +206,7 @@ class Emitter():
             return self.jvm.emitILOAD(index)
         elif isinstance(inType, FloatType):
             return self.jvm.emitFLOAD(index)
-        elif isinstance(inType, (ArrayType, StringType, StructType, InterfaceType)):
+        elif isinstance(inType, (ArrayType, StringType, StructType, InterfaceType, cgen.ClassType)):
             return self.jvm.emitALOAD(index)
         else:
             raise IllegalOperandException(f"Cannot READVAR {name} of type {inType}")
@@ -213,7 +228,7 @@ class Emitter():
             return self.jvm.emitISTORE(index)
         elif isinstance(inType, FloatType):
             return self.jvm.emitFSTORE(index)
-        elif isinstance(inType, (ArrayType, StringType, StructType, InterfaceType)):
+        elif isinstance(inType, (ArrayType, StringType, StructType, InterfaceType, cgen.ClassType)):
             return self.jvm.emitASTORE(index)
         else:
             raise IllegalOperandException(f"Cannot WRITEVAR {name} of type {inType}")
@@ -334,41 +349,45 @@ class Emitter():
         return self.jvm.emitINVOKEVIRTUAL(lexeme, self.getJVMType(in_))
 
 
+    '''
+    *   generate String.charAt, whose char result is used as an int.
+    '''
+    def emitCHARAT(self, frame):
+        #frame: Frame
+        #..., string, index -> ..., char
+        frame.pop()
+        return self.jvm.emitINVOKEVIRTUAL("java/lang/String/charAt", "(I)C")
+
+
     def emitINVOKEINTERFACE(self, qualifiedName, methodMType, frame):
         # qualifiedName: String (e.g., "MyInterface/myMethod")
         # methodMType: MType (AST representation of method signature)
         # frame: Frame
 
-        # Calculate num_arg_slots based on parameter types
-        num_arg_slots = 0
-        for param_type in methodMType.partype:
-            if isinstance(param_type, FloatType): # Floats/Doubles take 2 slots
-                 num_arg_slots += 2
-            else:
-                 num_arg_slots += 1
-
-        # Calculate the 'count' operand for invokeinterface
-        # count = 1 (for objectref) + sum of slots for all arguments
-        count_operand = 1 + num_arg_slots
-        # Simulate stack changes (pop args, pop objref, push return)
-        for _ in range(num_arg_slots):
-            frame.pop()
+        # Every MiniGo value takes one slot, so count = 1 (for objectref) + number of arguments
+        count_operand = 1 + len(methodMType.partype)
+        list(map(lambda x: frame.pop(), methodMType.partype))
         frame.pop() # Pop objectref
-
         if not isinstance(methodMType.rettype, VoidType):
-            # Adjust push size if return type is float/double
-            if isinstance(methodMType.rettype, FloatType):
-                frame.push()
-                frame.push()
-            else:
-                frame.push()
-        jvm_descriptor = self.getJVMType(methodMType)
+            frame.push()
+        return self.jvm.emitINVOKEINTERFACE(qualifiedName, self.getJVMType(methodMType), count_operand)
 
-        # Call JasminCode method with the calculated count
-        indent = self.jvm.INDENT if hasattr(self.jvm, 'INDENT') else "    "
-        endline = self.jvm.END if hasattr(self.jvm, 'END') else "\n"
-        instruction = f"{indent}invokeinterface {qualifiedName}{jvm_descriptor} {count_operand}{endline}"
-        return instruction
+
+    '''
+    *   generate checkcast to narrow the reference on top of the stack to a class.
+    '''
+    def emitCHECKCAST(self, className, frame):
+        #className: String
+        #frame: Frame
+        return self.jvm.emitCHECKCAST(className)
+
+
+    '''
+    *   generate a comment line.
+    '''
+    def emitCOMMENT(self, in_):
+        #in_: String
+        return self.jvm.emitCOMMENT(in_)
 
 
     '''
@@ -494,6 +513,9 @@ class Emitter():
         return self.jvm.emitIOR()
 
 
+    '''   generate code for a relational operator whose result is left on the stack as 0 or 1.
+    *   Only one of the two constants reaches the join, so the simulated stack counts one.
+    '''
     def emitREOP(self, op, in_, frame):
         #op: String
         #in_: Type
@@ -504,82 +526,13 @@ class Emitter():
         labelF = frame.getNewLabel()
         labelO = frame.getNewLabel()
 
-        if isinstance(in_, IntType):
-            frame.pop()
-            frame.pop()
-            if op == ">":
-                result.append(self.jvm.emitIFICMPLE(labelF))
-            elif op == ">=":
-                result.append(self.jvm.emitIFICMPLT(labelF))
-            elif op == "<":
-                result.append(self.jvm.emitIFICMPGE(labelF))
-            elif op == "<=":
-                result.append(self.jvm.emitIFICMPGT(labelF))
-            elif op == "!=":
-                result.append(self.jvm.emitIFICMPEQ(labelF))
-            elif op == "==":
-                result.append(self.jvm.emitIFICMPNE(labelF))
-
-            result.append(self.emitPUSHCONST("1", BoolType(), frame))
-            result.append(self.emitGOTO(labelO, frame))
-            result.append(self.emitLABEL(labelF, frame))
-            result.append(self.emitPUSHCONST("0", BoolType(), frame))
-            result.append(self.emitLABEL(labelO, frame))
-
-        elif isinstance(in_, FloatType):
-            frame.pop()
-            frame.pop()
-            result.append(self.jvm.emitFCMPL())
-            frame.push()
-            if op == ">":
-                result.append(self.jvm.emitIFLE(labelF))
-            elif op == ">=":
-                result.append(self.jvm.emitIFLT(labelF))
-            elif op == "<":
-                result.append(self.jvm.emitIFGE(labelF))
-            elif op == "<=":
-                result.append(self.jvm.emitIFGT(labelF))
-            elif op == "!=":
-                result.append(self.jvm.emitIFEQ(labelF))
-            elif op == "==":
-                result.append(self.jvm.emitIFNE(labelF))
-
-            frame.pop()
-            result.append(self.emitPUSHCONST("1", BoolType(), frame))
-            result.append(self.emitGOTO(labelO, frame))
-            result.append(self.emitLABEL(labelF, frame))
-            result.append(self.emitPUSHCONST("0", BoolType(), frame))
-            result.append(self.emitLABEL(labelO, frame))
-
-        elif isinstance(in_, StringType):
-            if op in ["==", "!="]:
-                string_equals_descriptor = self.getJVMType(cgen.MType([cgen.ClassType("java/lang/Object")], BoolType()))
-                result.append(self.jvm.emitINVOKEVIRTUAL("java/lang/String/equals", string_equals_descriptor))
-                if op == "==":
-                    result.append(self.jvm.emitIFEQ(labelF))
-                elif op == "!=":
-                    result.append(self.jvm.emitIFNE(labelF))
-            elif op in ["<", "<=", ">", ">="]:
-                string_compareTo_descriptor = self.getJVMType(cgen.MType([StringType()], IntType()))
-                result.append(self.jvm.emitINVOKEVIRTUAL("java/lang/String/compareTo", string_compareTo_descriptor))
-                if op == "<":
-                    result.append(self.jvm.emitIFGE(labelF))
-                elif op == "<=":
-                    # Check if result <= 0. Inverse is result > 0.
-                    result.append(self.jvm.emitIFGT(labelF)) # ifgt 0 jumps if result > 0
-                elif op == ">":
-                    # Check if result > 0. Inverse is result <= 0.
-                    result.append(self.jvm.emitIFLE(labelF)) # ifle 0 jumps if result <= 0
-                elif op == ">=":
-                    # Check if result >= 0. Inverse is result < 0.
-                    result.append(self.jvm.emitIFLT(labelF))
-                
-                result.append(self.emitPUSHCONST("1", BoolType(), frame))
-                result.append(self.emitGOTO(labelO, frame))
-                result.append(self.emitLABEL(labelF, frame))
-                result.append(self.emitPUSHCONST("0", BoolType(), frame))
-                result.append(self.emitLABEL(labelO, frame))
-
+        result.append(self.emitIFRELOP(cgen.negated_relops[op], in_, labelF, frame))
+        result.append(self.emitPUSHCONST("1", BoolType(), frame))
+        result.append(self.emitGOTO(labelO, frame))
+        frame.pop()
+        result.append(self.emitLABEL(labelF, frame))
+        result.append(self.emitPUSHCONST("0", BoolType(), frame))
+        result.append(self.emitLABEL(labelO, frame))
         return ''.join(result)
 
 
@@ -593,7 +546,7 @@ class Emitter():
 
         result = list()
 
-        if isinstance(in_, IntType):
+        if isinstance(in_, (IntType, BoolType)):
             frame.pop()
             frame.pop()
             if op == ">":
@@ -656,6 +609,71 @@ class Emitter():
         return ''.join(result)
 
 
+    '''
+    *   generate code to jump to label if value1 op value2 holds, falling through otherwise.
+    *   @param op the relational operator.
+    *   @param in the type of the operands.
+    '''
+    def emitIFRELOP(self, op, in_, label, frame):
+        #op: String
+        #in_: Type
+        #label: Int
+        #frame: Frame
+        #..., value1, value2 -> ...
+
+        result = list()
+        frame.pop()
+        frame.pop()
+
+        if isinstance(in_, (IntType, BoolType)):
+            if op == ">":
+                result.append(self.jvm.emitIFICMPGT(label))
+            elif op == ">=":
+                result.append(self.jvm.emitIFICMPGE(label))
+            elif op == "<":
+                result.append(self.jvm.emitIFICMPLT(label))
+            elif op == "<=":
+                result.append(self.jvm.emitIFICMPLE(label))
+            elif op == "!=":
+                result.append(self.jvm.emitIFICMPNE(label))
+            elif op == "==":
+                result.append(self.jvm.emitIFICMPEQ(label))
+            return ''.join(result)
+
+        if op in ["==", "!="] and (in_ is None or isinstance(in_, (StructType, InterfaceType, ArrayType))):
+            # References, possibly nil, compare by identity
+            result.append(self.jvm.emitIFACMPEQ(label) if op == "==" else self.jvm.emitIFACMPNE(label))
+            return ''.join(result)
+
+        if isinstance(in_, FloatType):
+            result.append(self.jvm.emitFCMPL())
+        elif isinstance(in_, StringType) and op in ["==", "!="]:
+            string_equals_descriptor = self.getJVMType(cgen.MType([cgen.ClassType("java/lang/Object")], BoolType()))
+            result.append(self.jvm.emitINVOKEVIRTUAL("java/lang/String/equals", string_equals_descriptor))
+            # equals leaves 1 when the strings are equal
+            op = "!=" if op == "==" else "=="
+        elif isinstance(in_, StringType):
+            string_compareTo_descriptor = self.getJVMType(cgen.MType([StringType()], IntType()))
+            result.append(self.jvm.emitINVOKEVIRTUAL("java/lang/String/compareTo", string_compareTo_descriptor))
+        else:
+            raise IllegalOperandException(f"Relational operator '{op}' cannot be applied to type {in_}")
+
+        # The comparison result is now an int to be tested against zero
+        if op == ">":
+            result.append(self.jvm.emitIFGT(label))
+        elif op == ">=":
+            result.append(self.jvm.emitIFGE(label))
+        elif op == "<":
+            result.append(self.jvm.emitIFLT(label))
+        elif op == "<=":
+            result.append(self.jvm.emitIFLE(label))
+        elif op == "!=":
+            result.append(self.jvm.emitIFNE(label))
+        elif op == "==":
+            result.append(self.jvm.emitIFEQ(label))
+        return ''.join(result)
+
+
     '''   generate the method directive for a function.
     *   @param lexeme the qualified name of the method(i.e., class-name/method-name).
     *   @param in the type descriptor of the method.
@@ -667,16 +685,35 @@ class Emitter():
         #isStatic: Boolean
         #frame: Frame
 
+        # The method header is the next entry printed out
+        self.methodStart = len(self.buff)
         return self.jvm.emitMETHOD(lexeme, self.getJVMType(in_), isStatic)
 
 
     '''   generate the end directive for a function.
+    *   The method body is first rewritten by the passes of ControlFlowGraph.
+    *   The stack limit is computed from the method's final instructions; the
+    *   push/pop simulation in frame is only kept as a cross-check.
     '''
     def emitENDMETHOD(self, frame):
         #frame: Frame
 
         buffer = list()
-        buffer.append(self.jvm.emitLIMITSTACK(frame.getMaxOpStackSize()))
+        code = MethodCode(''.join(self.buff[self.methodStart:]))
+        # The simulation in frame follows the code as generated, before the passes
+        generated_stack = code.computeMaxStack()[0]
+        if generated_stack != frame.getMaxOpStackSize():
+            warnings.warn(f"{frame.name}: simulated max stack {frame.getMaxOpStackSize()} disagrees with computed {generated_stack}")
+        code.instructions = ControlFlowGraph(code.instructions).optimize()
+        self.buff[self.methodStart:] = [str(code)]
+        self.codeLength = code.codeLength()
+        max_stack, problems = code.computeMaxStack()
+        for problem in problems:
+            warnings.warn(f"{frame.name}: {problem}")
+        buffer.append(self.jvm.emitLIMITSTACK(max_stack))
+        if frame.getMaxNoReuseIndex() != frame.getMaxIndex():
+            # Report how much slot reuse saved on this method
+            buffer.append(self.jvm.emitCOMMENT(f"max locals {frame.getMaxNoReuseIndex()} before slot reuse, {frame.getMaxIndex()} after"))
         buffer.append(self.jvm.emitLIMITLOCAL(frame.getMaxIndex()))
         buffer.append(self.jvm.emitENDMETHOD())
         return ''.join(buffer)
@@ -715,6 +752,9 @@ class Emitter():
         elif isinstance(elementType, BoolType):
             return self.jvm.emitNEWARRAY("boolean")
         elif isinstance(elementType, (StringType, StructType, InterfaceType)):
+            return self.jvm.emitANEWARRAY(self.getFullType(elementType))
+        elif isinstance(elementType, ArrayType):
+            # Rows of a multi-dimensional array are named by their descriptor
             return self.jvm.emitANEWARRAY(self.getJVMType(elementType))
         else:
             raise IllegalOperandException(f"Cannot emitNEWARRAY for element type {elementType}")
@@ -817,6 +857,14 @@ class Emitter():
         return self.jvm.emitDUP()
 
 
+    def emitDUP2(self, frame):
+        #frame: Frame
+        #..., value1, value2 -> ..., value1, value2, value1, value2
+        frame.push()
+        frame.push()
+        return self.jvm.emitDUP2()
+
+
     def emitPOP(self, frame):
         #frame: Frame
         frame.pop()
@@ -858,7 +906,7 @@ class Emitter():
         elif isinstance(in_, FloatType):
             frame.pop()
             return self.jvm.emitFRETURN()
-        elif isinstance(in_, StringType):
+        elif isinstance(in_, (StringType, ArrayType, StructType, InterfaceType)):
             frame.pop()
             return self.jvm.emitARETURN()
         elif type(in_) is VoidType:
@@ -885,14 +933,44 @@ class Emitter():
         return self.jvm.emitGOTO(label)
 
 
+    ''' generate code to jump on the int on top of the stack through a jump table.
+    *   @param low the key of the first label; the keys of the others follow it
+    *   @param labels the label of each key from low up
+    *   @param default the label of every other value
+    '''
+    def emitTABLESWITCH(self, low, labels, default, frame):
+        #low: Int
+        #labels: List[Int]
+        #default: Int
+        #frame: Frame
+        frame.pop()
+        return self.jvm.emitTABLESWITCH(low, labels, default)
+
+
+    ''' generate code to jump on the int on top of the stack by searching a sorted key list.
+    *   @param keys the keys, in increasing order
+    *   @param labels the label of each key
+    *   @param default the label of every other value
+    '''
+    def emitLOOKUPSWITCH(self, keys, labels, default, frame):
+        #keys: List[Int]
+        #labels: List[Int]
+        #default: Int
+        #frame: Frame
+        frame.pop()
+        return self.jvm.emitLOOKUPSWITCH(keys, labels, default)
+
+
     ''' generate some starting directives for a class.<p>
     *   .source MPC.CLASSNAME.java<p>
     *   .class public MPC.CLASSNAME<p>
     *   .super java/lang/Object<p>
+    *   .implements INTERFACE, once for each interface the class implements<p>
     '''
-    def emitPROLOG(self, name, parent, is_interface=False):
+    def emitPROLOG(self, name, parent, is_interface=False, interfaces=[]):
         #name: String
         #parent: String
+        #interfaces: List[String]
 
         result = list()
         result.append(self.jvm.emitSOURCE(name + ".java"))
@@ -903,6 +981,8 @@ class Emitter():
         else:
             result.append(self.jvm.emitCLASS("public " + name))
             result.append(self.jvm.emitSUPER("java/lang/Object" if parent == "" else parent))
+            for interface in interfaces:
+                result.append(self.jvm.emitIMPLEMENTS(interface))
         return ''.join(result)
 
 
@@ -930,5 +1010,23 @@ class Emitter():
         self.buff.append(in_)
 
 
+    '''
+    *   return a mark of the current end of the buffered code, for takeCodeSince().
+    '''
+    def getBufferMark(self):
+        return len(self.buff)
+
+
+    '''
+    *   remove the code printed out since a mark and return it as one string.
+    *   @param mark the value returned by getBufferMark()
+    '''
+    def takeCodeSince(self, mark):
+        #mark: Int
+        code = ''.join(self.buff[mark:])
+        del self.buff[mark:]
+        return code
+
+
     def clearBuff(self):
         self.buff.clear()
\ No newline at end of file
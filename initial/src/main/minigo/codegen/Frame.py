@@ -1,4 +1,5 @@
 from Utils import *
+from CodeGenError import *
 
 class Frame():
     def __init__(self, name, returnType):
@@ -12,9 +13,13 @@ class Frame():
         self.maxOpStackSize = 0
         self.currIndex = 0
         self.maxIndex = 0
+        self.freeIndex = list()
+        self.currNoReuseIndex = 0
+        self.maxNoReuseIndex = 0
         self.startLabel = list()
         self.endLabel = list()
         self.indexLocal = list()
+        self.noReuseLocal = list()
         self.conLabel = list()
         self.brkLabel = list()
 
@@ -25,6 +30,7 @@ class Frame():
         #index: Int
 
         self.currIndex = index
+        self.currNoReuseIndex = index
 
     '''
     *   return a new label in the method.
@@ -84,14 +90,18 @@ class Frame():
         self.startLabel.append(start)
         self.endLabel.append(end)
         self.indexLocal.append(self.currIndex)
+        self.noReuseLocal.append(self.currNoReuseIndex)
         if isProc:
             self.maxOpStackSize = 0
             self.maxIndex = 0
+            self.maxNoReuseIndex = 0
+            self.freeIndex = list()
 
     '''
     *   invoked when parsing out of a scope in a method.<p>
     *   This method will pop the starting and ending labels of this scope
-    *   and restore the current index
+    *   and restore the current index. Released slots above the restored index are
+    *   dropped since they will be handed out again by getNewIndex().
     '''
     def exitScope(self):
         if not self.startLabel or not self.endLabel or not self.indexLocal:
@@ -99,6 +109,8 @@ class Frame():
         self.startLabel.pop()
         self.endLabel.pop()
         self.currIndex = self.indexLocal.pop()
+        self.currNoReuseIndex = self.noReuseLocal.pop()
+        self.freeIndex = [i for i in self.freeIndex if i < self.currIndex]
 
     '''
     *   return the starting label of the current scope.
@@ -127,8 +139,37 @@ class Frame():
         self.currIndex = self.currIndex + 1
         if self.currIndex > self.maxIndex:
             self.maxIndex = self.currIndex
+        self.countNoReuseIndex()
         return tmp
 
+    '''
+    *   return an index for a compiler temporary whose lifetime ends with releaseIndex().
+    *   A slot released earlier in the current scope is reused before a new one is taken.
+    *   @return an integer that represents the index of the temporary
+    '''
+    def getTempIndex(self):
+        if not self.freeIndex:
+            return self.getNewIndex()
+        self.freeIndex.sort()
+        self.countNoReuseIndex()
+        return self.freeIndex.pop(0)
+
+    '''
+    *   mark the slot of a dead temporary as free for reuse by getTempIndex().
+    '''
+    def releaseIndex(self, index):
+        #index: Int
+        if index < self.currIndex and index not in self.freeIndex:
+            self.freeIndex.append(index)
+
+    '''
+    *   simulate the allocation of one more slot as if no slot were ever reused.
+    '''
+    def countNoReuseIndex(self):
+        self.currNoReuseIndex = self.currNoReuseIndex + 1
+        if self.currNoReuseIndex > self.maxNoReuseIndex:
+            self.maxNoReuseIndex = self.currNoReuseIndex
+
     '''
     *   return the maximum index used in generating code for the current method
     *   @return an integer representing the maximum index
@@ -136,6 +177,13 @@ class Frame():
     def getMaxIndex(self):
         return self.maxIndex
 
+    '''
+    *   return the maximum index the current method would need without slot reuse
+    *   @return an integer representing the maximum index before reuse
+    '''
+    def getMaxNoReuseIndex(self):
+        return self.maxNoReuseIndex
+
     '''
     *   invoked when parsing into a loop statement.<p>
     *   This method creates 2 new labels that represent the starting and ending label of the loop.<p>
@@ -197,6 +197,18 @@ class MachineCode(ABC):
         #label: Int
         pass
     @abstractmethod
+    def emitTABLESWITCH(self, low, labels, default):
+        #low: Int
+        #labels: List[Int]
+        #default: Int
+        pass
+    @abstractmethod
+    def emitLOOKUPSWITCH(self, keys, labels, default):
+        #keys: List[Int]
+        #labels: List[Int]
+        #default: Int
+        pass
+    @abstractmethod
     def emitINEG(self):
         pass
     @abstractmethod
@@ -209,12 +221,23 @@ class MachineCode(ABC):
     def emitDUPX2(self):
         pass
     @abstractmethod
+    def emitDUP2(self):
+        pass
+    @abstractmethod
     def emitPOP(self):
         pass
     @abstractmethod
     def emitI2F(self):
         pass
     @abstractmethod
+    def emitIINC(self, in_, amount):
+        #in_: Int
+        #amount: Int
+        pass
+    @abstractmethod
+    def emitARRAYLENGTH(self):
+        pass
+    @abstractmethod
     def emitNEW(self, lexeme):
         #lexeme: String
         pass
@@ -247,6 +270,16 @@ class MachineCode(ABC):
         #typ: String
         pass
     @abstractmethod
+    def emitINVOKEINTERFACE(self, lexeme, typ, count):
+        #lexeme: String
+        #typ: String
+        #count: Int
+        pass
+    @abstractmethod
+    def emitCHECKCAST(self, lexeme):
+        #lexeme: String
+        pass
+    @abstractmethod
     def emitI(self):
         pass
     @abstractmethod
@@ -267,6 +300,10 @@ class MachineCode(ABC):
         #in_: String
         pass
     @abstractmethod
+    def emitCOMMENT(self, in_):
+        #in_: String
+        pass
+    @abstractmethod
     def emitVAR(self, in_, varName, inType, fromLabel, toLabel):
         #in_: Int
         #varName: String
@@ -296,6 +333,10 @@ class MachineCode(ABC):
         #lexeme: String
         pass
     @abstractmethod
+    def emitIMPLEMENTS(self, lexeme):
+        #lexeme: String
+        pass
+    @abstractmethod
     def emitSTATICFIELD(self, lexeme, typ, isFinal):
         #lexeme: String
         #typ: String
@@ -330,8 +371,8 @@ class JasminCode(MachineCode):
     def emitICONST(self, i):
         #i: Int
         if i == -1:
-            return JasminCode.INDENT + "iconst_ml" + JasminCode.END
-        elif i >= 0 or i <= 5:
+            return JasminCode.INDENT + "iconst_m1" + JasminCode.END
+        elif i >= 0 and i <= 5:
             return JasminCode.INDENT + "iconst_" + str(i) + JasminCode.END
         else:
             raise IllegalOperandException(str(i))
@@ -548,6 +589,24 @@ class JasminCode(MachineCode):
     def emitGOTO(self, label):
         #label: Int
         return JasminCode.INDENT + "goto Label" + str(label) + JasminCode.END
+
+    def emitTABLESWITCH(self, low, labels, default):
+        #low: Int
+        #labels: List[Int]
+        #default: Int
+        result = JasminCode.INDENT + "tableswitch " + str(low) + " " + str(low + len(labels) - 1) + JasminCode.END
+        for label in labels:
+            result += JasminCode.INDENT * 2 + "Label" + str(label) + JasminCode.END
+        return result + JasminCode.INDENT * 2 + "default : Label" + str(default) + JasminCode.END
+
+    def emitLOOKUPSWITCH(self, keys, labels, default):
+        #keys: List[Int] (in increasing order)
+        #labels: List[Int]
+        #default: Int
+        result = JasminCode.INDENT + "lookupswitch" + JasminCode.END
+        for key, label in zip(keys, labels):
+            result += JasminCode.INDENT * 2 + str(key) + " : Label" + str(label) + JasminCode.END
+        return result + JasminCode.INDENT * 2 + "default : Label" + str(default) + JasminCode.END
     
     def emitINEG(self):
         return JasminCode.INDENT + "ineg" + JasminCode.END
@@ -560,12 +619,23 @@ class JasminCode(MachineCode):
     
     def emitDUPX2(self):
         return JasminCode.INDENT + "dup_x2" + JasminCode.END
+
+    def emitDUP2(self):
+        return JasminCode.INDENT + "dup2" + JasminCode.END
     
     def emitPOP(self):
         return JasminCode.INDENT + "pop" + JasminCode.END
     
     def emitI2F(self):
         return JasminCode.INDENT + "i2f" + JasminCode.END
+
+    def emitIINC(self, in_, amount):
+        #in_: Int
+        #amount: Int
+        return JasminCode.INDENT + "iinc " + str(in_) + " " + str(amount) + JasminCode.END
+
+    def emitARRAYLENGTH(self):
+        return JasminCode.INDENT + "arraylength" + JasminCode.END
     
     def emitNEW(self, lexeme):
         #lexeme: String
@@ -582,7 +652,7 @@ class JasminCode(MachineCode):
     def emitMULTIANEWARRAY(self, typ, dimensions):
         #typ: String
         #dimensions: Int
-        return JasminCode.INDENT + "multianewarray " + typ + " " + dimensions + JasminCode.END
+        return JasminCode.INDENT + "multianewarray " + typ + " " + str(dimensions) + JasminCode.END
     
     def emitINVOKESTATIC(self, lexeme, typ):
         #lexeme: String
@@ -602,6 +672,16 @@ class JasminCode(MachineCode):
         #lexeme: String
         #typ: String
         return JasminCode.INDENT + "invokevirtual " + lexeme + typ + JasminCode.END
+
+    def emitINVOKEINTERFACE(self, lexeme, typ, count):
+        #lexeme: String
+        #typ: String
+        #count: Int
+        return JasminCode.INDENT + "invokeinterface " + lexeme + typ + " " + str(count) + JasminCode.END
+
+    def emitCHECKCAST(self, lexeme):
+        #lexeme: String
+        return JasminCode.INDENT + "checkcast " + lexeme + JasminCode.END
     
     def emitI(self):
         return JasminCode.INDENT + "i" + JasminCode.END
@@ -623,6 +703,10 @@ class JasminCode(MachineCode):
         #in_: Int
         return ".limit locals " + str(in_) + JasminCode.END
     
+    def emitCOMMENT(self, in_):
+        #in_: String
+        return "; " + in_ + JasminCode.END
+
     def emitVAR(self, in_, varName, inType, fromLabel, toLabel):
         #in_: Int
         #varName: String
@@ -655,6 +739,10 @@ class JasminCode(MachineCode):
     def emitSUPER(self, lexeme):
         #lexeme: String
         return ".super " + lexeme + JasminCode.END
+
+    def emitIMPLEMENTS(self, lexeme):
+        #lexeme: String
+        return ".implements " + lexeme + JasminCode.END
     
     def emitSTATICFIELD(self, lexeme, typ, isFinal,value):
         #lexeme: String
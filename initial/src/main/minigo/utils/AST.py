@@ -210,7 +210,7 @@ class Block(Stmt):
 @dataclass
 class Assign(Stmt):
     lhs: LHS
-    rhs: Expr # if assign operator is +=, rhs is BinaryOp(+,lhs,rhs), similar to -=,*=,/=,%=
+    rhs: Expr
 
     def __str__(self):
         return "Assign(" + str(self.lhs) + "," + str(self.rhs) + ")"
@@ -218,6 +218,18 @@ class Assign(Stmt):
     def accept(self, v, param):
         return v.visitAssign(self, param)
 
+@dataclass
+class CompoundAssign(Stmt):
+    lhs: LHS
+    op: str # arithmetic operator of the assignment: +=, -=, *=, /=, %= give +, -, *, /, %
+    rhs: Expr
+
+    def __str__(self):
+        return "CompoundAssign(" + str(self.lhs) + "," + self.op + "," + str(self.rhs) + ")"
+
+    def accept(self, v, param):
+        return v.visitCompoundAssign(self, param)
+
 @dataclass
 class If(Stmt):
     expr:Expr
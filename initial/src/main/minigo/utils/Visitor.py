@@ -55,6 +55,9 @@ class Visitor(ABC):
     def visitAssign(self, param):
         pass
     @abstractmethod
+    def visitCompoundAssign(self, param):
+        pass
+    @abstractmethod
     def visitIf(self, param):
         pass
     @abstractmethod
@@ -169,6 +172,9 @@ class BaseVisitor(Visitor):
  
     def visitAssign(self, param):
         return None
+
+    def visitCompoundAssign(self, param):
+        return None
    
     def visitIf(self, param):
         return None
@@ -28,4 +28,632 @@ class CheckCodeGenSuite(unittest.TestCase):
         input = Program([VarDecl("a",IntType(),IntLiteral(5000)),FuncDecl("main",[],VoidType(),Block([FuncCall("putInt", [Id("a")])]))])
         expect = "5000"
         self.assertTrue(TestCodeGen.test(input,expect,506))
-    
\ No newline at end of file
+    def test_and_skips_rhs(self):
+        input = """func side() boolean {putInt(9); return true;};
+        func main() {var x int = 0; if ((x > 0) && side()) {putInt(1);} else {putInt(2);};};"""
+        expect = "2"
+        self.assertTrue(TestCodeGen.test(input,expect,507))
+    def test_or_skips_rhs(self):
+        input = """func side() boolean {putInt(9); return false;};
+        func main() {var x int = 0; if ((x == 0) || side()) {putInt(1);};};"""
+        expect = "1"
+        self.assertTrue(TestCodeGen.test(input,expect,508))
+    def test_nested_logical_value(self):
+        input = """func side() boolean {putInt(9); return false;};
+        func main() {var x int = 0; var b boolean = !((x > 0) && side()) || side(); putBool(b);};"""
+        expect = "true"
+        self.assertTrue(TestCodeGen.test(input,expect,509))
+    def test_guarded_loop_condition(self):
+        input = """func side() boolean {putInt(9); return true;};
+        func main() {var i int = 0; var s int = 0;
+            for (i < 8) && ((i < 5) || side()) {s := s + i; i := i + 1;};
+            putInt(s);};"""
+        expect = "99928"
+        self.assertTrue(TestCodeGen.test(input,expect,510))
+    def test_temp_slots_reused(self):
+        input = """func main() {
+            var a [3]int = [3]int{1,2,3};
+            var b [2]int = [2]int{4,5};
+            var i int; var v int;
+            for i, v := range a {putInt(v);};
+            for i, v := range b {putInt(v);};
+            putInt(a[1] + b[1]);
+        };"""
+        expect = "123457"
+        self.assertTrue(TestCodeGen.test(input,expect,511))
+    def test_computed_stack_limit(self):
+        input = """func f(a int, b boolean, c int) int {if (b) {return a;}; return c;};
+        func main() {
+            var x int = 3;
+            putInt(f(1, x < 2, 7) + f(x, (x > 1) == (x < 5), 2) * -x);
+            var y boolean = 1 < 2;
+            putBool(y);
+        };"""
+        expect = "-2true"
+        self.assertTrue(TestCodeGen.test(input,expect,512))
+    def test_string_concat_chain(self):
+        input = """func tag() string {putString("<"); return ">";};
+        func main() {
+            var a string = "x";
+            var b string = a + "-" + "-" + (tag() + a);
+            putStringLn(b);
+            putString("con" + "st" + a);
+        };"""
+        expect = "<x-->x\nconstx"
+        self.assertTrue(TestCodeGen.test(input,expect,513))
+    def test_loop_string_accumulator(self):
+        input = """func main() {
+            var s string = "<";
+            var t string = "";
+            var i int;
+            for i := 0; i < 5; i += 1 {
+                s += "a" + "b";
+                if (i == 2) {t := s; s := "R";};
+                if (i == 3) {break;};
+            };
+            putStringLn(s + t);
+            var arr [3]string = [3]string{"p","q","r"};
+            var v string;
+            for _, v := range arr {t += v + t;};
+            putString(t);
+        };"""
+        expect = "Rab<ababab\n<abababp<abababq<abababp<abababr<abababp<abababq<abababp<ababab"
+        self.assertTrue(TestCodeGen.test(input,expect,514))
+    def test_compound_assign_single_evaluation(self):
+        input = """type Inner struct {r int;}
+        type Outer struct {q Inner;}
+        var calls int = 0;
+        func f(i int) int {calls += 1; return i;};
+        func main() {
+            var a [3]int;
+            var m [2][3]float;
+            var p Outer = Outer{q: Inner{r: 3}};
+            var i int = 7;
+            a[f(1)] += 5;
+            a[f(1)] *= 3;
+            m[f(1)][f(2)] += 2;
+            m[1][2] /= 4;
+            p.q.r *= 5;
+            i += 100; i -= 1; i %= 10;
+            putInt(a[1]); putFloat(m[1][2]); putInt(p.q.r); putInt(i); putInt(calls);
+        };"""
+        expect = "150.51564"
+        self.assertTrue(TestCodeGen.test(input,expect,515))
+    def test_induction_strength_reduction(self):
+        input = """func main() {
+            var a [24]int;
+            var j int = 2;
+            for i := 0; i < 5; i += 1 {
+                a[i*4+j] := i;
+                a[3*i + j*2 - 1] += 10;
+                if (i == 3) {continue;};
+            };
+            var s int = 0;
+            for r := 0; r < 4; r += 1 {
+                for var c int = 0; c < 6; c := c + 1 {s += a[r*6 + c] * (r + 1);};
+            };
+            putInt(s);
+        };"""
+        expect = "141"
+        self.assertTrue(TestCodeGen.test(input,expect,516))
+    def test_loop_invariant_motion(self):
+        input = """type Mat struct {rows int; cols int;}
+        var limit int = 3;
+        var hits int = 0;
+        func bump() int {hits += 1; return hits;};
+        func main() {
+            var m Mat = Mat{rows: 2, cols: 3};
+            var g [2][3]int;
+            for q := 0; q < 6; q += 1 {g[q / 3][q % 3] := q + 1;};
+            var total int = 0;
+            var i int = 0;
+            for i < m.rows * m.cols {total += i; i += 1;};
+            for r := 0; r < 2; r += 1 {
+                for c := 0; c < limit; c += 1 {total += g[r][c] * (m.cols + 1);};
+            };
+            var k int = 5;
+            var e [2]int;
+            for k < 5 {e[0] := g[1][k];};
+            for j := 0; j < 3; j += 1 {
+                if (j == 1) {m.cols := 10;};
+                total += m.cols;
+            };
+            for j := 0; j < 2; j += 1 {g[j][0] := g[0][2] + bump();};
+            putInt(total); putInt(g[1][0]);
+        };"""
+        expect = "1225"
+        self.assertTrue(TestCodeGen.test(input,expect,517))
+    def test_inline_small_functions(self):
+        input = """var g int = 3;
+        func abs(x int) int {
+            if (x < 0) {return -x;};
+            return x;
+        };
+        func idx(r int, c int) int {return r * g + c;};
+        func half(x float) float {return x / 2;};
+        func show(s string) {putString(s); return;};
+        func fact(n int) int {
+            if (n <= 1) {return 1;};
+            return n * fact(n - 1);
+        };
+        func main() {
+            var total = 0;
+            for i := -3; i < 3; i += 1 {total += abs(i) + idx(i, 1);};
+            putInt(total); putFloat(half(3)); show("x"); abs(5);
+            putInt(fact(5));
+        };"""
+        expect = "61.5x120"
+        self.assertTrue(TestCodeGen.test(input,expect,518))
+    def test_self_tail_calls(self):
+        input = """type Node struct {val int; next Node;}
+        func (n Node) sum(acc int) int {
+            if (n.next == nil) {return acc + n.val;};
+            return n.next.sum(acc + n.val);
+        };
+        func gcd(a int, b int) int {
+            if (b == 0) {return a;};
+            return gcd(b, a % b);
+        };
+        func count(n int, acc float) float {
+            if (n == 0) {return acc;};
+            return count(n - 1, acc + 1);
+        };
+        func main() {
+            putInt(gcd(1071, 462));
+            putFloat(count(1000000, 0));
+            var a Node = Node{val: 1, next: nil};
+            var b Node = Node{val: 2, next: a};
+            putInt(b.sum(0));
+        };"""
+        expect = "211000000.03"
+        self.assertTrue(TestCodeGen.test(input,expect,519))
+    def test_packed_constant_arrays(self):
+        input = """var big = [20]int{5, 7, 100000, 3, 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 2147483647};
+        func main() {
+            var small = [17]int{10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26};
+            var fs = [16]float{1.5, 0.0, 3.25, 1.0, 2.0, 1.0e10, 0.1, 7.0, 8.0, 9.0, 10.0, 11.0, 12.0, 13.0, 14.0, 15.5};
+            var ss = [16]string{"a", "", "q\\"x\\\\y", "\\n", "e", "f", "g", "h", "i", "j", "k", "l", "m", "n", "o", "end"};
+            var bs = [16]boolean{true, false, true, true, false, false, false, false, false, false, false, false, false, false, false, true};
+            putInt(big[2]); putInt(big[3]); putInt(big[19]); putInt(small[16]);
+            putFloat(fs[0]); putFloat(fs[5]); putFloat(fs[15]);
+            putString(ss[2]); putString(ss[15]); putString(ss[1]);
+            putBool(bs[0]); putBool(bs[1]); putBool(bs[15]);
+        };"""
+        expect = "10000032147483647261.51.0E1015.5q\"x\\yendtruefalsetrue"
+        self.assertTrue(TestCodeGen.test(input,expect,520))
+    def test_nested_array_literals(self):
+        input = """func main() {
+            var m = [2][3]int{{1, 2, 3}, {4, 5, 6}};
+            var c = [2][2][2]float{{{1.0, 2.0}, {3.0, 4}}, {{5.0, 6.0}, {7.0, 8.5}}};
+            var p = [3][2]string{{"a", "b"}};
+            var q = [3][3]int{{1, 2, 3}};
+            var total = 0;
+            for i := 0; i < 2; i += 1 {
+                for j := 0; j < 3; j += 1 {total += m[i][j] * (i + 1);};
+            };
+            putInt(total);
+            putFloat(c[1][1][1] + c[0][1][1]);
+            putString(p[0][1]);
+            q[2][1] := 7;
+            putInt(q[0][2] + q[2][1]);
+        };"""
+        expect = "3612.5b10"
+        self.assertTrue(TestCodeGen.test(input,expect,521))
+    def test_folded_constants(self):
+        input = """const N = 3;
+        const M = N * 4 - 1;
+        const Q = -7 / 2;
+        const R = -7 % 2;
+        const BIG = 2147483647 + 1;
+        const PI = 3.14159;
+        const AREA = PI * 2.0 * 2;
+        const NAME = "mini" + "go";
+        const FLAG = M > 10 && !false;
+        var table = [N][2]int{{1, 2}};
+        func main() {
+            const LOCAL = M * 2;
+            putInt(N); putInt(M); putInt(Q); putInt(R); putInt(BIG);
+            putFloat(AREA); putString(NAME); putBool(FLAG); putInt(LOCAL);
+            var s = 0;
+            for i := 0; i < N; i += 1 {s += LOCAL;};
+            putInt(s); putInt(table[0][1] + table[2][1]);
+        };"""
+        expect = "311-3-1-214748364812.56636minigotrue22662"
+        self.assertTrue(TestCodeGen.test(input,expect,522))
+    def test_interface_devirtualization(self):
+        input = """type Shape interface {area() int; scale(k int, f float) float;}
+        type Named interface {name() string;}
+        type Sq struct {s int;}
+        type Dog struct {n string;}
+        type Cat struct {n string;}
+        func (q Sq) area() int {return q.s * q.s;};
+        func (q Sq) scale(k int, f float) float {return f * k;};
+        func (d Dog) name() string {return "dog " + d.n;};
+        func (c Cat) name() string {return "cat " + c.n;};
+        func main() {
+            var x Shape = Sq{s: 3};
+            putInt(x.area());
+            putFloat(x.scale(2, 1.5));
+            var a Named = Dog{n: "rex"};
+            putString(a.name());
+            a := Cat{n: "tom"};
+            putString(a.name());
+        };"""
+        expect = "93.0dog rexcat tom"
+        self.assertTrue(TestCodeGen.test(input,expect,523))
+
+    def test_struct_literal_constructor(self):
+        input = """type P struct {x int; y float; name string; tags [2]int; next P;}
+        var cnt int = 0;
+        func tick(v int) int {cnt := cnt * 10 + v; return v;};
+        func main() {
+            var a P = P{y: 2, x: 5};
+            putFloat(a.y); putInt(a.x); putString(a.name); putInt(a.tags[1]);
+            if (a.next == nil) {putString("n");};
+            var b P = P{y: tick(1), x: tick(2), next: a};
+            putInt(cnt); putFloat(b.y); putInt(b.next.x);
+        };"""
+        expect = "2.050n121.05"
+        self.assertTrue(TestCodeGen.test(input,expect,524))
+
+    def test_scalar_replaced_structs(self):
+        input = """type Point struct {x int; y float; tag string; next Point;}
+        func dist(a int, b int) float {
+            var p Point = Point{x: a, y: b};
+            p.x += 3;
+            p.y := p.y * 2;
+            return p.x + p.y;
+        };
+        func keep(a int) Point {
+            var q Point = Point{x: a};
+            return q;
+        };
+        func main() {
+            var total float = 0.0;
+            for i := 0; i < 4; i += 1 {
+                r := Point{y: 1.5, x: i};
+                total += r.x * r.y;
+                if (r.next == nil) {total += 1;};
+            };
+            putFloat(total);
+            putFloat(dist(1, 2));
+            putInt(keep(7).x);
+        };"""
+        expect = "13.08.07"
+        self.assertTrue(TestCodeGen.test(input,expect,525))
+
+    def test_value_numbered_loads(self):
+        input = """type V struct {x float; y float;}
+        var a [3]V;
+        var grid [2][3]int;
+        func bump() int {a[0].x := a[0].x + 100; return 1;};
+        func main() {
+            a[0] := V{x: 1.0, y: 2.0};
+            a[1] := V{x: 3.0, y: 4.0};
+            a[2] := V{x: 5.0, y: 6.0};
+            var i int = 1;
+            var n float = a[i].x * a[i].x + a[i].y * a[i].y;
+            putFloat(n);
+            a[i].x := a[i].x + 1;
+            putFloat(a[i].x * a[i].x);
+            var s float = a[0].x + bump() + a[0].x;
+            putFloat(s);
+            grid[1][2] := 7;
+            var g int = grid[1][2] * grid[1][2];
+            i := 2;
+            if (i > 5 && a[i].x > 0.0) {putString("no");};
+            var t float = a[i].y + a[i].y;
+            putInt(g); putFloat(t);
+        };"""
+        expect = "25.016.0103.04912.0"
+        self.assertTrue(TestCodeGen.test(input,expect,526))
+
+    def test_control_flow_cleanup(self):
+        input = """func sign(x int) int {
+            if (x > 0) {return 1;} else {if (x < 0) {return -1;};};
+            return 0;
+        };
+        func find(limit int) int {
+            var total int = 0;
+            for i := 0; i < limit; i += 1 {
+                if (i == 7) {break; putInt(99);};
+                if (i % 2 == 0) {continue;};
+                total += i;
+            };
+            var k int = 0;
+            for k < 3 {k += 1;};
+            return total + k;
+        };
+        func main() {
+            putInt(sign(5)); putInt(sign(-3)); putInt(sign(0));
+            putInt(find(100));
+            return;
+            var z int = 5;
+            putInt(z);
+        };"""
+        expect = "1-1012"
+        self.assertTrue(TestCodeGen.test(input,expect,527))
+
+    def test_dead_stores_and_copies(self):
+        input = """var g int = 0;
+        func sum(a [4]int) int {
+            var total int = 0;
+            var v int;
+            var i int;
+            for i, v := range a {total += v;};
+            var count int = 0;
+            var w int;
+            for i, w := range a {count += 1;};
+            return total * 10 + count;
+        };
+        func copies(x int) int {
+            var y int = x;
+            var z int = y;
+            var unused int = x * 3;
+            unused := 5;
+            g := z + 1;
+            return z + y;
+        };
+        func main() {
+            var a [4]int = [4]int{1, 2, 3, 4};
+            putInt(sum(a));
+            putInt(copies(6));
+            putInt(g);
+        };"""
+        expect = "104127"
+        self.assertTrue(TestCodeGen.test(input,expect,528))
+
+    def test_unrolled_loops(self):
+        input = """var g [8]int;
+        func main() {
+            var a [4]int = [4]int{1, 2, 3, 4};
+            var b [4]int = [4]int{10, 20, 30, 40};
+            var c [4]int;
+            for i := 0; i < 4; i += 1 {
+                c[i] := a[i] + b[i];
+            };
+            putInt(c[0] + c[3]);
+            var k int = 100;
+            for k := 9; k >= 0; k -= 3 {
+                putInt(k);
+            };
+            putInt(k);
+            for i := 0; i < 37; i += 1 {
+                g[i % 8] := g[i % 8] + i * i;
+                if (i > 34) {
+                    putString("!");
+                };
+            };
+            putInt(g[0] + g[5]);
+            var n int = 0;
+            for j := 0; j != 5; j += 1 {
+                for t := 0; t < 3; t += 1 {
+                    if (t == 1) {continue;};
+                    n += j * t;
+                };
+            };
+            putInt(n);
+        };"""
+        expect = "559630-3!!339620"
+        self.assertTrue(TestCodeGen.test(input,expect,529))
+
+    def test_switch_lowering(self):
+        input = """func step(state int) int {
+            if (state == 0) {
+                return 3;
+            } else if (state == 1) {
+                return 0;
+            } else if (state == 3) {
+                return 4;
+            } else if (state == 4) {
+                return 1;
+            };
+            return -1;
+        };
+        func sparse(x int) string {
+            var r string = "?";
+            if (x == 1000) {
+                r := "k";
+            } else if (-5 == x) {
+                r := "m";
+            } else if (x == 70) {
+                r := "s";
+            } else if (x == 1000) {
+                r := "never";
+            } else if (x > 5000) {
+                r := "big";
+            };
+            return r;
+        };
+        func main() {
+            var s int = 0;
+            var n int = 7;
+            for n > 0 {
+                s := step(s);
+                putInt(s);
+                n -= 1;
+            };
+            putInt(step(2));
+            putString(sparse(1000) + sparse(-5) + sparse(70) + sparse(9999) + sparse(2));
+        };"""
+        expect = "3410341-1kmsbig?"
+        self.assertTrue(TestCodeGen.test(input,expect,530))
+
+    def test_promoted_globals(self):
+        input = """var total int = 0;
+        var count int;
+        var seen int = 0;
+        var names string = "";
+        func bump() {
+            seen += 1;
+        };
+        func find(limit int) int {
+            for i := 0; i < 100; i += 1 {
+                total += i;
+                if (total > limit) {
+                    return i;
+                };
+            };
+            return -1;
+        };
+        func main() {
+            var n int = 0;
+            for n < 10 {
+                total += n;
+                count := count + 1;
+                names += "a";
+                n += 1;
+            };
+            putInt(total);
+            putInt(count);
+            for j := 0; j < 3; j += 1 {
+                bump();
+                seen := seen * 2;
+            };
+            putInt(seen);
+            putInt(find(200));
+            putInt(total);
+            putString(names);
+        };"""
+        expect = "45101418216aaaaaaaaaa"
+        self.assertTrue(TestCodeGen.test(input,expect,531))
+
+    def test_split_oversized_methods(self):
+        input = "".join(f"var g{n} int = {n} * 2 + 1;\n" for n in range(700)) \
+            + "func main() {\nvar s int = 0;\n" \
+            + "".join(f"s := (s * 7 + g{n}) % 1000;\n" for n in range(460)) \
+            + "putInt(s + g699);\n};"
+        expect = "1579"
+        self.assertTrue(TestCodeGen.test(input,expect,532))
+
+    def test_split_program_classes(self):
+        input = "".join(f"var g{n} int = {n};\nfunc f{n}(x int) int {{ return x + g{n}; }};\n" for n in range(700)) \
+            + "func h(n int) int {\nif (n == 0) {return 0;};\nreturn g3 + h(n - 1);\n};\n" \
+            + "func main() {\nvar s int = h(10);\n" \
+            + "".join(f"s := f{n * 7 % 700}(s);\n" for n in range(50)) \
+            + "putInt(s);\n};"
+        expect = "8605"
+        self.assertTrue(TestCodeGen.test(input,expect,533))
+
+    def test_lazy_global_holders(self):
+        input = """type P struct { x int; };
+func (p P) twice() int { return p.x * 2; };
+func sq(n int) int { return n * n; };
+func tri(n int) int { if (n <= 0) {return 0;}; return n + tri(n - 1); };
+func share(n int) int { return 100 / n; };
+func tag() string { putString("<"); return "t"; };
+var grid [100][100]int;
+var base int = sq(10);
+var doubled int = P{x: 21}.twice();
+var reset int = sq(3);
+var total int = tri(4);
+var part int = share(5);
+var label string = tag();
+var small = [3]int{4, 5, 6};
+func main() {
+    var i int;
+    reset := 1;
+    for i := 0; i < 100; i += 1 { grid[i][99 - i] := i + base; };
+    putInt(grid[30][69] + grid[99][0] + doubled + reset + small[1]);
+    putInt(total + part);
+    putString(label);
+};"""
+        expect = "<37730t"
+        self.assertTrue(TestCodeGen.test(input,expect,534,lazyThreshold=64))
+
+    def test_returns_in_both_branches(self):
+        input = """func f(x int) int { if (x > 0) { return 1; } else { return 2; }; };
+func main() { putInt(f(3)); putInt(f(-3)); };"""
+        expect = "12"
+        self.assertTrue(TestCodeGen.test(input,expect,535))
+
+    def test_comparison_values(self):
+        input = """func main() {
+            var a string = "x";
+            var b boolean = a == "x";
+            var c boolean = a < "y";
+            var d boolean = 1.5 > 2.0;
+            var e boolean = (a != "x") == (2 < 1);
+            putBool(b); putBool(c); putBool(d); putBool(e);
+        };"""
+        expect = "truetruefalsetrue"
+        self.assertTrue(TestCodeGen.test(input,expect,536))
+
+    def test_packed_constant_elements(self):
+        input = """const K = 7;
+const M = -K * 3;
+const H = 2.5;
+const E = "z";
+func main() {
+    var a = [18]int{1, 2, M, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, K, M};
+    var f = [16]float{H, 2.0, 3.25, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16.5};
+    var s = [16]string{"a\\tb", "c", E, "d", "e", "f", "g", "h", "i", "j", "k", "l", "m", "n", "o", "p"};
+    var t int = 0;
+    var i int;
+    for i := 0; i < 18; i += 1 { t += a[i]; };
+    putInt(t); putFloat(f[0] + f[2] + f[15]);
+    putString(s[0] + s[2] + s[1] + s[15]);
+};"""
+        expect = "9822.25a\tbzcp"
+        self.assertTrue(TestCodeGen.test(input,expect,537))
+
+    def test_negative_float_constants(self):
+        input = """const H = -2.5;
+        const Z = -0.0;
+        func main() {putFloat(H * 2.0); putFloat(1.0 / Z);};"""
+        expect = "-5.0-Infinity"
+        self.assertTrue(TestCodeGen.test(input,expect,538))
+
+    def test_calls_in_literals_clobber_loads(self):
+        input = """type P struct { w int; v int; };
+var a [3]int;
+func bump() int { a[0] += 100; return 1; };
+func main() {
+    a[0] := 5;
+    var x int = a[0];
+    var p P = P{w: 2, v: bump()};
+    var z int = a[0];
+    var q = [2]P{P{w: 4, v: bump()}, P{w: 1, v: 0}};
+    var y int = a[0];
+    putInt(x); putInt(p.w); putInt(p.v); putInt(z); putInt(q[0].w); putInt(y);
+};"""
+        expect = "5211054205"
+        self.assertTrue(TestCodeGen.test(input,expect,539))
+
+    def test_lazy_globals_keep_traps_eager(self):
+        input = """func f() int {var z int = 0; return 10 / z;};
+        var g int = f();
+        func main() {putInt(1); putInt(g);};"""
+        expect = ""
+        self.assertTrue(TestCodeGen.test(input,expect,540,lazyThreshold=64))
+
+    def test_split_by_code_length(self):
+        input = """func f(a int, b int) int {return a * 3 + b % 7 - (a + b) / 5 + (a - b) * (a + 2) - b / 3;};
+        func g(a int, b int) int {return f(a, b) + f(b, a) - f(a + 1, b) + f(a, b + 2) - f(b, b) + f(a, a);};
+        func main() {
+            var s int = 0;
+            """ + "s := s + g(s % 1000, s);\n" * 360 + """
+            putInt(s);
+        };"""
+        expect = "-803593696"
+        self.assertTrue(TestCodeGen.test(input,expect,541))
+
+    def test_methods_split_by_code_length(self):
+        input = """func f(a int, b int) int {return a * 3 + b % 7 - (a + b) / 5 + (a - b) * (a + 2) - b / 3;};
+        func g(a int, b int) int {return f(a, b) + f(b, a) - f(a + 1, b) + f(a, b + 2) - f(b, b) + f(a, a);};
+        type P struct {x int;};
+        func (p P) run() int {
+            var s int = p.x;
+            """ + "s := s + g(s % 1000, p.x);\n" * 360 + """
+            return s;
+        };
+        func main() {var p P = P{x: 7}; putInt(p.run());};"""
+        expect = "99623577"
+        self.assertTrue(TestCodeGen.test(input,expect,542))
+
+    def test_split_classes_keep_traps_at_startup(self):
+        input = "".join(f"func h{i}(a int) int {{return a + {i};}};\n" for i in range(200)) + """
+        var z int = 10 / 0;
+        func main() {putString("before"); putInt(h3(1));};"""
+        expect = ""
+        self.assertTrue(TestCodeGen.test(input,expect,543,classThreshold=200))
@@ -153,7 +153,7 @@ class TestChecker:
 
 class TestCodeGen():
     @staticmethod
-    def test(input, expect, num):
+    def test(input, expect, num, **options):
         if type(input) is str:
             inputfile = TestUtil.makeSource(input,num)
             lexer = Lexer(inputfile)
@@ -165,15 +165,15 @@ class TestCodeGen():
             inputfile = TestUtil.makeSource(str(input),num)
             asttree = input
         
-        TestCodeGen.check(SOL_DIR,asttree,num)
+        TestCodeGen.check(SOL_DIR,asttree,num,**options)
         
         dest = open(os.path.join(SOL_DIR, str(num) + ".txt"),"r")
         line = dest.read()
         return line == expect
 
     @staticmethod
-    def check(soldir,asttree,num):
-        codeGen = CodeGenerator()
+    def check(soldir,asttree,num,**options):
+        codeGen = CodeGenerator(**options)
         path = os.path.join(soldir, str(num))
         if not os.path.isdir(path):
             os.mkdir(path)